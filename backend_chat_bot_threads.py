@@ -2,40 +2,53 @@ from langgraph.graph import StateGraph
 from langgraph.constants import START, END
 from langgraph.graph.message import add_messages
 from typing import TypedDict,Annotated
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage,BaseMessage
 from langgraph.checkpoint.memory import MemorySaver
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEndpoint,ChatHuggingFace
+from context_window import make_compaction_node,prompt_messages
+from instrumentation import instrument
+from llm_gateway import make_gateway
+from lazy import once
+from checkpoint_store import PooledCatalogSaver
+import os
 
 load_dotenv()
 
 class chat_bot(TypedDict):
     messages:Annotated[list[BaseMessage],add_messages]
+    # Running summary of the oldest messages and how many messages it covers
+    summary:str
+    summarized:int
 
-llm = HuggingFaceEndpoint(
-    repo_id="meta-llama/Meta-Llama-3-8B-Instruct",
-    task="text-generation",
-    max_new_tokens=1000,
-    temperature=0.5
-)
+# Llama-3-8B on HuggingFace, falling back to Gemini, through the LLM gateway (created on first use)
+@once
+def get_chat_model():
+    return make_gateway(['huggingface', 'gemini'])
 
-chat_model = ChatHuggingFace(llm=llm)
+def __getattr__(name):
+    # chat_model used to be built at import time
+    if name == 'chat_model':
+        return get_chat_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def chat(state:chat_bot)->chat_bot:
-    message = state['messages']
-    response = chat_model.invoke(message)
+    message = prompt_messages(state)
+    response = get_chat_model().invoke(message)
     return {'messages':[response]}
 
-check_point = MemorySaver()
+# In memory unless THREADS_DB names a SQLite file (chat_service.py sets one, so its workers share threads)
+THREADS_DB = os.getenv('THREADS_DB')
+check_point = PooledCatalogSaver(THREADS_DB) if THREADS_DB else MemorySaver()
 graph = StateGraph(chat_bot)
 
 # Add node to the graph
+graph.add_node('compact',make_compaction_node(get_chat_model))
 graph.add_node('chat',chat)
 
 # Connecting the edges of the graph
-graph.add_edge(START,'chat')
+graph.add_edge(START,'compact')
+graph.add_edge('compact','chat')
 graph.add_edge('chat',END)
 
-# Compile the graph
-workflow = graph.compile(checkpointer=check_point)
\ No newline at end of file
+# Compile the graph (with per-node timings and token counts when GRAPH_METRICS=1)
+workflow = instrument(graph.compile(checkpointer=check_point),'threads')
\ No newline at end of file
@@ -2,76 +2,152 @@ from langgraph.graph import StateGraph
 from langgraph.constants import START, END
 from langgraph.graph.message import add_messages
 from typing import TypedDict, Annotated
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import tools_condition, ToolNode
-from langchain_community.tools import DuckDuckGoSearchResults
-from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, BaseMessage
-from langgraph.checkpoint.sqlite import SqliteSaver
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-import sqlite3
-import requests
+from langchain_core.tools import tool, StructuredTool
+from langchain_core.runnables import RunnableLambda
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+import threading
 import json
 from typing import Optional
 import tempfile
 import os
 from dotenv import load_dotenv
-
-# Global Variable
-RETRIEVER_STORE = {}
+from checkpoint_store import PooledCatalogSaver
+from message_utils import message_text
+from index_cache import cache_key, load_index, load_summary, save_index, CachedEmbeddings
+from vector_store import SharedVectorStore
+from hybrid_search import Reranker, RERANK_MODEL
+from http_client import get_json, aget_json, http_metrics
+from tool_cache import ToolCache, normalize_symbol, normalize_city
+from context_window import make_compaction_node, prompt_messages
+from checkpoint_compaction import start_background_compaction
+from ingestion_pipeline import EMBEDDING_MODEL, SPLITTER_CONFIG, ingest_pdf
+from ingestion_jobs import IngestionJobs
+from document_catalog import DocumentCatalog
+from semantic_cache import SemanticCache, needs_live_data
+from lazy import once, LazyEmbeddings
+from instrumentation import instrument, observe_retrieval
+from llm_gateway import make_gateway, gateway_stats
+import asyncio
+import time
 
 # Loading the dotenv files
 load_dotenv()
 
-# Chat model
-chat_model = ChatGoogleGenerativeAI(
-    model='gemini-2.5-flash'
-)
+# SQLite file shared by every backend process: checkpoints, thread catalog, search index,
+# document attachments and ingestion jobs
+CHAT_DB = os.getenv('CHAT_DB', 'chat_history.db')
 
-# Chat embeddings for rag
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Everything expensive (model clients, the embedding model, the search tool, SQLite, the
+# compiled graph) is created on first use, so importing this module stays cheap.
+# The old module attributes (workflow, chat_model, check_point, ...) still work, see __getattr__.
+
+# Chat model: Gemini, falling back to the HuggingFace model, through the LLM gateway
+# (concurrency limits, per-provider rate limits and hedging, see llm_gateway.py)
+@once
+def get_chat_model():
+    return make_gateway(['gemini', 'huggingface'])
+
+def load_embeddings():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL
+    )
+
+# Chat embeddings for rag, the model loads on the first ingestion or retrieval
+embeddings = LazyEmbeddings(load_embeddings)
+
+# Chunks are only embedded the first time their text is seen
+chunk_embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL)
+
+# Global Variable: one deduplicated index for all threads, searched per thread
+# (BM25 + vectors, reranked by a local cross-encoder when RERANK_MODEL is set)
+VECTOR_STORE = SharedVectorStore(embeddings, reranker=Reranker() if RERANK_MODEL else None)
+
+# Which documents each thread has, so any backend process can load them from the index cache
+@once
+def get_document_catalog():
+    return DocumentCatalog(CHAT_DB)
+
+def document_key(file_bytes: bytes) -> str:
+    return cache_key(file_bytes, {"splitter": SPLITTER_CONFIG, "embedding_model": EMBEDDING_MODEL})
+
+def load_document(key: str, thread_id: str, filename: Optional[str] = None) -> Optional[dict]:
+    """Attach a document from the index cache to the thread in this process's index"""
+    summary = load_summary(key)
+    if summary is None:
+        return None
+    try:
+        # Already in the shared index for another thread, nothing to load
+        VECTOR_STORE.add_document(thread_id, key, filename=filename)
+    except ValueError:
+        cached = load_index(key, embeddings)
+        if not cached:
+            return None
+        VECTOR_STORE.add_document(thread_id, key, cached[0], filename=filename)
+    return {"filename": filename, **summary, "key": key, "cached": True}
+
+def ingest_from_cache(key: str, thread_id: str, filename: Optional[str] = None) -> Optional[dict]:
+    """Same document with the same settings was indexed before (any thread, any process)"""
+    if load_summary(key) is None:
+        return None
+    # Catalog first, so a concurrent sync_thread_documents() doesn't drop the new document
+    get_document_catalog().attach(thread_id, key, filename)
+    result = load_document(key, thread_id, filename)
+    if result is None:
+        get_document_catalog().detach(thread_id, key)
+    return result
 
-def ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> dict:
+def sync_thread_documents(thread_id: str) -> None:
+    """Bring this process's index in line with the catalog (documents added or removed by other workers)"""
+    try:
+        attached = get_document_catalog().documents(thread_id)
+    except Exception as e:
+        print(f"Error reading documents of thread {thread_id}: {e}")
+        return
+    loaded = {document['key'] for document in VECTOR_STORE.thread_documents(thread_id)}
+    for key in loaded - attached.keys():
+        VECTOR_STORE.remove_document(thread_id, key)
+    for key in attached.keys() - loaded:
+        if load_document(key, thread_id, attached[key]) is None:
+            print(f"Error loading document {key} of thread {thread_id}: not in the index cache")
+
+def ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None, progress=None) -> dict:
     """
     Build a FAISS retriever for the uploaded PDF and store it for the thread.
+    `progress(pages, chunks)` is called as embedded batches land in the index.
     Returns a summary dict that can be surfaced in the UI.
     """
     if not file_bytes:
         return {"error": "No file bytes received"}
+
+    key = document_key(file_bytes)
+    cached = ingest_from_cache(key, thread_id, filename)
+    if cached:
+        return cached
     
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
         tmp.write(file_bytes)
         temp_path = tmp.name  # Fixed: was 'tep.name'
     
     try:
-        loader = PyPDFLoader(temp_path)
-        docs = loader.load()
+        vectorstores, pages, chunks = ingest_pdf(temp_path, chunk_embeddings, progress=progress)
+        if vectorstores is None:
+            return {"error": "No text could be extracted from the PDF"}
 
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        result = splitter.split_documents(docs)
-
-        vectorstores = FAISS.from_documents(result, embeddings)
-        retriever = vectorstores.as_retriever(
-            search_type='similarity',
-            search_kwargs={'k': 3}
-        )
+        summary = {
+            "documents": pages,
+            "chunks": chunks
+        }
+        try:
+            save_index(key, vectorstores, summary)
+        except Exception as e:
+            print(f"Error caching index for {filename}: {e}")
 
-        RETRIEVER_STORE[thread_id] = retriever
+        get_document_catalog().attach(thread_id, key, filename)
+        VECTOR_STORE.add_document(thread_id, key, vectorstores, filename=filename)
 
-        return {
-            "filename": filename,
-            "documents": len(docs),
-            "chunks": len(result)
-        }
+        return {"filename": filename, **summary, "key": key}
     except Exception as e:
         return {"error": f"Error processing PDF: {str(e)}"}
     finally:
@@ -80,8 +156,42 @@ def ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None)
         except OSError:
             pass
 
-# Tool no - 1 (which is inbuilt tool via langchain_community)
-search_tool = DuckDuckGoSearchResults(region="us-en")
+def register_ingested_index(thread_id: str, key: str, filename: Optional[str] = None) -> None:
+    """Called when a background job has written its index to the cache"""
+    if not ingest_from_cache(key, thread_id, filename):
+        raise ValueError("Indexed document missing from the index cache")
+
+# Background indexing, so uploads don't block the Streamlit script run
+INGESTION_JOBS = IngestionJobs(register=register_ingested_index, db_path=CHAT_DB)
+
+def submit_ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> dict:
+    """
+    Queue a PDF for background indexing.
+    Returns {"job_id": ...}, or the finished summary right away when the document is already cached.
+    """
+    if not file_bytes:
+        return {"error": "No file bytes received"}
+    key = document_key(file_bytes)
+    cached = ingest_from_cache(key, thread_id, filename)
+    if cached:
+        return cached
+    return {"job_id": INGESTION_JOBS.submit(file_bytes, thread_id, key, filename=filename)}
+
+def get_ingestion_job(job_id: str) -> Optional[dict]:
+    return INGESTION_JOBS.status(job_id)
+
+def cancel_ingestion(job_id: str) -> bool:
+    return INGESTION_JOBS.cancel(job_id)
+
+def get_thread_documents(thread_id: str) -> list:
+    """Documents attached to a thread: [{'key', 'filename', 'chunks'}]"""
+    sync_thread_documents(thread_id)
+    return VECTOR_STORE.thread_documents(thread_id)
+
+def remove_document(thread_id: str, key: str) -> None:
+    """Detach a document from a thread; chunks no other document uses are dropped from the index"""
+    get_document_catalog().detach(thread_id, key)
+    VECTOR_STORE.remove_document(thread_id, key)
 
 # Tool no - 2 (which is custom tool)
 @tool
@@ -113,35 +223,81 @@ def calculator(first_number: float, second_number: float, operation: str) -> dic
     except Exception as e:
         return {"error": str(e)}
 
+# Upstream endpoints (overridable, e.g. to point the tools at a local stub server)
+ALPHAVANTAGE_URL = os.getenv('ALPHAVANTAGE_URL', 'https://www.alphavantage.co')
+WEATHERAPI_URL = os.getenv('WEATHERAPI_URL', 'http://api.weatherapi.com')
+
+# Shared response caches: quotes go stale fast, weather slower.
+# Rate-limit notices come back as 200s without data, so only real payloads are cached.
+STOCK_CACHE = ToolCache(
+    'get_stock_price',
+    ttl=float(os.getenv('STOCK_CACHE_TTL', 60)),
+    cacheable=lambda value: bool(value.get('Global Quote'))
+)
+WEATHER_CACHE = ToolCache(
+    'get_weather',
+    ttl=float(os.getenv('WEATHER_CACHE_TTL', 600)),
+    cacheable=lambda value: 'current' in value
+)
+
+def get_tool_cache_stats() -> list:
+    return [STOCK_CACHE.stats(), WEATHER_CACHE.stats()]
+
 # Tool no - 3 (which is custom tool)
-@tool
-def get_stock_price(symbol: str) -> dict:
+def stock_price_url(symbol: str) -> str:
+    return f"{ALPHAVANTAGE_URL}/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey=C9PE94QUEW9VWGFM"
+
+def fetch_stock_price(symbol: str) -> dict:
     """
     Fetch latest stock price for a given symbol (e.g. 'AAPL', 'TSLA') 
     using Alpha Vantage with API key in the URL. 
     """
     try:
-        url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey=C9PE94QUEW9VWGFM"
-        r = requests.get(url)
-        r.raise_for_status()
-        return r.json()
+        symbol = normalize_symbol(symbol)
+        return STOCK_CACHE.get_or_fetch(symbol, lambda: get_json(stock_price_url(symbol), tool='get_stock_price'))
     except Exception as e:
         return {"error": str(e)}
 
+async def afetch_stock_price(symbol: str) -> dict:
+    try:
+        symbol = normalize_symbol(symbol)
+        return await STOCK_CACHE.aget_or_fetch(symbol, lambda: aget_json(stock_price_url(symbol), tool='get_stock_price'))
+    except Exception as e:
+        return {"error": str(e)}
+
+get_stock_price = StructuredTool.from_function(
+    func=fetch_stock_price,
+    coroutine=afetch_stock_price,
+    name='get_stock_price'
+)
+
 # Tool no - 4 (which is custom tool)
-@tool
-def get_weather(city: str) -> dict:
+def weather_url(city: str) -> str:
+    return f"{WEATHERAPI_URL}/v1/current.json?key=dfa803f3a2dc482ebfc81935261001&q={city}"
+
+def fetch_weather(city: str) -> dict:
     """
     Fetch weather from the API using WeatherAPI
     """
     try:
-        url = f"http://api.weatherapi.com/v1/current.json?key=dfa803f3a2dc482ebfc81935261001&q={city}"
-        r = requests.get(url)
-        r.raise_for_status()
-        return r.json()
+        city = normalize_city(city)
+        return WEATHER_CACHE.get_or_fetch(city, lambda: get_json(weather_url(city), tool='get_weather'))
+    except Exception as e:
+        return {"error": str(e)}
+
+async def afetch_weather(city: str) -> dict:
+    try:
+        city = normalize_city(city)
+        return await WEATHER_CACHE.aget_or_fetch(city, lambda: aget_json(weather_url(city), tool='get_weather'))
     except Exception as e:
         return {"error": str(e)}
 
+get_weather = StructuredTool.from_function(
+    func=fetch_weather,
+    coroutine=afetch_weather,
+    name='get_weather'
+)
+
 # Tool - 5 Which is very important and it is RAG 
 @tool
 def rag_implementation(query: str, thread_id: str) -> dict:
@@ -150,13 +306,14 @@ def rag_implementation(query: str, thread_id: str) -> dict:
     Use this tool to fetch the relevant document from the PDF or anything uploaded 
     that might be solved using the uploaded PDF and in order to give more intellectual answers.
     """
-    retriever = RETRIEVER_STORE.get(thread_id)
-
-    if not retriever:
+    sync_thread_documents(thread_id)
+    if thread_id not in VECTOR_STORE:
         return {'error': 'No PDF uploaded here'}
     
     try:
-        result = retriever.invoke(query)  # Fixed: was 'response'
+        started = time.perf_counter()
+        result = VECTOR_STORE.search(thread_id, query)
+        observe_retrieval(thread_id, time.perf_counter() - started, len(result))
 
         context = [doc.page_content for doc in result]
         meta_data = [doc.metadata for doc in result]  # Fixed: was 'metadata.page_content'
@@ -169,83 +326,260 @@ def rag_implementation(query: str, thread_id: str) -> dict:
     except Exception as e:
         return {"error": f"RAG error: {str(e)}"}
 
-tools_llm = [search_tool, calculator, get_stock_price, get_weather, rag_implementation]
-llm_with_tools = chat_model.bind_tools(tools_llm)
+@once
+def get_tools() -> list:
+    # Tool no - 1 (which is inbuilt tool via langchain_community)
+    from langchain_community.tools import DuckDuckGoSearchResults
+    search_tool = DuckDuckGoSearchResults(region="us-en")
+    return [search_tool, calculator, get_stock_price, get_weather, rag_implementation]
+
+@once
+def get_llm_with_tools():
+    return get_chat_model().bind_tools(get_tools())
 
 class chat_bot(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    # Running summary of the oldest messages and how many messages it covers
+    summary: str
+    summarized: int
+
+# Answers to standalone questions, shared by every thread (SEMANTIC_CACHE=0 turns it off)
+SEMANTIC_CACHE = SemanticCache(embeddings) if os.getenv('SEMANTIC_CACHE', '1') != '0' else None
+
+def get_semantic_cache_stats() -> Optional[dict]:
+    return SEMANTIC_CACHE.stats() if SEMANTIC_CACHE else None
+
+def get_http_stats() -> dict:
+    return http_metrics()
+
+def get_vector_store_stats() -> dict:
+    return VECTOR_STORE.stats()
+
+def get_llm_gateway_stats() -> dict:
+    return gateway_stats()
+
+def cacheable_query(state: chat_bot, config) -> Optional[str]:
+    """
+    The question, if its answer can come from (and go into) the semantic cache: the first
+    message of a thread, with no uploaded document and nothing that needs live data
+    """
+    if SEMANTIC_CACHE is None or len(state['messages']) != 1 or state.get('summary'):
+        return None
+    msg = state['messages'][0]
+    if not isinstance(msg, HumanMessage):
+        return None
+    thread_id = ((config or {}).get('configurable') or {}).get('thread_id')
+    if thread_id is not None:
+        sync_thread_documents(thread_id)
+        if thread_id in VECTOR_STORE:
+            return None
+    query = message_text(msg).strip()
+    if not query or needs_live_data(query):
+        return None
+    if not embeddings.ready:
+        # Nobody waits for the embedding model here; later questions use the cache once it loaded
+        embeddings.preload()
+        return None
+    return query
+
+def cache_answer(query: Optional[str], response, seconds: float) -> None:
+    # Only plain answers; anything that went through a tool is not cached
+    if query is None or response.tool_calls:
+        return
+    SEMANTIC_CACHE.record_miss(seconds)
+    answer = message_text(response)
+    if answer.strip():
+        SEMANTIC_CACHE.store(query, answer)
 
-def chat(state: chat_bot) -> chat_bot:
+def chat(state: chat_bot, config) -> chat_bot:
     """LLM may give the answer or it may use the tool"""
-    message = state['messages']
-    response = llm_with_tools.invoke(message)
+    query = cacheable_query(state, config)
+    try:
+        if query is not None:
+            cached = SEMANTIC_CACHE.lookup(query)
+            if cached is not None:
+                return {'messages': [AIMessage(content=cached)]}
+    except Exception as e:
+        print(f"Error reading semantic cache: {e}")
+
+    message = prompt_messages(state)
+    started = time.perf_counter()
+    response = get_llm_with_tools().invoke(message)
+    try:
+        cache_answer(query, response, time.perf_counter() - started)
+    except Exception as e:
+        print(f"Error writing semantic cache: {e}")
     return {'messages': [response]}
 
-tool_node = ToolNode(tools_llm)
+async def achat(state: chat_bot, config) -> chat_bot:
+    """Async version of chat, used by workflow.ainvoke / workflow.astream"""
+    query = cacheable_query(state, config)
+    try:
+        if query is not None:
+            # Embedding the query is CPU work, keep it off the event loop
+            cached = await asyncio.to_thread(SEMANTIC_CACHE.lookup, query)
+            if cached is not None:
+                return {'messages': [AIMessage(content=cached)]}
+    except Exception as e:
+        print(f"Error reading semantic cache: {e}")
+
+    message = prompt_messages(state)
+    started = time.perf_counter()
+    response = await get_llm_with_tools().ainvoke(message)
+    try:
+        await asyncio.to_thread(cache_answer, query, response, time.perf_counter() - started)
+    except Exception as e:
+        print(f"Error writing semantic cache: {e}")
+    return {'messages': [response]}
 
 # Initializing the database
-conn = sqlite3.connect('chat_history.db', check_same_thread=False)
-check_point = SqliteSaver(conn=conn)
+@once
+def get_checkpointer():
+    # WAL mode, a bounded read pool and group-committed writes, shared by all Streamlit sessions
+    check_point = PooledCatalogSaver(CHAT_DB)
+
+    # Optional background pruning of intermediate checkpoints (seconds between passes)
+    if os.getenv('CHECKPOINT_COMPACTION_INTERVAL'):
+        start_background_compaction(CHAT_DB, interval=float(os.getenv('CHECKPOINT_COMPACTION_INTERVAL')))
+    return check_point
 
-# Initialize the graph
-graph = StateGraph(chat_bot)
+@once
+def get_workflow():
+    # Initialize the graph
+    graph = StateGraph(chat_bot)
 
-# Creating the graph node 
-graph.add_node('chat', chat)
-graph.add_node('tools', tool_node)
+    # Creating the graph node 
+    # Folds old turns into a summary once the history outgrows the token budget
+    graph.add_node('compact', make_compaction_node(get_chat_model))
+    # Sync runs use chat; async runs use achat and ToolNode runs the turn's tool calls concurrently
+    graph.add_node('chat', RunnableLambda(chat, afunc=achat))
+    graph.add_node('tools', ToolNode(get_tools()))
 
-# Connecting the nodes via edges
-graph.add_edge(START, 'chat')
-graph.add_conditional_edges('chat', tools_condition)
-graph.add_edge('tools', 'chat')
+    # Connecting the nodes via edges
+    graph.add_edge(START, 'compact')
+    graph.add_edge('compact', 'chat')
+    graph.add_conditional_edges('chat', tools_condition)
+    graph.add_edge('tools', 'chat')
 
-# Compiling the graph
-workflow = graph.compile(checkpointer=check_point)
+    # Compiling the graph (with per-node timings and token counts when GRAPH_METRICS=1)
+    return instrument(graph.compile(checkpointer=get_checkpointer()), 'database')
 
+# Module attributes that used to be built at import time
+LAZY_ATTRIBUTES = {
+    'chat_model': get_chat_model,
+    'tools_llm': get_tools,
+    'llm_with_tools': get_llm_with_tools,
+    'check_point': get_checkpointer,
+    'workflow': get_workflow
+}
 
-def get_default_threads():
-    """Get all available thread IDs from the database"""
-    all_threads = set()
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up(background: bool = False):
+    """
+    Build everything up front (for production workers, so the first user doesn't wait).
+    With `background` the work runs on a daemon thread and the thread is returned.
+    """
+    def run():
+        try:
+            get_workflow()
+            get_llm_with_tools()
+            embeddings.embed_query("warm up")
+        except Exception as e:
+            print(f"Error warming up backend: {e}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='backend-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+# BACKEND_WARM_UP=1 starts warming up as soon as the module is imported
+if os.getenv('BACKEND_WARM_UP', '0') == '1':
+    warm_up(background=True)
+
+
+def get_default_threads(limit=None, offset=0):
+    """Get thread IDs from the thread catalog, most recently active first"""
+    return [thread['thread_id'] for thread in get_thread_summaries(limit=limit, offset=offset)]
+
+def get_thread_summaries(limit=None, offset=0, search=None):
+    """Get a page of catalog rows (thread_id, timestamps, message count, title), most recent first"""
     try:
-        for checkpoint in check_point.list(None):
-            if 'configurable' in checkpoint.config and 'thread_id' in checkpoint.config['configurable']:
-                all_threads.add(checkpoint.config['configurable']['thread_id'])
+        return get_checkpointer().list_threads(limit=limit, offset=offset, search=search)
     except Exception as e:
         print(f"Error loading threads: {e}")
-    return list(all_threads)
+        return []
+
+def search_chats(query, limit=20):
+    """Full-text search over every thread's messages: [{thread_id, title, updated_at, matches}] best first"""
+    try:
+        return get_checkpointer().search(query, limit=limit)
+    except Exception as e:
+        print(f"Error searching chats: {e}")
+        return []
+
+def display_message(msg):
+    """{'role', 'content'} of a user or assistant message with text, None for anything else"""
+    # Skip tool messages
+    if hasattr(msg, 'type') and msg.type in ['human', 'ai']:
+        content = message_text(msg)
+        if content and str(content).strip():
+            return {
+                'role': 'user' if msg.type == 'human' else 'assistant',
+                'content': str(content)
+            }
+    return None
 
 def get_thread_messages(thread_id):
     """Get all messages for a specific thread"""
     try:
         config = {'configurable': {'thread_id': thread_id}}
-        state = workflow.get_state(config)
+        state = get_workflow().get_state(config)
         
         if state and hasattr(state, 'values') and 'messages' in state.values:
             # Convert BaseMessage objects to dict format
-            messages = []
-            for msg in state.values['messages']:
-                # Skip tool messages
-                if hasattr(msg, 'type') and msg.type in ['human', 'ai']:
-                    role = 'user' if msg.type == 'human' else 'assistant'
-                    # Handle both string and list content
-                    content = msg.content
-                    if isinstance(content, list):
-                        # Extract text from structured content
-                        text_parts = []
-                        for item in content:
-                            if isinstance(item, dict) and item.get('type') == 'text':
-                                text_parts.append(item.get('text', ''))
-                            elif isinstance(item, str):
-                                text_parts.append(item)
-                        content = ''.join(text_parts)
-                    
-                    if content and str(content).strip():
-                        messages.append({
-                            'role': role,
-                            'content': str(content)
-                        })
-            return messages
+            return [shown for shown in map(display_message, state.values['messages']) if shown]
+        return []
+    except Exception as e:
+        print(f"Error loading messages for thread {thread_id}: {e}")
         return []
+
+# Number of most recent messages loaded when a thread is opened
+HISTORY_PAGE_SIZE = 20
+
+def get_thread_messages_page(thread_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """
+    Get up to `limit` messages of a thread from before position `before` in its stored
+    message list (the newest ones when None). Positions only grow as the thread does, so
+    `next_cursor` passed back as `before` pages towards older messages however many of the
+    newer ones the caller shows.
+    """
+    try:
+        checkpointer = get_checkpointer()
+        total = checkpointer.get_messages(thread_id, 0, 0)[1]
+        cursor = total if before is None else min(max(before, 0), total)
+        page = []
+        # Walk back a chunk at a time; tool calls and results in between aren't shown
+        while cursor > 0 and len(page) < limit:
+            chunk, _ = checkpointer.get_messages(thread_id, max(cursor - limit, 0), cursor)
+            if not chunk:
+                break
+            for msg in reversed(chunk):
+                if len(page) == limit:
+                    break
+                cursor -= 1
+                if shown := display_message(msg):
+                    page.append(shown)
+        return {
+            'messages': page[::-1],
+            'has_more': cursor > 0,
+            'next_cursor': cursor
+        }
     except Exception as e:
         print(f"Error loading messages for thread {thread_id}: {e}")
-        return []
\ No newline at end of file
+        return {'messages': [], 'has_more': False, 'next_cursor': 0}
@@ -0,0 +1,136 @@
+"""
+Multi-threaded checkpointer load test.
+
+Simulates N concurrent chat sessions, each running the chat -> tools -> chat loop for a
+number of turns against a fresh SQLite file, and reports p50/p99 latency of checkpoint
+reads and writes for the shared-connection saver and the pooled, group-committing one.
+
+    python benchmarks/bench_checkpointer.py --sessions 1 8 32 --turns 20
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from typing import Annotated, TypedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph, START
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import ToolNode, tools_condition
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.tools import tool
+from checkpoint_store import PooledCatalogSaver, ThreadCatalogSaver
+
+
+@tool
+def get_weather(city: str) -> dict:
+    """Stub weather lookup"""
+    return {"location": city, "current": {"temp_c": 11.0, "condition": "Partly cloudy"}}
+
+
+class chat_bot(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def chat(state: chat_bot) -> chat_bot:
+    """Calls the tool on the first model call of every turn, then answers"""
+    last = state['messages'][-1]
+    if isinstance(last, HumanMessage):
+        call = {'name': 'get_weather', 'args': {'city': 'London'}, 'id': f"call_{len(state['messages'])}"}
+        return {'messages': [AIMessage('', tool_calls=[call])]}
+    return {'messages': [AIMessage("It is partly cloudy and 11°C in London. " * 5)]}
+
+
+def build_workflow(check_point):
+    graph = StateGraph(chat_bot)
+    graph.add_node('chat', chat)
+    graph.add_node('tools', ToolNode([get_weather]))
+    graph.add_edge(START, 'chat')
+    graph.add_conditional_edges('chat', tools_condition)
+    graph.add_edge('tools', 'chat')
+    return graph.compile(checkpointer=check_point)
+
+
+def timed(saver_class):
+    """Subclass of a saver that records the latency of every read and write"""
+    class Timed(saver_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.samples = {'read': [], 'write': []}
+            self.samples_lock = threading.Lock()
+
+        def _timed(self, kind, fn, *args):
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self.samples_lock:
+                    self.samples[kind].append(time.perf_counter() - started)
+
+        def get_tuple(self, config):
+            return self._timed('read', super().get_tuple, config)
+
+        def put(self, *args):
+            return self._timed('write', super().put, *args)
+
+        def put_writes(self, *args):
+            return self._timed('write', super().put_writes, *args)
+
+    return Timed
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000 if ordered else 0.0
+
+
+def run(kind: str, sessions: int, turns: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        if kind == 'single':
+            check_point = timed(ThreadCatalogSaver)(conn=sqlite3.connect(db_path, check_same_thread=False))
+        else:
+            check_point = timed(PooledCatalogSaver)(db_path)
+        workflow = build_workflow(check_point)
+
+        def session(n):
+            config = {'configurable': {'thread_id': f'session-{n}'}}
+            for turn in range(turns):
+                workflow.invoke({'messages': [HumanMessage(f"Weather in London, turn {turn}?")]}, config=config)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            'turns_per_sec': sessions * turns / elapsed,
+            'read_p50': percentile(check_point.samples['read'], 0.50),
+            'read_p99': percentile(check_point.samples['read'], 0.99),
+            'write_p50': percentile(check_point.samples['write'], 0.50),
+            'write_p99': percentile(check_point.samples['write'], 0.99),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--turns', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'saver':>7} {'sessions':>9} {'turns/s':>8} {'read p50':>9} {'read p99':>9} {'write p50':>10} {'write p99':>10}  (ms)")
+    for sessions in args.sessions:
+        for kind in ('single', 'pooled'):
+            r = run(kind, sessions, args.turns)
+            print(f"{kind:>7} {sessions:>9} {r['turns_per_sec']:>8.1f} {r['read_p50']:>9.2f} {r['read_p99']:>9.2f} "
+                  f"{r['write_p50']:>10.2f} {r['write_p99']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
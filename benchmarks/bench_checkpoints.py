@@ -0,0 +1,137 @@
+"""
+Checkpoint storage benchmark: database size and get_state latency against thread length,
+for the plain SqliteSaver format and the packed format (checkpoint_format.py).
+
+Each turn runs a small graph (chat -> tool -> chat) with canned messages of realistic size,
+so a turn writes the same number of checkpoints and writes as the real chatbot. Sizes are
+payload bytes (checkpoints, writes and messages tables) plus the file size after a checkpoint
+of the WAL. Warm reads reuse the messages the saver remembers for the thread; the cold column
+is the first read from a new saver, as in a freshly started process.
+
+    python benchmarks/bench_checkpoints.py
+    python benchmarks/bench_checkpoints.py --turns 10 50 200 --message-chars 1500
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from typing import TypedDict, Annotated
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph
+from langgraph.constants import START, END
+from langgraph.graph.message import add_messages
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from checkpoint_store import PooledCatalogSaver
+
+WORDS = "the pump valve pressure seal weather stock price city forecast answer because however".split()
+
+
+class State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def text(rng: random.Random, chars: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < chars:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)
+
+
+def build_graph(saver, chars: int):
+    rng = random.Random(0)
+
+    def chat(state):
+        if isinstance(state['messages'][-1], HumanMessage):
+            return {'messages': [AIMessage(content='', tool_calls=[{'name': 'lookup', 'args': {'q': 'x'}, 'id': f"call-{rng.random()}"}])]}
+        return {'messages': [AIMessage(content=text(rng, chars))]}
+
+    def tool(state):
+        call = state['messages'][-1].tool_calls[0]
+        return {'messages': [ToolMessage(content=text(rng, chars // 2), tool_call_id=call['id'])]}
+
+    graph = StateGraph(State)
+    graph.add_node('chat', chat)
+    graph.add_node('tool', tool)
+    graph.add_edge(START, 'chat')
+    graph.add_conditional_edges('chat', lambda state: 'tool' if state['messages'][-1].tool_calls else END)
+    graph.add_edge('tool', 'chat')
+    return graph.compile(checkpointer=saver)
+
+
+def payload_bytes(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0]
+        total += conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages'").fetchone():
+            total += conn.execute("SELECT COALESCE(SUM(LENGTH(value) + LENGTH(hash)), 0) FROM messages").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return total
+    finally:
+        conn.close()
+
+
+def run(packed: bool, turns: list, chars: int, reads: int, directory: str) -> list:
+    db_path = os.path.join(directory, f"{'packed' if packed else 'plain'}.db")
+    saver = PooledCatalogSaver(db_path, packed=packed)
+    workflow = build_graph(saver, chars)
+    rng = random.Random(1)
+    config = {'configurable': {'thread_id': 'bench'}}
+    results = []
+    done = 0
+    write_seconds = 0.0
+    for target in sorted(turns):
+        while done < target:
+            started = time.perf_counter()
+            workflow.invoke({'messages': [HumanMessage(content=text(rng, 200))]}, config)
+            write_seconds += time.perf_counter() - started
+            done += 1
+        latencies = []
+        for _ in range(reads):
+            # A fresh saver each time would measure connection setup; the pool is what the app uses
+            started = time.perf_counter()
+            state = workflow.get_state(config)
+            latencies.append(time.perf_counter() - started)
+        # A new process has nothing remembered and decodes every message
+        cold = PooledCatalogSaver(db_path, pool_size=1, packed=packed)
+        started = time.perf_counter()
+        cold.get_tuple(config)
+        cold_seconds = time.perf_counter() - started
+        results.append({
+            'turns': target,
+            'messages': len(state.values['messages']),
+            'payload': payload_bytes(db_path),
+            'file': os.path.getsize(db_path),
+            'p50': statistics.median(latencies) * 1000,
+            'p99': sorted(latencies)[int(0.99 * (len(latencies) - 1))] * 1000,
+            'cold': cold_seconds * 1000,
+            'turn_ms': write_seconds / done * 1000
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--message-chars', type=int, default=1000, help='length of canned assistant answers')
+    parser.add_argument('--reads', type=int, default=50, help='get_state calls timed per point')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'format':<8} {'turns':>6} {'msgs':>6} {'payload KB':>11} {'file KB':>9} "
+              f"{'get_state p50 ms':>17} {'p99 ms':>8} {'cold ms':>8} {'ms/turn':>8}")
+        for packed in (False, True):
+            for row in run(packed, args.turns, args.message_chars, args.reads, directory):
+                print(f"{'packed' if packed else 'plain':<8} {row['turns']:>6} {row['messages']:>6} "
+                      f"{row['payload'] / 1024:>11.1f} {row['file'] / 1024:>9.1f} "
+                      f"{row['p50']:>17.2f} {row['p99']:>8.2f} {row['cold']:>8.2f} {row['turn_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
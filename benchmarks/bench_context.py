@@ -0,0 +1,101 @@
+"""
+Prompt size and latency versus thread length, with and without history compaction.
+
+Replays synthetic tool-heavy threads turn by turn through the compaction node (with a
+canned summarizer) and reports what the chat node would send on the last turn.
+
+    python benchmarks/bench_context.py --turns 10 50 100 200
+    python benchmarks/bench_context.py --turns 10 50 --live   # also time real Gemini calls
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from context_window import HISTORY_TOKEN_BUDGET, estimate_tokens, make_compaction_node, prompt_messages
+
+WEATHER_PAYLOAD = json.dumps({
+    "location": {"name": "London", "region": "City of London", "country": "United Kingdom"},
+    "current": {"temp_c": 11.0, "condition": {"text": "Partly cloudy"}, "wind_kph": 14.4, "humidity": 82,
+                "feelslike_c": 9.1, "uv": 1.0, "gust_kph": 21.2, "pressure_mb": 1012.0},
+} | {f"extra_{i}": "x" * 40 for i in range(40)})
+
+
+def turn(i: int) -> list:
+    if i % 2:
+        return [HumanMessage(f"What did you find about topic {i}? " * 5), AIMessage(f"Here is what I know about {i}. " * 20)]
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(f"What's the weather in city {i}?"),
+        AIMessage('', tool_calls=[{'name': 'get_weather', 'args': {'city': f'city {i}'}, 'id': call_id}]),
+        ToolMessage(WEATHER_PAYLOAD, tool_call_id=call_id),
+        AIMessage(f"It is partly cloudy and 11°C in city {i}."),
+    ]
+
+
+def replay(turns: int, budget: int) -> dict:
+    compact = make_compaction_node(FakeListChatModel(responses=["Summary of earlier turns. " * 40]), budget=budget)
+    state = {'messages': []}
+    for i in range(turns):
+        new = turn(i)
+        state['messages'] = state['messages'] + new[:1]
+        state.update(compact.invoke(state))
+        state['messages'] = state['messages'] + new[1:]
+
+    started = time.perf_counter()
+    prompt = prompt_messages(state, budget)
+    build_ms = (time.perf_counter() - started) * 1000
+    return {
+        'raw_messages': len(state['messages']),
+        'raw_tokens': sum(estimate_tokens(msg) for msg in state['messages']),
+        'prompt_messages': prompt,
+        'prompt_tokens': sum(estimate_tokens(msg) for msg in prompt),
+        'build_ms': build_ms,
+        'raw': state['messages'],
+    }
+
+
+def timed_call(model, messages) -> float:
+    started = time.perf_counter()
+    model.invoke(messages)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 25, 50, 100, 200])
+    parser.add_argument('--budget', type=int, default=HISTORY_TOKEN_BUDGET)
+    parser.add_argument('--live', action='store_true', help='time gemini-2.5-flash on both prompts')
+    args = parser.parse_args()
+
+    model = None
+    if args.live:
+        from dotenv import load_dotenv
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        load_dotenv()
+        model = ChatGoogleGenerativeAI(model='gemini-2.5-flash')
+
+    header = f"{'turns':>6} {'messages':>9} {'raw tokens':>11} {'prompt tokens':>14} {'build ms':>9}"
+    if model:
+        header += f" {'raw s':>7} {'compact s':>10}"
+    print(f"budget {args.budget} tokens")
+    print(header)
+    for turns in args.turns:
+        result = replay(turns, args.budget)
+        line = (f"{turns:>6} {result['raw_messages']:>9} {result['raw_tokens']:>11} "
+                f"{result['prompt_tokens']:>14} {result['build_ms']:>9.2f}")
+        if model:
+            # The raw history ends on the assistant answer; ask a follow-up so both prompts are valid
+            follow_up = [HumanMessage("Summarize our conversation in one sentence.")]
+            line += f" {timed_call(model, result['raw'] + follow_up):>7.2f}"
+            line += f" {timed_call(model, result['prompt_messages'] + follow_up):>10.2f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Import-time benchmark for the backends.
+
+Imports each module in a fresh interpreter several times and reports the median import
+time plus the slowest top-level imports (from python -X importtime). With --max-seconds
+it exits non-zero when a module gets slower than the limit, to catch startup regressions
+such as a model being loaded at import time again.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 10 --max-seconds 2.0
+"""
+import os
+import sys
+import statistics
+import subprocess
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMER = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def import_seconds(module: str) -> float:
+    output = subprocess.run(
+        [sys.executable, '-c', TIMER.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, top: int) -> list:
+    """(cumulative microseconds, name) of the module's direct imports, slowest first"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Direct imports of the module are indented by exactly two spaces (after the column gap)
+        name = name[1:]
+        if name.startswith('   ') or not name.startswith('  '):
+            continue
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=['backend_using_database', 'backend_chat_bot_threads'])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help='slowest direct imports to list')
+    parser.add_argument('--max-seconds', type=float, help='fail when a median import time exceeds this')
+    args = parser.parse_args()
+
+    # Placeholder keys so client constructors don't fail; nothing is called over the network
+    os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+    os.environ.setdefault('HUGGINGFACEHUB_API_TOKEN', 'benchmark')
+
+    failed = False
+    for module in args.modules:
+        times = [import_seconds(module) for _ in range(args.runs)]
+        median = statistics.median(times)
+        print(f"{module}: median {median:.3f}s, min {min(times):.3f}s, max {max(times):.3f}s over {args.runs} runs")
+        for cumulative, name in slowest_imports(module, args.top):
+            print(f"    {cumulative / 1e6:>7.3f}s  {name}")
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"    slower than the {args.max_seconds:.2f}s limit")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Vector index benchmark: recall@k against exact flat search, query latency and bytes per
+vector for each index layout the shared vector store can use.
+
+Synthetic runs use clustered 384-dim unit vectors (what sentence embeddings look like to
+FAISS); --pdf embeds a real document with the app's all-MiniLM-L6-v2 model and queries it
+with the opening words of random chunks.
+
+Searches in the app are filtered to one thread's chunks, so a second table gives per-thread
+recall: --threads allowed sets of --thread-chunks vectors from two topics (clusters; a run of
+consecutive chunks with --pdf), queried near their own vectors (on topic) and with the
+general queries (off topic). 'selector' is a plain filtered index search, 'store' what the
+shared vector store does (exact over small allowed sets on IVF, see IVF_EXACT_FILTER_MAX).
+
+    python benchmarks/bench_index.py --count 50000
+    python benchmarks/bench_index.py --pdf manual.pdf --k 3 10
+    python benchmarks/bench_index.py --count 200000 --specs IDMap2,SQ8 IVF1024,Flat IVF1024,PQ48 --nprobe 8 32
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from vector_index import index_spec, create_index, search_allowed, search_params, bytes_per_vector
+
+
+def synthetic_vectors(count: int, queries: int, dimension: int = 384, clusters: int = 200, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    labels = rng.integers(clusters, size=count)
+    data = centers[labels] + 0.6 * rng.standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(data)
+    # Queries sit near stored vectors, like a question about a passage
+    picks = data[rng.integers(count, size=queries)]
+    query_vectors = (picks + 0.3 * rng.standard_normal(picks.shape) / np.sqrt(dimension)).astype('float32')
+    faiss.normalize_L2(query_vectors)
+    return data, query_vectors, labels
+
+
+def pdf_vectors(path: str, queries: int, seed: int = 0):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from ingestion_pipeline import EMBEDDING_MODEL, SPLITTER_CONFIG, iter_chunks
+
+    splitter = RecursiveCharacterTextSplitter(**SPLITTER_CONFIG)
+    chunks = [doc.page_content for doc in iter_chunks(PyPDFLoader(path).lazy_load(), splitter)]
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    data = np.asarray(embeddings.embed_documents(chunks), dtype='float32')
+    rng = np.random.default_rng(seed)
+    texts = [' '.join(chunks[i].split()[:12]) for i in rng.integers(len(chunks), size=queries)]
+    return data, np.asarray(embeddings.embed_documents(texts), dtype='float32'), None
+
+
+def measure(index, query_vectors, truth, k: int, nprobe: int) -> dict:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    latencies = []
+    found = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    recall = np.mean([len(set(ids) & set(expected)) / k for ids, expected in zip(found, truth)])
+    return {
+        'recall': recall,
+        'p50': np.percentile(latencies, 50) * 1000,
+        'p99': np.percentile(latencies, 99) * 1000
+    }
+
+
+def thread_sets(count: int, labels, threads: int, size: int, seed: int = 1) -> list:
+    """Allowed id sets standing in for threads' documents"""
+    rng = np.random.default_rng(seed)
+    sets = []
+    for _ in range(threads):
+        if labels is None:
+            start = int(rng.integers(max(1, count - size)))
+            sets.append(np.arange(start, min(count, start + size), dtype='int64'))
+            continue
+        members = np.flatnonzero(np.isin(labels, rng.choice(labels.max() + 1, 2, replace=False)))
+        sets.append(np.sort(rng.choice(members, min(size, len(members)), replace=False)).astype('int64'))
+    return sets
+
+
+def measure_filtered(index, data, query_vectors, sets, k: int, nprobe: int, method: str, seed: int = 2) -> dict:
+    """Recall@k against exact search over each allowed set, on and off topic, and empty result rate"""
+    rng = np.random.default_rng(seed)
+    recalls = {'on': [], 'off': []}
+    empty = 0
+    for i, allowed in enumerate(sets):
+        near = data[rng.choice(allowed)] + 0.3 * rng.standard_normal(data.shape[1]).astype('float32') / np.sqrt(data.shape[1])
+        for topic, query in (('on', near / np.linalg.norm(near)), ('off', query_vectors[i % len(query_vectors)])):
+            query = query[None, :].astype('float32')
+            distances = ((data[allowed] - query[0]) ** 2).sum(axis=1)
+            expected = set(allowed[np.argsort(distances)[:k]].tolist())
+            if method == 'store':
+                found = search_allowed(index, query, allowed, k, nprobe)
+            else:
+                _, ids = index.search(query, min(k, len(allowed)), params=search_params(index, faiss.IDSelectorBatch(allowed), nprobe))
+                found = [int(chunk_id) for chunk_id in ids[0] if chunk_id >= 0]
+            recalls[topic].append(len(expected & set(found)) / len(expected))
+            empty += topic == 'off' and not found
+    return {'on': np.mean(recalls['on']), 'off': np.mean(recalls['off']), 'empty': empty / len(sets)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF to embed (defaults to synthetic vectors)')
+    parser.add_argument('--count', type=int, default=50000, help='number of synthetic vectors')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 10])
+    parser.add_argument('--specs', nargs='+', help='FAISS factory strings (defaults to what auto mode would pick, per quantization)')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16, 64], help='IVF lists searched per query')
+    parser.add_argument('--threads', type=int, default=50, help='allowed sets for the per-thread table')
+    parser.add_argument('--thread-chunks', type=int, default=300, help='vectors per allowed set')
+    args = parser.parse_args()
+
+    if args.pdf:
+        data, query_vectors, labels = pdf_vectors(args.pdf, args.queries)
+    else:
+        data, query_vectors, labels = synthetic_vectors(args.count, args.queries)
+    count, dimension = data.shape
+    ids = np.arange(count, dtype='int64')
+
+    specs = args.specs or list(dict.fromkeys(
+        ['IDMap2,Flat', 'IDMap2,SQ8'] + [index_spec(count, dimension, 'ivf', q) for q in ('none', 'sq8', 'pq')]
+    ))
+    exact = create_index(data, ids, 'IDMap2,Flat')
+    max_k = max(args.k)
+    _, truth = exact.search(query_vectors, max_k)
+
+    print(f"{count} vectors x {dimension} dims, {len(query_vectors)} queries")
+    print(f"{'index':<18} {'nprobe':>6} {'build s':>8} {'B/vec':>6} " +
+          ' '.join(f"{'recall@' + str(k):>9}" for k in args.k) + f" {'p50 ms':>7} {'p99 ms':>7}")
+    indexes = {}
+    for spec in specs:
+        start = time.perf_counter()
+        index = indexes[spec] = create_index(data, ids, spec)
+        build = time.perf_counter() - start
+        probes = args.nprobe if faiss.try_extract_index_ivf(index) is not None else ['-']
+        for nprobe in probes:
+            runs = {k: measure(index, query_vectors, truth[:, :k], k, nprobe if nprobe != '-' else 0) for k in args.k}
+            latency = runs[max_k]
+            print(f"{spec:<18} {nprobe:>6} {build:>8.2f} {bytes_per_vector(index):>6} " +
+                  ' '.join(f"{runs[k]['recall']:>9.3f}" for k in args.k) +
+                  f" {latency['p50']:>7.3f} {latency['p99']:>7.3f}")
+
+
+    sets = thread_sets(count, labels, args.threads, args.thread_chunks)
+    print()
+    print(f"Filtered to one thread: {len(sets)} sets of {args.thread_chunks} vectors, recall@{min(args.k)}")
+    print(f"{'index':<18} {'nprobe':>6} {'method':>8} {'on topic':>9} {'off topic':>9} {'empty':>6}")
+    for spec, index in indexes.items():
+        probes = args.nprobe if faiss.try_extract_index_ivf(index) is not None else [0]
+        for nprobe in probes:
+            for method in ('selector', 'store'):
+                run = measure_filtered(index, data, query_vectors, sets, min(args.k), nprobe, method)
+                print(f"{spec:<18} {nprobe or '-':>6} {method:>8} {run['on']:>9.3f} {run['off']:>9.3f} {run['empty']:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
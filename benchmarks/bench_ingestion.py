@@ -0,0 +1,68 @@
+"""
+Embedding throughput benchmark for the ingestion pipeline.
+
+Measures chunks/sec for every combination of batch size and worker count using the
+same all-MiniLM-L6-v2 embeddings as the app.
+
+    python benchmarks/bench_ingestion.py --pdf manual.pdf
+    python benchmarks/bench_ingestion.py --chunks 2000 --batch-sizes 16 64 256 --workers 1 2 4
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from ingestion_pipeline import EMBEDDING_MODEL, SPLITTER_CONFIG, build_index, iter_chunks
+
+WORDS = (
+    "the model index vector query document page chunk thread retrieval latency "
+    "memory embedding batch worker throughput manual section table figure result"
+).split()
+
+
+def synthetic_chunks(count: int, seed: int = 0) -> list:
+    """Chunks of roughly the size the splitter produces (~1000 characters)"""
+    rng = random.Random(seed)
+    return [
+        Document(page_content=' '.join(rng.choice(WORDS) for _ in range(150)), metadata={'page': i})
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF to chunk (defaults to synthetic text)')
+    parser.add_argument('--chunks', type=int, default=1000, help='number of synthetic chunks')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 32, 64, 128])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    if args.pdf:
+        splitter = RecursiveCharacterTextSplitter(**SPLITTER_CONFIG)
+        chunks = list(iter_chunks(PyPDFLoader(args.pdf).lazy_load(), splitter))
+    else:
+        chunks = synthetic_chunks(args.chunks)
+
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    # Warm up so model loading isn't counted in the first configuration
+    embeddings.embed_documents([chunks[0].page_content])
+
+    print(f"{len(chunks)} chunks, model {EMBEDDING_MODEL}")
+    print(f"{'batch':>6} {'workers':>8} {'seconds':>9} {'chunks/s':>10}")
+    for batch_size in args.batch_sizes:
+        for workers in args.workers:
+            start = time.perf_counter()
+            _, done = build_index(chunks, embeddings, batch_size=batch_size, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{batch_size:>6} {workers:>8} {elapsed:>9.2f} {done / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
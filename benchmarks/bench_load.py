@@ -0,0 +1,376 @@
+"""
+Offline end-to-end load test of the chat graphs.
+
+N simulated users run scripted conversations at the same time against the compiled workflow
+of each backend. A stub chat model (benchmarks/stubs.py) stands in for Gemini / HuggingFace,
+and a local stub server stands in for Alpha Vantage and WeatherAPI. Embeddings are
+deterministic fakes, so nothing leaves the machine and the same settings give comparable runs.
+Everything else is the real app: LLM gateway, graph, context compaction, tools with their
+HTTP client and caches, retrieval, and the SQLite checkpointer (in a temporary directory).
+
+Scripts:
+    chat   plain multi-turn conversation
+    rag    questions about a document attached to the thread
+    tools  weather, stock and calculator calls, sometimes several in one turn
+
+Each backend runs in its own process, so peak RSS is per backend. The report gives
+turns/sec, time to first token, and p50/p99 of whole turns and of each graph node, tool,
+model call and checkpoint call; those come from instrumentation's per-turn traces. It also
+gives checkpoint DB growth.
+
+Results are compared with the stored baseline (benchmarks/baselines/bench_load.json) when it
+was recorded with the same settings. --save-baseline replaces it. --max-regression exits
+non-zero when turns/sec drops, or p99 turn latency rises, by more than that fraction.
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --users 32 --turns 10 --backends database --scripts tools rag
+    python benchmarks/bench_load.py --save-baseline
+    python benchmarks/bench_load.py --max-regression 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+BASELINE = os.path.join(BENCHMARKS, 'baselines', 'bench_load.json')
+
+SCRIPTS = {
+    'chat': [
+        "Hi, can you explain how {topic} works?",
+        "Can you give me an example?",
+        "What are the trade-offs?",
+        "Summarize that in three bullet points.",
+        "How would I get started with {topic}?",
+        "Thanks, anything else I should know?"
+    ],
+    'rag': [
+        "What does the document say about {topic}?",
+        "Which part of the document covers maintenance?",
+        "Does the document mention any pressure limits?",
+        "Compare that with the safety notes in the document."
+    ],
+    'tools': [
+        "What's the weather in {city}?",
+        "What is the price of {symbol}?",
+        "Calculate 17 mul 23",
+        "What's the weather in {city} and the price of {symbol}?"
+    ]
+}
+
+TOPICS = ['vector databases', 'pump maintenance', 'langgraph', 'solar panels', 'sourdough', 'tax returns']
+CITIES = ['London', 'Paris', 'Hyderabad', 'New York', 'Tokyo', 'Berlin', 'Lagos', 'Lima']
+SYMBOLS = ['AAPL', 'TSLA', 'MSFT', 'NVDA', 'AMZN', 'GOOG']
+
+# Attached documents for the rag script, shared by several threads like real uploads often are
+DOCUMENTS = 4
+DOCUMENT_CHUNKS = 300
+DOCUMENT_WORDS = "pump valve pressure seal bar maintenance safety limit inspect replace torque gasket flow".split()
+
+
+def settings(args) -> dict:
+    """What a result depends on; baselines are only compared when these match"""
+    return {
+        'users': args.users, 'turns': args.turns, 'scripts': sorted(args.scripts),
+        'llm_latency': args.llm_latency, 'token_latency': args.token_latency, 'answer_tokens': args.answer_tokens,
+        'llm_rpm': args.llm_rpm, 'http_latency': args.http_latency, 'think_time': args.think_time, 'semantic_cache': args.semantic_cache
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def database_bytes(db_path: str) -> int:
+    """File size once the WAL is folded in"""
+    if not db_path or not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return os.path.getsize(db_path)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def attach_document(backend, thread_id: str, number: int) -> None:
+    """Attach synthetic document `number` to a thread, as an upload that finished indexing would"""
+    from langchain_community.vectorstores import FAISS
+    key = f"bench-document-{number}"
+    filename = f"manual-{number}.pdf"
+    backend.get_document_catalog().attach(thread_id, key, filename)
+    if backend.VECTOR_STORE.has_document(key):
+        backend.VECTOR_STORE.add_document(thread_id, key, filename=filename)
+        return
+    rng = random.Random(number)
+    texts = [' '.join(rng.choices(DOCUMENT_WORDS, k=120)) + f" section {number}.{i}" for i in range(DOCUMENT_CHUNKS)]
+    backend.VECTOR_STORE.add_document(thread_id, key, FAISS.from_texts(texts, backend.embeddings), filename=filename)
+
+
+def load_database_backend():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from lazy import once
+    import backend_using_database as backend
+    # Fake vectors, real FAISS / BM25 work
+    backend.embeddings.get = once(lambda: DeterministicFakeEmbedding(size=384))
+    return backend.get_workflow(), backend.CHAT_DB, lambda thread_id, number: attach_document(backend, thread_id, number)
+
+
+def load_threads_backend():
+    import backend_chat_bot_threads as threads
+    # No tools and no documents in this backend, rag users just chat
+    return threads.workflow, threads.THREADS_DB, None
+
+
+BACKENDS = {
+    'database': load_database_backend,
+    'threads': load_threads_backend
+}
+
+
+async def simulate_user(workflow, thread_id: str, lines: list, turns: int, think_time: float, samples, errors: list) -> None:
+    from langchain_core.messages import AIMessage, HumanMessage
+    from message_utils import message_text
+    import instrumentation
+
+    config = {'configurable': {'thread_id': thread_id}}
+    for turn in range(turns):
+        started = time.perf_counter()
+        first_token = None
+        try:
+            async for chunk, metadata in workflow.astream(
+                {'messages': [HumanMessage(content=lines[turn % len(lines)])]},
+                config=config,
+                stream_mode='messages'
+            ):
+                if first_token is None and metadata.get('langgraph_node') == 'chat' and isinstance(chunk, AIMessage) \
+                        and message_text(chunk):
+                    first_token = time.perf_counter() - started
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            continue
+        samples['turn'].append(time.perf_counter() - started)
+        if first_token is not None:
+            samples['first token'].append(first_token)
+
+        trace = instrumentation.last_turn(thread_id) or {}
+        for node in trace.get('nodes', []):
+            samples[f"node {node['node']}"].append(node['seconds'])
+        for call in trace.get('llm', []):
+            samples['model call'].append(call['seconds'])
+        for call in trace.get('gateway', []):
+            samples['model queue wait'].append(call['queue_seconds'])
+        for tool_run in trace.get('tools', []):
+            samples[f"tool {tool_run['tool']}"].append(tool_run['seconds'])
+        for search in trace.get('retriever', []):
+            samples['retrieval'].append(search['seconds'])
+        for op in trace.get('checkpoint', []):
+            samples[f"checkpoint {op['op']}"].append(op['seconds'])
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+def run_backend(name: str, args) -> dict:
+    """One backend under load, in this process; returns its results"""
+    from stubs import StubChatModel, StubServer
+
+    directory = tempfile.mkdtemp(prefix='bench_load_')
+    server = StubServer(latency=args.http_latency)
+    os.environ.update({
+        'GRAPH_METRICS': '1',
+        'CHAT_DB': os.path.join(directory, 'chat.db'),
+        'THREADS_DB': os.path.join(directory, 'threads.db'),
+        'INGESTION_JOBS_DB': os.path.join(directory, 'chat.db'),
+        'INDEX_CACHE_DIR': os.path.join(directory, 'faiss_cache'),
+        'TOOL_CACHE_DB': '',
+        'SEMANTIC_CACHE': '1' if args.semantic_cache else '0',
+        'WEATHERAPI_URL': server.url,
+        'ALPHAVANTAGE_URL': server.url,
+        'LLM_RPM_GEMINI': str(args.llm_rpm),
+        'LLM_RPM_HUGGINGFACE': str(args.llm_rpm)
+    })
+    for variable in ('GRAPH_METRICS_PORT', 'CHECKPOINT_COMPACTION_INTERVAL', 'BACKEND_WARM_UP'):
+        os.environ.pop(variable, None)
+
+    import instrumentation
+    # Traces are read back per turn; the JSON log lines would only flood the output
+    instrumentation.logger.setLevel(logging.WARNING)
+
+    import llm_gateway
+    # Every provider behind the LLM gateway is the stub model
+    model = StubChatModel(first_token_latency=args.llm_latency, token_latency=args.token_latency,
+                          answer_tokens=args.answer_tokens)
+    llm_gateway.PROVIDERS = {provider: (lambda: model) for provider in llm_gateway.PROVIDERS}
+    workflow, db_path, attach = BACKENDS[name]()
+
+    users = []
+    for i in range(args.users):
+        script = args.scripts[i % len(args.scripts)]
+        thread_id = f"{script}-{i}"
+        values = {'topic': TOPICS[i % len(TOPICS)], 'city': CITIES[i % len(CITIES)], 'symbol': SYMBOLS[i % len(SYMBOLS)]}
+        users.append((thread_id, [line.format(**values) for line in SCRIPTS[script]]))
+        if script == 'rag' and attach is not None:
+            attach(thread_id, i % DOCUMENTS)
+
+    db_before = database_bytes(db_path)
+    samples = defaultdict(list)
+    errors = []
+
+    async def drive():
+        await asyncio.gather(*(
+            simulate_user(workflow, thread_id, lines, args.turns, args.think_time, samples, errors)
+            for thread_id, lines in users
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(drive())
+    seconds = time.perf_counter() - started
+    db_after = database_bytes(db_path)
+    server.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    turns = len(samples['turn'])
+    return {
+        'turns': turns,
+        'errors': len(errors),
+        'first_errors': errors[:3],
+        'seconds': round(seconds, 3),
+        'turns_per_second': round(turns / seconds, 2),
+        'latency': {
+            metric: {'count': len(values), 'p50': round(percentile(values, 0.5), 4), 'p99': round(percentile(values, 0.99), 4)}
+            for metric, values in sorted(samples.items())
+        },
+        'db_bytes_before': db_before,
+        'db_bytes_after': db_after,
+        'db_bytes_per_turn': round((db_after - db_before) / turns) if turns else 0,
+        'peak_rss_mb': round(peak_rss_mb(), 1) if resource is not None else None,
+        'http_requests': server.requests
+    }
+
+
+def print_report(results: dict) -> None:
+    print(f"{'backend':<10} {'turns':>6} {'errors':>6} {'turns/s':>8} {'turn p50':>9} {'turn p99':>9} "
+          f"{'ttft p50':>9} {'ttft p99':>9} {'DB KB':>8} {'B/turn':>8} {'peak RSS MB':>12}")
+    for name, result in results.items():
+        turn = result['latency'].get('turn', {'p50': 0, 'p99': 0})
+        ttft = result['latency'].get('first token', {'p50': 0, 'p99': 0})
+        print(f"{name:<10} {result['turns']:>6} {result['errors']:>6} {result['turns_per_second']:>8.2f} "
+              f"{turn['p50']:>9.3f} {turn['p99']:>9.3f} {ttft['p50']:>9.3f} {ttft['p99']:>9.3f} "
+              f"{result['db_bytes_after'] / 1024:>8.1f} {result['db_bytes_per_turn']:>8} {result['peak_rss_mb'] or 0:>12.1f}")
+        for error in result['first_errors']:
+            print(f"  error: {error}")
+    print()
+    print(f"{'backend':<10} {'step':<28} {'count':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        for metric, stats in result['latency'].items():
+            if metric in ('turn', 'first token'):
+                continue
+            print(f"{name:<10} {metric:<28} {stats['count']:>6} {stats['p50'] * 1000:>8.2f} {stats['p99'] * 1000:>8.2f}")
+
+
+def compare(results: dict, baseline: dict, max_regression) -> bool:
+    """Print the change against the baseline; False when a change is past max_regression"""
+    ok = True
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        throughput = result['turns_per_second'] / old['turns_per_second'] - 1 if old['turns_per_second'] else 0.0
+        old_p99 = old['latency'].get('turn', {}).get('p99') or 0
+        p99 = result['latency'].get('turn', {}).get('p99', 0) / old_p99 - 1 if old_p99 else 0.0
+        print(f"{name:<10} turns/s {result['turns_per_second']:.2f} vs {old['turns_per_second']:.2f} ({throughput:+.0%}), "
+              f"turn p99 {result['latency'].get('turn', {}).get('p99', 0):.3f}s vs {old_p99:.3f}s ({p99:+.0%}), "
+              f"B/turn {result['db_bytes_per_turn']} vs {old['db_bytes_per_turn']}, "
+              f"peak RSS {result['peak_rss_mb']} vs {old['peak_rss_mb']} MB")
+        if max_regression is not None and (-throughput > max_regression or p99 > max_regression):
+            print(f"{name}: regression past {max_regression:.0%}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=sorted(BACKENDS))
+    parser.add_argument('--users', type=int, default=16, help='concurrent simulated users per backend')
+    parser.add_argument('--turns', type=int, default=6, help='turns per user')
+    parser.add_argument('--scripts', nargs='+', choices=sorted(SCRIPTS), default=sorted(SCRIPTS))
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='stub model seconds to first token')
+    parser.add_argument('--token-latency', type=float, default=0.005, help='stub model seconds between tokens')
+    parser.add_argument('--answer-tokens', type=int, default=40)
+    parser.add_argument('--llm-rpm', type=float, default=0, help='LLM gateway requests/minute per provider (0 = no limit)')
+    parser.add_argument('--http-latency', type=float, default=0.05, help='stub weather / stock server latency')
+    parser.add_argument('--think-time', type=float, default=0.0, help='pause between a user\'s turns')
+    parser.add_argument('--semantic-cache', action='store_true', help='keep the semantic cache on (off by default)')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--max-regression', type=float, default=None)
+    parser.add_argument('--worker', choices=sorted(BACKENDS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Child process: one backend, results as the last line of stdout
+        print(json.dumps(run_backend(args.worker, args)))
+        return
+
+    results = {}
+    for name in args.backends:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--worker', name],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"Error running the {name} backend:\n{completed.stderr[-3000:]}")
+            continue
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+    if not results:
+        sys.exit(1)
+    print_report(results)
+
+    config = settings(args)
+    ok = True
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        if baseline.get('config') == config:
+            ok = compare(results, baseline, args.max_regression)
+        else:
+            print("Baseline was recorded with other settings, not compared.")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'recorded': time.strftime('%Y-%m-%d'), 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
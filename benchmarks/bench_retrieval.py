@@ -0,0 +1,126 @@
+"""
+Retrieval quality and latency of the rag search modes: vector only, BM25 only, hybrid
+(reciprocal rank fusion) and hybrid + cross-encoder reranking.
+
+Each query has one target chunk. Half of the queries ask for an exact identifier that
+appears in the target (part numbers, names); the other half are a scrambled excerpt
+of the target's text. Reports hit@k, MRR and per-query latency.
+
+    python benchmarks/bench_retrieval.py --chunks 2000
+    python benchmarks/bench_retrieval.py --pdf manual.pdf --rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from ingestion_pipeline import EMBEDDING_MODEL, SPLITTER_CONFIG, build_index, iter_chunks
+from hybrid_search import Reranker, TOKEN
+from vector_store import SharedVectorStore
+
+WORDS = (
+    "pump valve pressure seal housing bearing motor shaft filter gasket torque sensor "
+    "install remove inspect replace tighten calibrate clean lubricate check adjust "
+    "maintenance interval warning caution procedure assembly figure table section"
+).split()
+NAMES = ["Okafor", "Lindqvist", "Haruto", "Moreau", "Castellano", "Novak", "Adeyemi", "Brennan"]
+
+
+def synthetic_chunks(count: int, rng: random.Random) -> list:
+    """Manual-like chunks, each mentioning a unique part number and an engineer's name"""
+    chunks = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(140)]
+        words.insert(rng.randrange(len(words)), f"part {rng.choice('ABCDEFGHJK')}{rng.choice('LMNPQRSTUV')}-{10000 + i}")
+        words.insert(rng.randrange(len(words)), f"approved by {rng.choice(NAMES)}")
+        chunks.append(Document(page_content=' '.join(words), metadata={'chunk': i}))
+    return chunks
+
+
+def make_queries(chunks: list, count: int, rng: random.Random) -> list:
+    """(query, target chunk index) pairs: exact-term lookups and scrambled excerpts"""
+    queries = []
+    for n in range(count):
+        target = rng.randrange(len(chunks))
+        text = chunks[target].page_content
+        identifiers = [token for token in TOKEN.findall(text.lower()) if any(c.isdigit() for c in token) and len(token) > 3]
+        if n % 2 == 0 and identifiers:
+            queries.append((f"What does the manual say about {rng.choice(identifiers).upper()}?", target))
+        else:
+            words = text.split()
+            start = rng.randrange(max(1, len(words) - 20))
+            excerpt = words[start:start + 20]
+            rng.shuffle(excerpt)
+            queries.append((' '.join(excerpt), target))
+    return queries
+
+
+def evaluate(store: SharedVectorStore, queries: list, k: int, mode: str, rerank: bool) -> dict:
+    hits = 0
+    reciprocal_ranks = []
+    latencies = []
+    for query, target in queries:
+        start = time.perf_counter()
+        results = store.search('bench', query, k=k, mode=mode, rerank=rerank)
+        latencies.append(time.perf_counter() - start)
+        ranks = [i for i, doc in enumerate(results) if doc.metadata.get('chunk') == target]
+        hits += bool(ranks)
+        reciprocal_ranks.append(1 / (ranks[0] + 1) if ranks else 0.0)
+    return {
+        'hit': hits / len(queries),
+        'mrr': sum(reciprocal_ranks) / len(queries),
+        'p50': np.percentile(latencies, 50) * 1000,
+        'p99': np.percentile(latencies, 99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdf', help='PDF to chunk (defaults to synthetic manual text)')
+    parser.add_argument('--chunks', type=int, default=2000, help='number of synthetic chunks')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--rerank-model', help='cross-encoder to also benchmark hybrid + rerank')
+    parser.add_argument('--rerank-budget-ms', type=float, default=150)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    if args.pdf:
+        splitter = RecursiveCharacterTextSplitter(**SPLITTER_CONFIG)
+        chunks = list(iter_chunks(PyPDFLoader(args.pdf).lazy_load(), splitter))
+        for i, chunk in enumerate(chunks):
+            chunk.metadata['chunk'] = i
+    else:
+        chunks = synthetic_chunks(args.chunks, rng)
+    queries = make_queries(chunks, args.queries, rng)
+
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    vectorstore, _ = build_index(chunks, embeddings)
+    reranker = Reranker(args.rerank_model, args.rerank_budget_ms) if args.rerank_model else None
+    store = SharedVectorStore(embeddings, reranker=reranker)
+    store.add_document('bench', 'bench', vectorstore)
+
+    runs = [('vector', False), ('bm25', False), ('hybrid', False)]
+    if reranker:
+        # Warm up the model and its per-pair cost estimate
+        store.search('bench', queries[0][0], k=args.k, mode='hybrid', rerank=True)
+        runs.append(('hybrid', True))
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':<16} {'hit@k':>7} {'MRR':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode, rerank in runs:
+        result = evaluate(store, queries, args.k, mode, rerank)
+        name = mode + (' + rerank' if rerank else '')
+        print(f"{name:<16} {result['hit']:>7.3f} {result['mrr']:>7.3f} {result['p50']:>8.2f} {result['p99']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
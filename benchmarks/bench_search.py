@@ -0,0 +1,110 @@
+"""
+Full-text chat search benchmark: indexing throughput and query latency of the FTS5 index
+(message_search.py) as the number of stored messages grows.
+
+Messages are synthetic chat turns (a Zipf-like vocabulary, so some words are in most
+messages and others in a handful). Queries mix common words, rare words, two-word queries
+and prefixes typed so far; each is timed through ThreadCatalogSaver.search(), which is what
+the sidebar calls.
+
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --messages 100000 300000 --queries 300
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from checkpoint_store import ThreadCatalogSaver
+from message_search import index_messages
+
+MESSAGES_PER_THREAD = 40
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def sentence(words: list, weights: list, rng: random.Random, length: int) -> str:
+    return ' '.join(rng.choices(words, weights=weights, k=length))
+
+
+def fill(saver, count: int, start: int, words: list, weights: list, rng: random.Random) -> float:
+    """Index `count` more messages, a thread at a time as checkpoint writes would; returns seconds"""
+    started = time.perf_counter()
+    with saver.cursor() as cur:
+        for offset in range(0, count, MESSAGES_PER_THREAD):
+            thread_id = f"thread-{(start + offset) // MESSAGES_PER_THREAD}"
+            messages = []
+            for i in range(MESSAGES_PER_THREAD):
+                if i % 2 == 0:
+                    messages.append(HumanMessage(content=sentence(words, weights, rng, rng.randint(5, 20)), id=f"{thread_id}-{i}"))
+                else:
+                    messages.append(AIMessage(content=sentence(words, weights, rng, rng.randint(40, 120)), id=f"{thread_id}-{i}"))
+            cur.execute(
+                "INSERT OR REPLACE INTO threads (thread_id, created_at, updated_at, message_count, title) VALUES (?, '', '', ?, ?)",
+                (thread_id, len(messages), messages[0].content[:40])
+            )
+            index_messages(cur, thread_id, messages)
+    return time.perf_counter() - started
+
+
+def make_queries(words: list, count: int, rng: random.Random) -> list:
+    queries = []
+    for n in range(count):
+        kind = n % 4
+        if kind == 0:
+            queries.append(('common', rng.choice(words[:20])))
+        elif kind == 1:
+            queries.append(('rare', rng.choice(words[-2000:])))
+        elif kind == 2:
+            queries.append(('two words', f"{rng.choice(words[:200])} {rng.choice(words[:2000])}"))
+        else:
+            word = rng.choice(words[:500])
+            queries.append(('prefix', word[:max(2, len(word) - 2)]))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, nargs='+', default=[50000, 200000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = vocabulary(args.vocabulary, rng)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    queries = make_queries(words, args.queries, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        saver = ThreadCatalogSaver(sqlite3.connect(os.path.join(directory, 'search.db'), check_same_thread=False))
+        saver.setup()
+        stored = 0
+        print(f"{'messages':>9} {'index msg/s':>12} {'kind':<10} {'p50 ms':>7} {'p99 ms':>7} {'threads found':>14}")
+        for target in sorted(args.messages):
+            seconds = fill(saver, target - stored, stored, words, weights, rng)
+            rate = (target - stored) / seconds
+            stored = target
+            timings = {}
+            for kind, query in queries:
+                started = time.perf_counter()
+                found = saver.search(query)
+                timings.setdefault(kind, []).append((time.perf_counter() - started, len(found)))
+            for kind, runs in timings.items():
+                latencies = sorted(seconds for seconds, _ in runs)
+                print(f"{target:>9} {rate:>12.0f} {kind:<10} {statistics.median(latencies) * 1000:>7.2f} "
+                      f"{latencies[int(0.99 * (len(latencies) - 1))] * 1000:>7.2f} "
+                      f"{statistics.mean(found for _, found in runs):>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Offline stand-ins for the services the chatbot calls, for load tests and benchmarks:
+
+- StubChatModel: a deterministic chat model with configurable latency. Once tools are bound
+  it calls them the way Gemini would for the question at hand (weather, stock price,
+  calculator, the uploaded document); otherwise it answers with canned text.
+- StubServer: local HTTP server answering like WeatherAPI and Alpha Vantage, with
+  configurable latency; point WEATHERAPI_URL / ALPHAVANTAGE_URL at its url.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from typing import Optional
+import threading
+import hashlib
+import asyncio
+import json
+import time
+import re
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.config import get_config
+
+def current_thread_id() -> Optional[str]:
+    """Thread of the graph run calling the model (the app never puts it in the prompt; Gemini guesses it)"""
+    try:
+        return get_config()['configurable'].get('thread_id')
+    except (RuntimeError, KeyError):
+        return None
+
+
+WORDS = "the pump valve pressure seal weather price city forecast answer because however so then".split()
+
+WEATHER = re.compile(r"weather in ([A-Za-z][A-Za-z ]*?)(?:\?|$| and\b)", re.IGNORECASE)
+STOCK = re.compile(r"price of ([A-Za-z]{1,5})\b", re.IGNORECASE)
+CALCULATION = re.compile(r"calculate (-?\d+(?:\.\d+)?) (add|sub|mul|div) (-?\d+(?:\.\d+)?)", re.IGNORECASE)
+DOCUMENT = re.compile(r"\bdocument\b", re.IGNORECASE)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic chat model. A call waits `first_token_latency`, then streams
+    `answer_tokens` words `token_latency` apart (tool calls come as one chunk).
+    """
+
+    first_token_latency: float = 0.2
+    token_latency: float = 0.005
+    answer_tokens: int = 40
+    tool_names: tuple = ()
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub'
+
+    def bind_tools(self, tools, **kwargs):
+        names = tuple(getattr(tool, 'name', None) or tool.__name__ for tool in tools)
+        return self.model_copy(update={'tool_names': names})
+
+    def _tool_calls(self, text: str, thread_id: Optional[str], seed: str) -> list:
+        calls = []
+        for city in WEATHER.findall(text):
+            calls.append(('get_weather', {'city': city.strip()}))
+        for symbol in STOCK.findall(text):
+            calls.append(('get_stock_price', {'symbol': symbol.upper()}))
+        for first, operation, second in CALCULATION.findall(text):
+            calls.append(('calculator', {'first_number': float(first), 'second_number': float(second), 'operation': operation.lower()}))
+        if DOCUMENT.search(text) and thread_id is not None:
+            calls.append(('rag_implementation', {'query': text, 'thread_id': thread_id}))
+        return [
+            {'name': name, 'args': args, 'id': f"call_{hashlib.md5(f'{seed}:{i}'.encode()).hexdigest()[:12]}", 'type': 'tool_call'}
+            for i, (name, args) in enumerate(calls) if name in self.tool_names
+        ]
+
+    def _respond(self, messages, run_manager) -> tuple:
+        """(answer words, tool calls, input tokens) for this prompt; the same prompt always gets the same reply"""
+        thread_id = current_thread_id()
+        prompt = ' '.join(str(message.content) for message in messages)
+        seed = hashlib.md5(f"{thread_id}:{len(messages)}:{prompt[-200:]}".encode()).hexdigest()
+        last = messages[-1]
+        tool_calls = self._tool_calls(str(last.content), thread_id, seed) if last.type == 'human' else []
+        words = [] if tool_calls else [WORDS[int(seed[i % 32], 16) % len(WORDS)] for i in range(self.answer_tokens)]
+        return words, tool_calls, len(prompt.split())
+
+    def _message(self, words, tool_calls, input_tokens, chunk: bool = False):
+        usage = {'input_tokens': input_tokens, 'output_tokens': len(words), 'total_tokens': input_tokens + len(words)}
+        if chunk:
+            tool_call_chunks = [
+                {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': i}
+                for i, call in enumerate(tool_calls)
+            ]
+            return AIMessageChunk(content='', tool_call_chunks=tool_call_chunks, usage_metadata=usage)
+        return AIMessage(content=' '.join(words), tool_calls=tool_calls, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words, tool_calls, input_tokens = self._respond(messages, run_manager)
+        time.sleep(self.first_token_latency + self.token_latency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=self._message(words, tool_calls, input_tokens))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        words, tool_calls, input_tokens = self._respond(messages, run_manager)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=self._message(words, tool_calls, input_tokens))])
+
+    def _chunks(self, words, tool_calls, input_tokens):
+        for i, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else ' ' + word))
+        # Usage (and any tool calls) come with the last chunk, like the real providers send them
+        yield ChatGenerationChunk(message=self._message(words, tool_calls, input_tokens, chunk=True))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words, tool_calls, input_tokens = self._respond(messages, run_manager)
+        time.sleep(self.first_token_latency)
+        for chunk in self._chunks(words, tool_calls, input_tokens):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+            time.sleep(self.token_latency)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        words, tool_calls, input_tokens = self._respond(messages, run_manager)
+        await asyncio.sleep(self.first_token_latency)
+        for chunk in self._chunks(words, tool_calls, input_tokens):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.token_latency)
+
+
+def weather_payload(city: str) -> dict:
+    temp = int(hashlib.md5(city.encode()).hexdigest()[:2], 16) % 35
+    return {
+        "location": {"name": city.title(), "region": "", "country": "Stubland"},
+        "current": {"temp_c": float(temp), "condition": {"text": "Partly cloudy"}, "wind_kph": 14.4, "humidity": 82,
+                    "feelslike_c": temp - 1.5, "uv": 1.0, "gust_kph": 21.2, "pressure_mb": 1012.0}
+    }
+
+
+def quote_payload(symbol: str) -> dict:
+    price = 50 + int(hashlib.md5(symbol.encode()).hexdigest()[:4], 16) % 400
+    return {
+        "Global Quote": {
+            "01. symbol": symbol, "02. open": f"{price - 1:.4f}", "03. high": f"{price + 2:.4f}",
+            "04. low": f"{price - 3:.4f}", "05. price": f"{price:.4f}", "06. volume": "51234567",
+            "07. latest trading day": "2026-01-09", "08. previous close": f"{price - 0.5:.4f}",
+            "09. change": "0.5000", "10. change percent": "0.2000%"
+        }
+    }
+
+
+class StubServer:
+    """WeatherAPI (/v1/current.json) and Alpha Vantage (/query) on a local port, on a daemon thread"""
+
+    def __init__(self, latency: float = 0.05, port: int = 0):
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                with stub.lock:
+                    stub.requests += 1
+                time.sleep(stub.latency)
+                if url.path == '/v1/current.json':
+                    payload = weather_payload(query.get('q', ''))
+                elif url.path == '/query':
+                    payload = quote_payload(query.get('symbol', ''))
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-server', daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,114 @@
+from urllib.parse import quote
+from typing import Iterator, Optional
+import httpx
+import json
+import os
+
+# Where chat_service.py listens
+CHAT_SERVICE_URL = os.getenv('CHAT_SERVICE_URL', 'http://127.0.0.1:8000')
+
+# Longest wait (seconds) for a response, or between two events of a streamed turn
+CHAT_SERVICE_TIMEOUT = float(os.getenv('CHAT_SERVICE_TIMEOUT', 120))
+
+# GRAPH_METRICS=1 reports each Streamlit script run's time to the service's /metrics
+GRAPH_METRICS = os.getenv('GRAPH_METRICS', '0') == '1'
+
+# One keep-alive pool per frontend process, shared by every Streamlit session
+client = httpx.Client(
+    base_url=CHAT_SERVICE_URL,
+    timeout=httpx.Timeout(CHAT_SERVICE_TIMEOUT, connect=3),
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=16)
+)
+
+
+def _thread_path(thread_id: str, *parts: str) -> str:
+    return '/'.join(['/threads', quote(str(thread_id), safe=''), *parts])
+
+
+def _call(method: str, path: str, default, **kwargs):
+    """JSON body of a service call, or `default` (after printing why) when it fails"""
+    try:
+        response = client.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print(f"Error calling chat service {method} {path}: {e}")
+        return default
+
+
+def stream_chat(thread_id: str, message: str, graph: str = 'database') -> Iterator[dict]:
+    """
+    Run one turn and yield its events as they arrive (see chat_service.py for their shape).
+    Failures of the turn are raised, so the frontend shows them like a local error.
+    """
+    with client.stream('POST', _thread_path(thread_id, 'chat'), json={'message': message, 'graph': graph}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event['type'] == 'error':
+                raise RuntimeError(event['error'])
+            yield event
+
+
+def get_thread_summaries(limit=None, offset=0, search=None) -> list:
+    params = {'offset': offset}
+    if limit is not None:
+        params['limit'] = limit
+    if search:
+        params['search'] = search
+    return _call('GET', '/threads', [], params=params)
+
+
+def search_chats(query, limit=20) -> list:
+    return _call('GET', '/search', [], params={'q': query, 'limit': limit})
+
+
+def get_thread_messages_page(thread_id, limit=None, before=None) -> dict:
+    params = {}
+    if limit is not None:
+        params['limit'] = limit
+    if before is not None:
+        params['before'] = before
+    return _call('GET', _thread_path(thread_id, 'messages'), {'messages': [], 'has_more': False, 'next_cursor': 0},
+                 params=params)
+
+
+def get_thread_documents(thread_id: str) -> list:
+    return _call('GET', _thread_path(thread_id, 'documents'), [])
+
+
+def submit_ingestion(file_bytes: bytes, thread_id: str, filename: Optional[str] = None) -> dict:
+    try:
+        response = client.post(
+            _thread_path(thread_id, 'documents'),
+            content=file_bytes,
+            params={'filename': filename} if filename else None,
+            headers={'Content-Type': 'application/pdf'}
+        )
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return {"error": f"Chat service unavailable: {e}"}
+
+
+def get_ingestion_job(job_id: str) -> Optional[dict]:
+    return _call('GET', f"/jobs/{quote(job_id, safe='')}", None)
+
+
+def cancel_ingestion(job_id: str) -> bool:
+    return _call('DELETE', f"/jobs/{quote(job_id, safe='')}", {'cancelled': False})['cancelled']
+
+
+def remove_document(thread_id: str, key: str) -> None:
+    _call('DELETE', _thread_path(thread_id, 'documents', quote(key, safe='')), None)
+
+
+def report_render(frontend: str, seconds: float) -> None:
+    if GRAPH_METRICS:
+        _call('POST', '/metrics/render', None, json={'frontend': frontend, 'seconds': seconds})
+
+
+def get_semantic_cache_stats() -> Optional[dict]:
+    return _call('GET', '/stats', {}).get('semantic_cache')
@@ -0,0 +1,252 @@
+"""
+The chat backend as an HTTP service, so the Streamlit frontends are thin clients (chat_client.py)
+and chat capacity grows with worker processes instead of living inside each Streamlit script run.
+
+Every worker process builds its own graph, but everything a thread needs is shared: checkpoints,
+the thread catalog and the search index are in the SQLite file (CHAT_DB, WAL mode), uploaded
+documents are in the on-disk index cache with their thread attachments in the same file, and
+ingestion jobs are tracked there too. Any worker can serve any request.
+
+A chat turn is POST /threads/{thread_id}/chat {"message": ..., "graph": "database" | "threads"}
+and streams newline-delimited JSON events:
+
+    {"type": "message", "id": ..., "text": ..., "tool_calls": [{"id", "name"}]}   model output
+    {"type": "tool", "name": ..., "tool_call_id": ...}                             a tool finished
+    {"type": "end", "timings": {...} | null}                                       turn done
+    {"type": "error", "error": ...}
+
+    python chat_service.py --workers 4
+    python chat_service.py --host 0.0.0.0 --port 8000 --workers 8 --threads 64
+"""
+import os
+import json
+import argparse
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# The threads graph keeps checkpoints in memory by default, workers have to share them
+os.environ.setdefault('THREADS_DB', 'chat_threads.db')
+
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage
+import backend_using_database as backend
+from message_utils import message_text
+from lazy import once
+import instrumentation
+
+CHAT_SERVICE_HOST = os.getenv('CHAT_SERVICE_HOST', '127.0.0.1')
+CHAT_SERVICE_PORT = int(os.getenv('CHAT_SERVICE_PORT', 8000))
+
+# Worker processes, and threads per worker for blocking calls (SQLite reads, ingestion submits, sync graph nodes)
+CHAT_SERVICE_WORKERS = int(os.getenv('CHAT_SERVICE_WORKERS', 2))
+CHAT_SERVICE_THREADS = int(os.getenv('CHAT_SERVICE_THREADS', 40))
+
+# CHAT_SERVICE_WARM_UP=0 builds the graph and loads models on the first request instead of at start
+CHAT_SERVICE_WARM_UP = os.getenv('CHAT_SERVICE_WARM_UP', '1') != '0'
+
+
+@once
+def get_threads_workflow():
+    from backend_chat_bot_threads import workflow
+    return workflow
+
+
+GRAPHS = {
+    'database': backend.get_workflow,
+    'threads': get_threads_workflow
+}
+
+
+def int_param(request, name: str, default=None):
+    value = request.query_params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(400, f"{name} must be an integer")
+
+
+def stream_event(chunk, metadata) -> Optional[dict]:
+    """What a frontend needs of a streamed message (answer text, tool calls, tool results), or None"""
+    if isinstance(chunk, ToolMessage):
+        return {'type': 'tool', 'name': chunk.name, 'tool_call_id': chunk.tool_call_id}
+    # Tokens of the history summarizer are not part of the answer; semantic cache hits arrive as one AIMessage
+    if metadata.get('langgraph_node') != 'chat' or not isinstance(chunk, AIMessage):
+        return None
+    tool_calls = chunk.tool_call_chunks if isinstance(chunk, AIMessageChunk) else chunk.tool_calls
+    return {
+        'type': 'message',
+        'id': chunk.id,
+        'text': message_text(chunk),
+        'tool_calls': [{'id': call.get('id'), 'name': call.get('name')} for call in tool_calls]
+    }
+
+
+async def chat(request):
+    thread_id = request.path_params['thread_id']
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Body must be JSON")
+    message = str(body.get('message') or '')
+    graph = body.get('graph', 'database')
+    if not message.strip():
+        raise HTTPException(400, "Empty message")
+    if graph not in GRAPHS:
+        raise HTTPException(404, f"Unknown graph {graph}")
+    # The first request of a worker may have to build the graph
+    workflow = await run_in_threadpool(GRAPHS[graph])
+    config = {'configurable': {'thread_id': thread_id}}
+
+    async def events():
+        try:
+            async for chunk, metadata in workflow.astream(
+                {'messages': [HumanMessage(content=message)]},
+                config=config,
+                stream_mode='messages'
+            ):
+                event = stream_event(chunk, metadata)
+                if event is not None:
+                    yield json.dumps(event) + '\n'
+            # Timings were recorded by this worker, so they travel with the turn
+            timings = instrumentation.last_turn(thread_id) if instrumentation.ENABLED else None
+            yield json.dumps({'type': 'end', 'timings': timings}) + '\n'
+        except Exception as e:
+            print(f"Error running chat turn for thread {thread_id}: {e}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+
+    return StreamingResponse(events(), media_type='application/x-ndjson')
+
+
+# Plain functions run on the worker's thread pool, so blocking SQLite calls don't stall streaming turns
+
+def health(request):
+    return JSONResponse({'status': 'ok', 'pid': os.getpid()})
+
+
+def list_threads(request):
+    return JSONResponse(backend.get_thread_summaries(
+        limit=int_param(request, 'limit'),
+        offset=int_param(request, 'offset', 0),
+        search=request.query_params.get('search') or None
+    ))
+
+
+def search(request):
+    return JSONResponse(backend.search_chats(request.query_params.get('q', ''), limit=int_param(request, 'limit', 20)))
+
+
+def thread_messages(request):
+    return JSONResponse(backend.get_thread_messages_page(
+        request.path_params['thread_id'],
+        limit=int_param(request, 'limit', backend.HISTORY_PAGE_SIZE),
+        before=int_param(request, 'before')
+    ))
+
+
+def thread_documents(request):
+    return JSONResponse(backend.get_thread_documents(request.path_params['thread_id']))
+
+
+async def upload_document(request):
+    # The PDF is the raw request body
+    file_bytes = await request.body()
+    result = await run_in_threadpool(
+        backend.submit_ingestion,
+        file_bytes,
+        request.path_params['thread_id'],
+        request.query_params.get('filename')
+    )
+    return JSONResponse(result)
+
+
+def remove_document(request):
+    backend.remove_document(request.path_params['thread_id'], request.path_params['key'])
+    return JSONResponse({'removed': True})
+
+
+def ingestion_job(request):
+    return JSONResponse(backend.get_ingestion_job(request.path_params['job_id']))
+
+
+def cancel_ingestion_job(request):
+    return JSONResponse({'cancelled': backend.cancel_ingestion(request.path_params['job_id'])})
+
+
+def stats(request):
+    return JSONResponse({
+        'semantic_cache': backend.get_semantic_cache_stats(),
+        'tool_caches': backend.get_tool_cache_stats(),
+        'vector_store': backend.get_vector_store_stats(),
+        'http': backend.get_http_stats(),
+        'llm_gateway': backend.get_llm_gateway_stats()
+    })
+
+
+def metrics(request):
+    # This worker's metrics only; scrape every worker (or run one) for the full picture
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type='text/plain; version=0.0.4')
+
+
+async def record_render(request):
+    # Frontends report their script run times here, so they don't need instrumentation themselves
+    try:
+        body = await request.json()
+        seconds = float(body['seconds'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Body must be JSON with seconds")
+    instrumentation.observe_render(str(body.get('frontend', 'database')), seconds)
+    return JSONResponse({'recorded': instrumentation.ENABLED})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = CHAT_SERVICE_THREADS
+    if CHAT_SERVICE_WARM_UP:
+        backend.warm_up(background=True)
+    yield
+    backend.INGESTION_JOBS.shutdown()
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health),
+        Route('/threads', list_threads),
+        Route('/search', search),
+        Route('/threads/{thread_id}/chat', chat, methods=['POST']),
+        Route('/threads/{thread_id}/messages', thread_messages),
+        Route('/threads/{thread_id}/documents', thread_documents),
+        Route('/threads/{thread_id}/documents', upload_document, methods=['POST']),
+        Route('/threads/{thread_id}/documents/{key}', remove_document, methods=['DELETE']),
+        Route('/jobs/{job_id}', ingestion_job),
+        Route('/jobs/{job_id}', cancel_ingestion_job, methods=['DELETE']),
+        Route('/stats', stats),
+        Route('/metrics', metrics),
+        Route('/metrics/render', record_render, methods=['POST'])
+    ],
+    lifespan=lifespan
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=CHAT_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=CHAT_SERVICE_PORT)
+    parser.add_argument('--workers', type=int, default=CHAT_SERVICE_WORKERS, help='worker processes')
+    parser.add_argument('--threads', type=int, default=CHAT_SERVICE_THREADS, help='threads per worker for blocking calls')
+    args = parser.parse_args()
+
+    import uvicorn
+    # Workers are fresh processes that import this module again and read the setting from the environment
+    os.environ['CHAT_SERVICE_THREADS'] = str(args.threads)
+    uvicorn.run('chat_service:app', host=args.host, port=args.port, workers=args.workers, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
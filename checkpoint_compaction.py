@@ -0,0 +1,368 @@
+"""
+Checkpoint compaction and retention for chat_history.db.
+
+SqliteSaver stores a full checkpoint for every graph step, so the database grows with every
+tool loop. This prunes intermediate checkpoints (keeping the latest one per thread plus the
+end-of-turn snapshots of the last few turns), deletes or archives threads idle past a
+retention window, and reclaims space with incremental vacuum in small steps so live writers
+are only ever blocked for a moment. With the packed format (checkpoint_format.py), kept
+checkpoints whose delta chain runs through a pruned one become keyframes first, and
+messages nothing refers to any more are deleted. A lease row in the database keeps
+compaction to one process at a time, however many service workers run the background loop.
+
+    python checkpoint_compaction.py --db chat_history.db --keep-turns 5 --retention-days 90
+    python checkpoint_compaction.py --retention-days 30 --archive archive.db --vacuum
+"""
+from datetime import datetime, timedelta, timezone
+from checkpoint_format import decode_checkpoint, rebase, referenced_messages, collect_garbage
+from typing import Optional
+import threading
+import argparse
+import sqlite3
+import socket
+import json
+import time
+import os
+
+# Threads written to this recently are left alone so running turns are never touched
+ACTIVE_GRACE_SECONDS = 300
+
+# Rows deleted / pages vacuumed per transaction
+BATCH_SIZE = 500
+VACUUM_PAGES = 256
+
+# A pass holds the database's compaction lease this long at most; a crashed holder's lease
+# expires after it and another process takes over
+LEASE_SECONDS = 1800
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def has_table(conn, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def db_size(conn) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    used = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return used * page_size
+
+
+def file_size(conn) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+
+def active_threads(conn) -> set:
+    """Threads with a write inside the grace window (needs the thread catalog)"""
+    if not has_table(conn, 'threads'):
+        return set()
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ACTIVE_GRACE_SECONDS)).isoformat()
+    return {row[0] for row in conn.execute("SELECT thread_id FROM threads WHERE updated_at > ?", (cutoff,))}
+
+
+def acquire_lease(db_path: str, owner: str, ttl: float = LEASE_SECONDS, min_gap: float = 0) -> bool:
+    """
+    Take the database-wide compaction lease for `owner`, so only one process compacts at a time.
+    Fails while another owner holds an unexpired lease, or if a pass finished less than
+    `min_gap` seconds ago.
+    """
+    conn = connect(db_path)
+    conn.isolation_level = None
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS compaction_lease "
+            "(id INTEGER PRIMARY KEY CHECK (id = 1), owner TEXT, expires_at REAL, finished_at REAL)"
+        )
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes can't both see the lease free
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at, finished_at FROM compaction_lease WHERE id = 1").fetchone()
+            if row is not None:
+                holder, expires_at, finished_at = row
+                if holder != owner and (expires_at or 0) > now:
+                    conn.execute("ROLLBACK")
+                    return False
+                if finished_at is not None and now - finished_at < min_gap:
+                    conn.execute("ROLLBACK")
+                    return False
+            conn.execute(
+                "INSERT INTO compaction_lease (id, owner, expires_at) VALUES (1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (owner, now + ttl)
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def release_lease(db_path: str, owner: str) -> None:
+    """Give the lease back and record when the pass finished"""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE compaction_lease SET expires_at = 0, finished_at = ? WHERE id = 1 AND owner = ?",
+                (time.time(), owner)
+            )
+    finally:
+        conn.close()
+
+
+def checkpoints_to_keep(rows, keep_turns: int) -> set:
+    """
+    rows: (checkpoint_id, metadata) of one thread/namespace in id order.
+    Keeps the latest checkpoint and the last checkpoint of each of the `keep_turns` most
+    recent turns (a turn ends right before the next 'input' checkpoint).
+    """
+    keep = set()
+    if not rows:
+        return keep
+    keep.add(rows[-1][0])
+    turn_ends = []
+    for (checkpoint_id, _), (_, next_metadata) in zip(rows, rows[1:]):
+        try:
+            source = json.loads(next_metadata or '{}').get('source')
+        except ValueError:
+            source = None
+        if source == 'input':
+            turn_ends.append(checkpoint_id)
+    if keep_turns > 0:
+        keep.update(turn_ends[-keep_turns:])
+    return keep
+
+
+def prune_thread(conn, thread_id: str, keep_turns: int) -> int:
+    """Delete intermediate checkpoints (and their writes) of one thread; returns rows removed"""
+    removed = 0
+    namespaces = [row[0] for row in conn.execute(
+        "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+    )]
+    for checkpoint_ns in namespaces:
+        rows = conn.execute(
+            "SELECT checkpoint_id, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id",
+            (thread_id, checkpoint_ns)
+        ).fetchall()
+        keep = checkpoints_to_keep(rows, keep_turns)
+        doomed = [checkpoint_id for checkpoint_id, _ in rows if checkpoint_id not in keep]
+        if doomed:
+            rebase(conn, thread_id, checkpoint_ns, keep)
+
+        for start in range(0, len(doomed), BATCH_SIZE):
+            batch = doomed[start:start + BATCH_SIZE]
+            marks = ','.join('?' * len(batch))
+            with conn:
+                conn.execute(
+                    f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({marks})",
+                    (thread_id, checkpoint_ns, *batch)
+                )
+                removed += conn.execute(
+                    f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({marks})",
+                    (thread_id, checkpoint_ns, *batch)
+                ).rowcount
+
+        # Point the survivors at the previous surviving checkpoint
+        if doomed:
+            kept = sorted(keep)
+            with conn:
+                for parent, child in zip([None] + kept, kept):
+                    conn.execute(
+                        "UPDATE checkpoints SET parent_checkpoint_id = ? WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        (parent, thread_id, checkpoint_ns, child)
+                    )
+    return removed
+
+
+def expired_threads(conn, retention_days: float) -> list:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+    if has_table(conn, 'threads'):
+        return [row[0] for row in conn.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (cutoff,))]
+    # No catalog: fall back to the timestamp inside each thread's newest checkpoint
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    serde = JsonPlusSerializer()
+    expired = []
+    for thread_id, type_, blob in conn.execute(
+        """
+        SELECT c.thread_id, c.type, c.checkpoint FROM checkpoints c
+        JOIN (
+            SELECT thread_id, MAX(checkpoint_id) AS last_id FROM checkpoints
+            WHERE checkpoint_ns = '' GROUP BY thread_id
+        ) latest ON c.thread_id = latest.thread_id AND c.checkpoint_id = latest.last_id
+        WHERE c.checkpoint_ns = ''
+        """
+    ).fetchall():
+        try:
+            ts = serde.loads_typed(decode_checkpoint(type_, blob)[1:]).get('ts', '')
+        except Exception:
+            continue
+        if ts < cutoff:
+            expired.append(thread_id)
+    return expired
+
+
+def remove_thread(conn, thread_id: str, archive: bool) -> None:
+    """Delete a thread everywhere, copying it into the attached `archive` database first if asked"""
+    tables = [table for table in ('checkpoints', 'writes', 'threads') if has_table(conn, table)]
+    # The archived thread needs its messages too; main's copies go with the next garbage collection
+    hashes = list(referenced_messages(conn, thread_id)) if archive and has_table(conn, 'messages') else []
+    with conn:
+        for start in range(0, len(hashes), BATCH_SIZE):
+            batch = hashes[start:start + BATCH_SIZE]
+            conn.execute(
+                f"INSERT OR IGNORE INTO archive.messages SELECT * FROM main.messages WHERE hash IN ({','.join('?' * len(batch))})",
+                batch
+            )
+        for table in tables:
+            if archive:
+                conn.execute(f"INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE thread_id = ?", (thread_id,))
+            conn.execute(f"DELETE FROM main.{table} WHERE thread_id = ?", (thread_id,))
+        # Search rows are derived data: not archived (a saver rebuilds them when it opens the archive),
+        # and triggers drop them from the full-text index
+        if has_table(conn, 'message_text'):
+            conn.execute("DELETE FROM main.message_text WHERE thread_id = ?", (thread_id,))
+
+
+def attach_archive(conn, archive_path: str) -> None:
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    for table in ('checkpoints', 'writes', 'threads', 'messages'):
+        if has_table(conn, table):
+            schema = conn.execute(
+                "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            body = schema[schema.index('('):]
+            conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} {body}")
+    conn.commit()
+
+
+def incremental_vacuum(conn, full: bool = False, pause: float = 0.05) -> None:
+    """
+    Return free pages to the OS a few at a time. Switching a database to incremental
+    auto-vacuum needs one full VACUUM, which is only done when `full` is set.
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        if not full:
+            return
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        conn.commit()
+        time.sleep(pause)
+
+
+def compact(db_path: str = 'chat_history.db', keep_turns: int = 5, retention_days: Optional[float] = None,
+            archive_path: Optional[str] = None, vacuum: bool = False, full_vacuum: bool = False) -> dict:
+    """Run one compaction pass and return what it did, including bytes reclaimed"""
+    conn = connect(db_path)
+    try:
+        if not has_table(conn, 'checkpoints'):
+            return {'error': f"{db_path} has no checkpoints table"}
+        data_before = db_size(conn)
+        file_before = file_size(conn)
+        skip = active_threads(conn)
+
+        removed_threads = []
+        if retention_days is not None:
+            if archive_path:
+                attach_archive(conn, archive_path)
+            for thread_id in expired_threads(conn, retention_days):
+                if thread_id not in skip:
+                    remove_thread(conn, thread_id, archive=bool(archive_path))
+                    removed_threads.append(thread_id)
+
+        pruned = 0
+        threads = [row[0] for row in conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+        for thread_id in threads:
+            if thread_id not in skip:
+                pruned += prune_thread(conn, thread_id, keep_turns)
+        collected = collect_garbage(conn) if has_table(conn, 'messages') else 0
+
+        conn.execute("PRAGMA optimize")
+        conn.execute("ANALYZE")
+        conn.commit()
+        if vacuum or full_vacuum:
+            incremental_vacuum(conn, full=full_vacuum)
+
+        return {
+            'checkpoints_pruned': pruned,
+            'threads_removed': len(removed_threads),
+            'threads_archived': len(removed_threads) if archive_path else 0,
+            'messages_collected': collected,
+            'data_bytes_reclaimed': data_before - db_size(conn),
+            'file_bytes_reclaimed': file_before - file_size(conn)
+        }
+    finally:
+        conn.close()
+
+
+def start_background_compaction(db_path: str = 'chat_history.db', interval: float = 3600, **options) -> threading.Thread:
+    """
+    Run compact() every `interval` seconds on a daemon thread. Every worker process starts one,
+    but the lease lets only one of them run each pass; the others skip it.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                # min_gap: a pass another worker finished within this interval counts for us too
+                if not acquire_lease(db_path, owner, min_gap=interval / 2):
+                    continue
+                try:
+                    print(f"Checkpoint compaction: {compact(db_path, vacuum=True, **options)}")
+                finally:
+                    release_lease(db_path, owner)
+            except Exception as e:
+                print(f"Error compacting checkpoints: {e}")
+
+    thread = threading.Thread(target=loop, name='checkpoint-compaction', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='chat_history.db')
+    parser.add_argument('--keep-turns', type=int, default=5, help='end-of-turn snapshots kept per thread')
+    parser.add_argument('--retention-days', type=float, help='delete threads idle longer than this')
+    parser.add_argument('--archive', help='copy expired threads into this database before deleting them')
+    parser.add_argument('--vacuum', action='store_true', help='return free pages with incremental vacuum')
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help='switch the database to incremental auto-vacuum (one blocking VACUUM)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not acquire_lease(args.db, owner):
+        parser.error(f"another process is compacting {args.db}")
+    try:
+        report = compact(
+            args.db,
+            keep_turns=args.keep_turns,
+            retention_days=args.retention_days,
+            archive_path=args.archive,
+            vacuum=args.vacuum,
+            full_vacuum=args.full_vacuum
+        )
+    finally:
+        release_lease(args.db, owner)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
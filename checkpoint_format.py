@@ -0,0 +1,431 @@
+"""
+Packed storage format for checkpoints in chat_history.db.
+
+A plain SqliteSaver row holds the whole serialized state, so a thread's message history is
+stored again at every step. In the packed format:
+
+- each message is stored once in a `messages` table, keyed by the hash of its serialized bytes
+- a checkpoint row holds the rest of its state plus its message list as a delta on its parent
+  checkpoint (keep the parent's first `keep` messages, then append `add`). Every
+  KEYFRAME_INTERVAL-th checkpoint holds the full list, so a read follows at most that many rows
+- payloads are compressed with zstd (zlib when the zstandard package isn't installed)
+
+The row's `type` column tells the formats apart ('refs:zstd:msgpack', 'zstd:msgpack' or the
+plain 'msgpack'), so old and new rows can be read side by side. This script migrates an
+existing database in place:
+
+    python checkpoint_format.py --db chat_history.db
+    python checkpoint_format.py --db chat_history.db --vacuum
+"""
+from langchain_core.messages import BaseMessage
+from collections import OrderedDict
+from typing import Optional
+import threading
+import argparse
+import hashlib
+import sqlite3
+import struct
+import json
+import zlib
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC = 'zstd' if zstandard is not None else 'zlib'
+ZSTD_LEVEL = 3
+
+# Payloads smaller than this are stored uncompressed
+MIN_COMPRESS_BYTES = 128
+
+# Longest delta chain before a checkpoint stores its full message list again
+KEYFRAME_INTERVAL = int(os.getenv('CHECKPOINT_KEYFRAME_INTERVAL', 16))
+
+# Threads whose latest message list is kept in memory, so the next write only hashes new messages
+RECENT_THREADS = 256
+
+REFS = 'refs'
+BATCH_SIZE = 500
+
+MESSAGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    hash TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL
+);
+"""
+
+# zstd (de)compressors are not thread-safe
+_local = threading.local()
+
+
+def compress(data: bytes, codec: str = CODEC) -> bytes:
+    if codec == 'zstd':
+        if not hasattr(_local, 'compressor'):
+            _local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return _local.compressor.compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read zstd-compressed checkpoints")
+        if not hasattr(_local, 'decompressor'):
+            _local.decompressor = zstandard.ZstdDecompressor()
+        return _local.decompressor.decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown checkpoint codec {codec}")
+
+
+def pack(type_: str, data: bytes) -> tuple:
+    """(type, bytes) from a serializer -> (type, bytes) to store, compressed when it pays off"""
+    if len(data) < MIN_COMPRESS_BYTES:
+        return type_, data
+    return f"{CODEC}:{type_}", compress(data)
+
+
+def unpack(type_: str, data: bytes) -> tuple:
+    codec, _, inner = type_.partition(':')
+    if inner and codec in ('zstd', 'zlib'):
+        return inner, decompress(data, codec)
+    return type_, data
+
+
+def is_packed(type_: Optional[str]) -> bool:
+    return bool(type_) and (type_.startswith(REFS + ':') or type_.split(':', 1)[0] in ('zstd', 'zlib'))
+
+
+def message_hash(type_: str, data: bytes) -> str:
+    return hashlib.blake2b(type_.encode() + b'\0' + data, digest_size=16).hexdigest()
+
+
+def encode_checkpoint(type_: str, data: bytes, header: dict) -> tuple:
+    """Checkpoint row (type, blob): header length, JSON header, then the serialized state without messages"""
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+    return f"{REFS}:{CODEC}:{type_}", compress(struct.pack('>I', len(header_bytes)) + header_bytes + data)
+
+
+def decode_checkpoint(type_: str, blob: bytes) -> tuple:
+    """(header or None, serializer type, serialized bytes) of a checkpoint row in any format"""
+    if not type_ or not type_.startswith(REFS + ':'):
+        return (None, *unpack(type_, blob))
+    _, codec, inner = type_.split(':', 2)
+    raw = decompress(blob, codec)
+    size = struct.unpack('>I', raw[:4])[0]
+    return json.loads(raw[4:4 + size]), inner, raw[4 + size:]
+
+
+def message_rows(serde, messages: list, known: set) -> tuple:
+    """(hashes, [(hash, type, value)] for messages not in `known`)"""
+    hashes = []
+    rows = []
+    for msg in messages:
+        type_, data = serde.dumps_typed(msg)
+        digest = message_hash(type_, data)
+        hashes.append(digest)
+        if digest not in known:
+            known.add(digest)
+            rows.append((digest, *pack(type_, data)))
+    return hashes, rows
+
+
+def is_message_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(msg, BaseMessage) for msg in value)
+
+
+def resolve_hashes(cur, thread_id: str, checkpoint_ns: str, header: dict) -> list:
+    """Full message hash list of a checkpoint, following its delta chain back to a keyframe"""
+    chain = [header]
+    while chain[-1]['base'] is not None:
+        row = cur.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (str(thread_id), checkpoint_ns, chain[-1]['base'])
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Checkpoint {chain[-1]['base']} of thread {thread_id} is missing from its delta chain")
+        base_header = decode_checkpoint(*row)[0]
+        if base_header is None:
+            raise ValueError(f"Checkpoint {chain[-1]['base']} of thread {thread_id} is not in the packed format")
+        chain.append(base_header)
+    hashes = []
+    for link in reversed(chain):
+        hashes = hashes[:link['keep']] + link['add']
+    return hashes
+
+
+def load_messages(cur, serde, hashes: list, known: Optional[dict] = None) -> list:
+    """Messages for a hash list, in order; `known` (hash -> message) are reused instead of read"""
+    found = dict(known or {})
+    unique = [digest for digest in dict.fromkeys(hashes) if digest not in found]
+    for start in range(0, len(unique), BATCH_SIZE):
+        batch = unique[start:start + BATCH_SIZE]
+        marks = ','.join('?' * len(batch))
+        for digest, type_, value in cur.execute(f"SELECT hash, type, value FROM messages WHERE hash IN ({marks})", batch):
+            found[digest] = serde.loads_typed(unpack(type_, value))
+    missing = [digest for digest in unique if digest not in found]
+    if missing:
+        raise ValueError(f"{len(missing)} messages are missing from the messages table")
+    return [found[digest] for digest in hashes]
+
+
+def load_write(cur, serde, type_: str, value: bytes):
+    """Value of a `writes` row in any format"""
+    if type_ and type_.startswith(REFS + ':'):
+        messages = load_messages(cur, serde, json.loads(value))
+        return messages[0] if type_ == f"{REFS}:message" else messages
+    return serde.loads_typed(unpack(type_, value))
+
+
+def dump_write(serde, channel: str, value) -> tuple:
+    """(type, value, new message rows) for a `writes` row; message writes become hash references"""
+    if channel == 'messages' and (isinstance(value, BaseMessage) or (is_message_list(value) and value)):
+        single = isinstance(value, BaseMessage)
+        hashes, rows = message_rows(serde, [value] if single else value, set())
+        return f"{REFS}:message" if single else f"{REFS}:messages", json.dumps(hashes).encode(), rows
+    return (*pack(*serde.dumps_typed(value)), [])
+
+
+class CheckpointPacker:
+    """
+    Turns checkpoints into packed rows. The message list written last for each thread is
+    remembered (objects and hashes), so a step only serializes and hashes the messages it added.
+    """
+
+    def __init__(self, serde, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.serde = serde
+        self.keyframe_interval = keyframe_interval
+        self.recent = OrderedDict()  # (thread id, ns) -> (checkpoint id, depth, messages, hashes)
+        self.lock = threading.Lock()
+
+    def remember(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, depth: int, messages: list, hashes: list) -> None:
+        with self.lock:
+            self.recent[(str(thread_id), checkpoint_ns)] = (checkpoint_id, depth, list(messages), hashes)
+            self.recent.move_to_end((str(thread_id), checkpoint_ns))
+            while len(self.recent) > RECENT_THREADS:
+                self.recent.popitem(last=False)
+
+    def known_messages(self, thread_id: str, checkpoint_ns: str) -> dict:
+        """hash -> message of the thread's remembered list, so reads don't deserialize them again"""
+        with self.lock:
+            cached = self.recent.get((str(thread_id), checkpoint_ns))
+        return dict(zip(cached[3], cached[2])) if cached else {}
+
+    def forget(self, thread_id: str) -> None:
+        with self.lock:
+            for key in [key for key in self.recent if key[0] == str(thread_id)]:
+                del self.recent[key]
+
+    def pack(self, thread_id: str, checkpoint_ns: str, parent_id: Optional[str], checkpoint, load_parent) -> tuple:
+        """
+        (type, blob, new message rows) for a checkpoint. `load_parent()` returns the parent's
+        (hashes, depth) from the database and is only called when the parent isn't remembered.
+        """
+        channel_values = checkpoint.get('channel_values') or {}
+        messages = channel_values.get('messages')
+        if not is_message_list(messages):
+            return (*pack(*self.serde.dumps_typed(checkpoint)), [])
+
+        # The key stays (empty) so channel order survives the round trip
+        rest = {**checkpoint, 'channel_values': {**channel_values, 'messages': None}}
+        previous_messages, previous_hashes, depth = [], [], None
+        with self.lock:
+            cached = self.recent.get((str(thread_id), checkpoint_ns))
+        if parent_id is not None:
+            if cached is not None and cached[0] == parent_id:
+                _, depth, previous_messages, previous_hashes = cached
+            else:
+                loaded = load_parent()
+                if loaded is not None:
+                    previous_hashes, depth = loaded
+
+        # Messages carried over from the parent unchanged (same object) keep their hash
+        same = 0
+        while same < min(len(messages), len(previous_messages)) and messages[same] is previous_messages[same]:
+            same += 1
+        hashes, rows = message_rows(self.serde, messages[same:], set(previous_hashes))
+        hashes = previous_hashes[:same] + hashes
+
+        keep = 0
+        while keep < min(len(hashes), len(previous_hashes)) and hashes[keep] == previous_hashes[keep]:
+            keep += 1
+        if depth is None or depth + 1 >= self.keyframe_interval:
+            header = {'base': None, 'keep': 0, 'add': hashes, 'depth': 0}
+        else:
+            header = {'base': parent_id, 'keep': keep, 'add': hashes[keep:], 'depth': depth + 1}
+
+        self.remember(thread_id, checkpoint_ns, checkpoint['id'], header['depth'], messages, hashes)
+        return (*encode_checkpoint(*self.serde.dumps_typed(rest), header), rows)
+
+
+def insert_messages(cur, rows: list) -> None:
+    if rows:
+        cur.executemany("INSERT OR IGNORE INTO messages (hash, type, value) VALUES (?, ?, ?)", rows)
+
+
+# Maintenance helpers, used by checkpoint_compaction on a plain sqlite3 connection
+
+def rebase(conn, thread_id: str, checkpoint_ns: str, keep: set) -> int:
+    """
+    Before checkpoints outside `keep` are deleted: turn every kept checkpoint whose delta
+    chain runs through a doomed one into a keyframe. Returns how many were rewritten.
+    """
+    rows = conn.execute(
+        "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND type LIKE 'refs:%'",
+        (thread_id, checkpoint_ns)
+    ).fetchall()
+    headers = {checkpoint_id: decode_checkpoint(type_, blob) for checkpoint_id, type_, blob in rows}
+
+    def broken(checkpoint_id) -> bool:
+        header = headers[checkpoint_id][0]
+        while header['base'] is not None:
+            if header['base'] not in keep or header['base'] not in headers:
+                return True
+            header = headers[header['base']][0]
+        return False
+
+    rewritten = []
+    cur = conn.cursor()
+    for checkpoint_id in keep:
+        if checkpoint_id in headers and broken(checkpoint_id):
+            header, type_, data = headers[checkpoint_id]
+            hashes = resolve_hashes(cur, thread_id, checkpoint_ns, header)
+            rewritten.append((checkpoint_id, encode_checkpoint(type_, data, {'base': None, 'keep': 0, 'add': hashes, 'depth': 0})))
+    with conn:
+        for checkpoint_id, (type_, blob) in rewritten:
+            conn.execute(
+                "UPDATE checkpoints SET type = ?, checkpoint = ? WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (type_, blob, thread_id, checkpoint_ns, checkpoint_id)
+            )
+    return len(rewritten)
+
+
+def referenced_messages(conn, thread_id: Optional[str] = None) -> set:
+    """Hashes referenced by checkpoints and writes (of one thread, or of all)"""
+    where = " AND thread_id = ?" if thread_id is not None else ""
+    params = (thread_id,) if thread_id is not None else ()
+    hashes = set()
+    for type_, blob in conn.execute(f"SELECT type, checkpoint FROM checkpoints WHERE type LIKE 'refs:%'{where}", params):
+        hashes.update(decode_checkpoint(type_, blob)[0]['add'])
+    for (value,) in conn.execute(f"SELECT value FROM writes WHERE type LIKE 'refs:%'{where}", params):
+        hashes.update(json.loads(value))
+    return hashes
+
+
+def collect_garbage(conn) -> int:
+    """Delete messages no checkpoint or write refers to any more; returns how many"""
+    # Messages stored after this snapshot belong to writes still in progress, leave them alone
+    stored = [row[0] for row in conn.execute("SELECT hash FROM messages")]
+    used = referenced_messages(conn)
+    doomed = [digest for digest in stored if digest not in used]
+    for start in range(0, len(doomed), BATCH_SIZE):
+        batch = doomed[start:start + BATCH_SIZE]
+        with conn:
+            conn.execute(f"DELETE FROM messages WHERE hash IN ({','.join('?' * len(batch))})", batch)
+    return len(doomed)
+
+
+def migrate(db_path: str, keyframe_interval: int = KEYFRAME_INTERVAL) -> dict:
+    """Rewrite every plain checkpoint and write of a database in the packed format, one thread per transaction"""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    serde = JsonPlusSerializer()
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    try:
+        conn.executescript(MESSAGES_SCHEMA)
+        before = conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0] + \
+            conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+        converted = writes_converted = 0
+        namespaces = conn.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+        for thread_id, checkpoint_ns in namespaces:
+            packer = CheckpointPacker(serde, keyframe_interval)
+            rows = conn.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id",
+                (thread_id, checkpoint_ns)
+            ).fetchall()
+            known = {}  # checkpoint id -> (hashes, depth) of packed rows
+            updates = []
+            messages = []
+            cur = conn.cursor()
+            for checkpoint_id, parent_id, type_, blob in rows:
+                header, inner, data = decode_checkpoint(type_, blob)
+                if header is not None:
+                    known[checkpoint_id] = (resolve_hashes(cur, thread_id, checkpoint_ns, header), header['depth'])
+                    continue
+                if is_packed(type_):
+                    continue
+                checkpoint = serde.loads_typed((inner, data))
+                new_type, new_blob, new_messages = packer.pack(
+                    thread_id, checkpoint_ns, parent_id, checkpoint, lambda: known.get(parent_id)
+                )
+                cached = packer.recent.get((str(thread_id), checkpoint_ns))
+                if cached is not None and cached[0] == checkpoint['id']:
+                    known[checkpoint_id] = (cached[3], cached[1])
+                updates.append((new_type, new_blob, thread_id, checkpoint_ns, checkpoint_id))
+                messages.extend(new_messages)
+
+            write_updates = []
+            for task_id, idx, checkpoint_id, channel, type_, value in conn.execute(
+                "SELECT task_id, idx, checkpoint_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns)
+            ).fetchall():
+                if is_packed(type_) or type_ is None:
+                    continue
+                new_type, new_value, new_messages = dump_write(serde, channel, serde.loads_typed((type_, value)))
+                if new_type == type_:
+                    continue
+                write_updates.append((new_type, new_value, thread_id, checkpoint_ns, checkpoint_id, task_id, idx))
+                messages.extend(new_messages)
+
+            with conn:
+                insert_messages(conn, messages)
+                conn.executemany(
+                    "UPDATE checkpoints SET type = ?, checkpoint = ? WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    updates
+                )
+                conn.executemany(
+                    "UPDATE writes SET type = ?, value = ? WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND task_id = ? AND idx = ?",
+                    write_updates
+                )
+            converted += len(updates)
+            writes_converted += len(write_updates)
+
+        after = conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0] + \
+            conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0] + \
+            conn.execute("SELECT COALESCE(SUM(LENGTH(value) + LENGTH(hash)), 0) FROM messages").fetchone()[0]
+        return {
+            'checkpoints_converted': converted,
+            'writes_converted': writes_converted,
+            'messages_stored': conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0],
+            'payload_bytes_before': before,
+            'payload_bytes_after': after
+        }
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='chat_history.db')
+    parser.add_argument('--keyframe-interval', type=int, default=KEYFRAME_INTERVAL)
+    parser.add_argument('--vacuum', action='store_true', help='rebuild the file afterwards to return the freed space')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    report = migrate(args.db, keyframe_interval=args.keyframe_interval)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if args.vacuum:
+        conn = sqlite3.connect(args.db)
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"file_bytes: {os.path.getsize(args.db)}")
+
+
+if __name__ == '__main__':
+    main()
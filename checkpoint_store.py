@@ -0,0 +1,532 @@
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.utils import pending_writes_sql, search_where, writes_sort_key
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver, CheckpointTuple, WRITES_IDX_MAP, get_checkpoint_id, get_checkpoint_metadata
+)
+from checkpoint_format import (
+    MESSAGES_SCHEMA, CheckpointPacker, decode_checkpoint, dump_write, insert_messages,
+    load_messages, load_write, resolve_hashes
+)
+from message_search import SEARCH_SCHEMA, index_messages, remove_thread_messages, search_messages
+from message_utils import thread_title
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Optional
+import threading
+import sqlite3
+import asyncio
+import queue
+import json
+import time
+import os
+
+# New checkpoints are written in the packed format (messages stored once, deltas, zstd);
+# CHECKPOINT_FORMAT=plain writes rows the stock SqliteSaver can read. Both are always readable.
+PACKED_CHECKPOINTS = os.getenv('CHECKPOINT_FORMAT', 'packed') != 'plain'
+
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    title TEXT NOT NULL DEFAULT 'New Chat'
+);
+CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at DESC);
+"""
+
+# How long (ms) a process opening the database waits for another one that is still filling
+# the catalog and search index of an existing database
+SETUP_BUSY_TIMEOUT = 600000
+
+
+def statements(script: str) -> list:
+    """The SQL statements of a script, triggers' inner statements kept with their trigger"""
+    found = []
+    current = ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            found.append(current.strip())
+            current = ''
+    return found
+
+
+class ThreadCatalogSaver(SqliteSaver):
+    """
+    SqliteSaver that also keeps a `threads` catalog table next to the checkpoint tables.
+    The catalog holds one row per thread (timestamps, message count, cached title) and is
+    updated in the same transaction as every checkpoint write, so listing threads is an
+    indexed query instead of a scan over every checkpoint. The same write adds the thread's
+    new messages to a full-text index (message_search.py).
+    Checkpoints are stored in the packed format of checkpoint_format.py unless `packed` is off.
+    """
+
+    def __init__(self, conn, *, serde=None, packed: bool = PACKED_CHECKPOINTS):
+        super().__init__(conn, serde=serde)
+        self.packed = packed
+        self.packer = CheckpointPacker(self.serde)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.commit()
+
+        # Workers starting together on an existing database would each see the tables missing and
+        # backfill them; one write transaction from the check to the end of the backfill lets only
+        # the first do it, while the others wait (for up to SETUP_BUSY_TIMEOUT) and then find them
+        busy_timeout = self.conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        self.conn.execute(f"PRAGMA busy_timeout = {max(busy_timeout, SETUP_BUSY_TIMEOUT)}")
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                catalog_created = self._missing('threads')
+                search_created = self._missing('message_text')
+                # executescript() would commit first, so the schema goes one statement at a time
+                for statement in statements(CATALOG_SCHEMA + MESSAGES_SCHEMA + SEARCH_SCHEMA):
+                    self.conn.execute(statement)
+                # Databases written before the catalog / search index existed get them filled once
+                if catalog_created or search_created:
+                    self._backfill(catalog=catalog_created, search=search_created)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        finally:
+            self.conn.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+
+    def _missing(self, table: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone() is None
+
+    def _backfill(self, catalog: bool, search: bool) -> None:
+        """Populate the catalog and/or search index from the latest root checkpoint of every existing thread"""
+        rows = self.conn.execute(
+            """
+            SELECT span.thread_id, last.checkpoint_id, last.type, last.checkpoint, first.type, first.checkpoint
+            FROM (
+                SELECT thread_id, MIN(checkpoint_id) AS first_id, MAX(checkpoint_id) AS last_id
+                FROM checkpoints WHERE checkpoint_ns = '' GROUP BY thread_id
+            ) span
+            JOIN checkpoints last ON last.thread_id = span.thread_id
+                AND last.checkpoint_ns = '' AND last.checkpoint_id = span.last_id
+            JOIN checkpoints first ON first.thread_id = span.thread_id
+                AND first.checkpoint_ns = '' AND first.checkpoint_id = span.first_id
+            """
+        ).fetchall()
+        cur = self.conn.cursor()
+        for thread_id, last_id, last_type, last_blob, first_type, first_blob in rows:
+            try:
+                checkpoint = self._load_checkpoint(cur, thread_id, '', last_id, last_type, last_blob)
+                first = self.serde.loads_typed(decode_checkpoint(first_type, first_blob)[1:])
+            except Exception as e:
+                print(f"Error indexing thread {thread_id}: {e}")
+                continue
+            if catalog:
+                self._upsert_thread(cur, thread_id, checkpoint, created_at=first.get('ts'))
+            if search:
+                index_messages(cur, thread_id, checkpoint['channel_values'].get('messages') or [])
+
+    def _upsert_thread(self, cur, thread_id: str, checkpoint, created_at: Optional[str] = None) -> None:
+        messages = checkpoint.get('channel_values', {}).get('messages') or []
+        ts = checkpoint['ts']
+        cur.execute(
+            """
+            INSERT INTO threads (thread_id, created_at, updated_at, message_count, title)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                message_count = excluded.message_count,
+                title = excluded.title
+            """,
+            (str(thread_id), created_at or ts, ts, len(messages), thread_title(messages)),
+        )
+
+    def _load_checkpoint(self, cur, thread_id: str, checkpoint_ns: str, checkpoint_id: str, type_: str, blob: bytes,
+                         remember: bool = False):
+        """Deserialize a checkpoint row in either format, putting its messages back together"""
+        header, inner_type, data = decode_checkpoint(type_, blob)
+        checkpoint = self.serde.loads_typed((inner_type, data))
+        if header is not None:
+            hashes = resolve_hashes(cur, thread_id, checkpoint_ns, header)
+            # Messages this process wrote or read for the thread recently are reused as they are
+            messages = load_messages(cur, self.serde, hashes, self.packer.known_messages(thread_id, checkpoint_ns))
+            checkpoint['channel_values']['messages'] = messages
+            if remember:
+                self.packer.remember(thread_id, checkpoint_ns, checkpoint_id, header['depth'], messages, hashes)
+        return checkpoint
+
+    def _load_tuple(self, cur, thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, blob, metadata,
+                    remember: bool = False) -> CheckpointTuple:
+        checkpoint = self._load_checkpoint(cur, thread_id, checkpoint_ns, checkpoint_id, type_, blob, remember)
+        writes = cur.execute(pending_writes_sql(self._has_task_path), (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        writes.sort(key=lambda row: writes_sort_key(row[4], row[0], row[5]))
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint,
+            json.loads(metadata) if metadata is not None else {},
+            (
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id
+                else None
+            ),
+            [(task_id, channel, load_write(cur, self.serde, type_, value)) for task_id, channel, type_, value, _, _ in writes],
+        )
+
+    def get_tuple(self, config):
+        """The requested (or latest) checkpoint of a thread, in either storage format"""
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.cursor(transaction=False) as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                cur.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                cur.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            # The latest checkpoint is what the next write builds on; remember its messages
+            return self._load_tuple(cur, thread_id, checkpoint_ns, *row, remember=not get_checkpoint_id(config))
+
+    def get_messages(self, thread_id: str, start: int = 0, end: Optional[int] = None) -> tuple:
+        """
+        (messages[start:end], total message count) of a thread's latest checkpoint. Packed
+        checkpoints only load the messages in the slice; plain ones are deserialized whole.
+        """
+        thread_id = str(thread_id)
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id,),
+            ).fetchone()
+            if row is None:
+                return [], 0
+            header, inner_type, data = decode_checkpoint(*row)
+            if header is None:
+                messages = self.serde.loads_typed((inner_type, data))['channel_values'].get('messages', [])
+                return messages[start:end], len(messages)
+            hashes = resolve_hashes(cur, thread_id, '', header)
+            known = self.packer.known_messages(thread_id, '')
+            return load_messages(cur, self.serde, hashes[start:end], known), len(hashes)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """Checkpoints newest first, in either storage format"""
+        where, params = search_where(config, filter, before)
+        query = f"""SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata
+        FROM checkpoints {where} ORDER BY checkpoint_id DESC"""
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (*params, limit)
+        with self.cursor(transaction=False) as cur:
+            rows = cur.execute(query, params).fetchall()
+            for row in rows:
+                yield self._load_tuple(cur, *row)
+
+    def get_delta_channel_history(self, *, config, channels):
+        # SqliteSaver's fast path reads checkpoint blobs directly; the generic walk goes through get_tuple
+        return BaseCheckpointSaver.get_delta_channel_history(self, config=config, channels=channels)
+
+    def _parent_hashes(self, thread_id: str, checkpoint_ns: str, parent_id: str):
+        """(message hashes, delta depth) of a stored packed checkpoint, None for other formats"""
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (str(thread_id), checkpoint_ns, parent_id),
+            ).fetchone()
+            header = decode_checkpoint(*row)[0] if row else None
+            if header is None:
+                return None
+            return resolve_hashes(cur, thread_id, checkpoint_ns, header), header['depth']
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        """Save a checkpoint and refresh the thread's catalog row in one transaction"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        if self.packed:
+            type_, serialized_checkpoint, messages = self.packer.pack(
+                thread_id, checkpoint_ns, parent_id, checkpoint,
+                lambda: self._parent_hashes(thread_id, checkpoint_ns, parent_id)
+            )
+        else:
+            type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+            messages = []
+        serialized_metadata = json.dumps(
+            get_checkpoint_metadata(config, metadata), ensure_ascii=False
+        ).encode("utf-8", "ignore")
+
+        def write(cur):
+            # Messages first: the checkpoint refers to them
+            insert_messages(cur, messages)
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(thread_id),
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    parent_id,
+                    type_,
+                    serialized_checkpoint,
+                    serialized_metadata,
+                ),
+            )
+            # Subgraph checkpoints don't change what the sidebar shows or what search finds
+            if checkpoint_ns == '':
+                self._upsert_thread(cur, thread_id, checkpoint)
+                index_messages(cur, thread_id, checkpoint.get('channel_values', {}).get('messages') or [])
+
+        self._write(write)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config, writes, task_id, task_path=''):
+        """Store intermediate writes linked to a checkpoint"""
+        query = (
+            "INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            if all(w[0] in WRITES_IDX_MAP for w in writes)
+            else "INSERT OR IGNORE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        rows = []
+        messages = []
+        for idx, (channel, value) in enumerate(writes):
+            if self.packed:
+                type_, serialized, new_messages = dump_write(self.serde, channel, value)
+                messages.extend(new_messages)
+            else:
+                type_, serialized = self.serde.dumps_typed(value)
+            rows.append((
+                str(config["configurable"]["thread_id"]),
+                str(config["configurable"]["checkpoint_ns"]),
+                str(config["configurable"]["checkpoint_id"]),
+                task_id,
+                task_path,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                serialized,
+            ))
+
+        def write(cur):
+            insert_messages(cur, messages)
+            cur.executemany(query, rows)
+
+        self._write(write)
+
+    def _write(self, write) -> None:
+        """Run `write(cursor)` in its own transaction"""
+        with self.cursor() as cur:
+            write(cur)
+
+    def delete_thread(self, thread_id: str) -> None:
+        # Its messages stay in the messages table until checkpoint_compaction collects them
+        super().delete_thread(thread_id)
+        self.packer.forget(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM threads WHERE thread_id = ?", (str(thread_id),))
+            remove_thread_messages(cur, thread_id)
+
+    def list_threads(self, limit: Optional[int] = None, offset: int = 0, newest_first: bool = True,
+                     search: Optional[str] = None) -> list:
+        """Page through the thread catalog ordered by last activity, optionally only titles containing `search`"""
+        order = 'DESC' if newest_first else 'ASC'
+        where = ''
+        params = []
+        if search:
+            where = "WHERE title LIKE ? ESCAPE '\\'"
+            params.append('%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                f"""
+                SELECT thread_id, created_at, updated_at, message_count, title
+                FROM threads {where} ORDER BY updated_at {order} LIMIT ? OFFSET ?
+                """,
+                (*params, -1 if limit is None else limit, offset),
+            )
+            rows = cur.fetchall()
+        return [
+            {
+                'thread_id': thread_id,
+                'created_at': created_at,
+                'updated_at': updated_at,
+                'message_count': message_count,
+                'title': title,
+            }
+            for thread_id, created_at, updated_at, message_count, title in rows
+        ]
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Threads with messages matching `query`, best first, with highlighted snippets"""
+        with self.cursor(transaction=False) as cur:
+            return search_messages(cur, query, limit=limit)
+
+    def count_threads(self) -> int:
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(*) FROM threads")
+            return cur.fetchone()[0]
+
+    # Async interface for workflow.ainvoke / astream. The sqlite calls are short, so they run
+    # on the default executor and the catalog logic above stays in one place.
+    async def aget_tuple(self, config):
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(self, config, writes, task_id, task_path=''):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put_writes, config, writes, task_id, task_path
+        )
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.delete_thread, thread_id)
+
+
+# Pragmas applied to every pooled connection: WAL lets readers run alongside the writer,
+# NORMAL sync is durable in WAL mode except across power loss, busy_timeout waits out locks.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+class PooledCatalogSaver(ThreadCatalogSaver):
+    """
+    ThreadCatalogSaver for many concurrent sessions.
+    Reads borrow a connection from a bounded pool instead of sharing one connection behind a
+    global lock, and all writes go through a single writer thread that group-commits
+    whatever checkpoints arrived together into one transaction. Callers still return only
+    after their own write has been committed.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 8, max_batch: int = 64, batch_window: float = 0.0, serde=None,
+                 packed: bool = PACKED_CHECKPOINTS):
+        self.db_path = db_path
+        self.pool = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+        super().__init__(conn=self._connect(), serde=serde, packed=packed)
+        with self.lock:
+            self.setup()
+
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.write_queue = queue.Queue()
+        # Set once the writer thread has died; guarded by write_lock so no write is queued after
+        # the writer drained the queue on its way out
+        self.writer_error: Optional[BaseException] = None
+        self.write_lock = threading.Lock()
+        self.writer = threading.Thread(target=self._writer_loop, name='checkpoint-writer', daemon=True)
+        self.writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        conn = self.pool.get()
+        cur = conn.cursor()
+        try:
+            yield cur
+            if transaction:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            self.pool.put(conn)
+
+    def _write(self, write) -> None:
+        done = Future()
+        with self.write_lock:
+            if self.writer_error is not None:
+                raise RuntimeError('checkpoint writer has stopped') from self.writer_error
+            self.write_queue.put((write, done))
+        done.result()
+
+    def _writer_loop(self) -> None:
+        batch = []
+        try:
+            self._write_batches(batch)
+        except BaseException as e:
+            # Don't leave callers blocked on done.result(): fail the batch in flight, everything
+            # still queued, and (via writer_error) every later write
+            with self.write_lock:
+                self.writer_error = e
+            while True:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _, done in batch:
+                if not done.done():
+                    done.set_exception(RuntimeError('checkpoint writer has stopped'))
+            raise
+
+    def _write_batches(self, batch: list) -> None:
+        # self.conn is only ever used by this thread from here on
+        conn = self.conn
+        while True:
+            batch.clear()
+            # Whatever queued up while the previous commit ran goes into the next one;
+            # batch_window optionally waits a little longer for stragglers
+            batch.append(self.write_queue.get())
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        batch.append(self.write_queue.get(timeout=remaining))
+                    else:
+                        batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                cur = conn.cursor()
+                for write, _ in batch:
+                    write(cur)
+                conn.commit()
+                for _, done in batch:
+                    done.set_result(None)
+            except Exception:
+                conn.rollback()
+                # Replay one by one so a bad write only fails its own caller
+                for write, done in batch:
+                    try:
+                        write(conn.cursor())
+                        conn.commit()
+                        done.set_result(None)
+                    except Exception as e:
+                        conn.rollback()
+                        done.set_exception(e)
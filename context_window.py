@@ -0,0 +1,148 @@
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from message_utils import message_text
+import json
+import os
+
+# Approximate token budget for the history sent to the model on each turn
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 6000))
+
+# Tool outputs from earlier turns are cut down to this many characters
+TOOL_OUTPUT_CHARS = int(os.getenv('TOOL_OUTPUT_CHARS', 600))
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant.\n"
+    "Update the summary with the new messages below. Keep names, numbers, decisions, "
+    "open questions and facts the assistant looked up; drop pleasantries. "
+    "Answer with the updated summary only.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+
+def estimate_tokens(msg) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    size = len(message_text(msg))
+    for tool_call in getattr(msg, 'tool_calls', None) or []:
+        size += len(json.dumps(tool_call.get('args', {})))
+    return size // 4 + 4
+
+
+def shorten_tool_output(msg):
+    """Copy of a ToolMessage with its payload truncated"""
+    content = message_text(msg)
+    if len(content) <= TOOL_OUTPUT_CHARS:
+        return msg
+    return msg.model_copy(update={
+        'content': content[:TOOL_OUTPUT_CHARS] + f"... [truncated {len(content) - TOOL_OUTPUT_CHARS} characters]"
+    })
+
+
+def last_turn_start(messages) -> int:
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return i
+    return 0
+
+
+def prompt_messages(state, budget: int = HISTORY_TOKEN_BUDGET) -> list:
+    """
+    What the chat node sends to the model: the running summary, then the messages not yet
+    folded into it, with tool outputs of earlier turns truncated. If that is still over the
+    budget (e.g. summarizing failed), the oldest turns are left out; the latest turn always stays.
+    """
+    live = state['messages'][state.get('summarized', 0):]
+    current = last_turn_start(live)
+    prompt = [
+        shorten_tool_output(msg) if isinstance(msg, ToolMessage) and i < current else msg
+        for i, msg in enumerate(live)
+    ]
+    total = sum(estimate_tokens(msg) for msg in prompt)
+    while total > budget:
+        later_turn = next((i for i, msg in enumerate(prompt) if i > 0 and isinstance(msg, HumanMessage)), None)
+        if later_turn is None:
+            break
+        total -= sum(estimate_tokens(msg) for msg in prompt[:later_turn])
+        prompt = prompt[later_turn:]
+
+    if state.get('summary'):
+        prompt.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}"))
+    return prompt
+
+
+def plan_compaction(state, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Decide which messages to fold into the summary. Returns (start, end) indices into
+    state['messages'], or None while the history still fits the budget. Cuts only at the
+    start of a user turn so tool calls never lose their tool results, and keeps at least
+    the latest turn verbatim.
+    """
+    messages = state['messages']
+    start = state.get('summarized', 0)
+    sizes = [estimate_tokens(msg) for msg in messages[start:]]
+    if sum(sizes) <= budget:
+        return None
+
+    # Aim for half the budget so compaction doesn't run again on the very next turn
+    target = budget // 2
+    remaining = sum(sizes)
+    cut = None
+    for i in range(1, len(sizes)):
+        remaining -= sizes[i - 1]
+        if isinstance(messages[start + i], HumanMessage):
+            cut = i
+            if remaining <= target:
+                break
+    if cut is None:
+        return None
+    return start, start + cut
+
+
+def summary_request(state, span) -> list:
+    start, end = span
+    lines = []
+    for msg in state['messages'][start:end]:
+        if isinstance(msg, ToolMessage):
+            msg = shorten_tool_output(msg)
+        text = message_text(msg).strip()
+        if text:
+            lines.append(f"{msg.type}: {text}")
+    return [HumanMessage(content=SUMMARY_PROMPT.format(
+        summary=state.get('summary') or "(empty)",
+        messages="\n".join(lines)
+    ))]
+
+
+def make_compaction_node(model, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Graph node that keeps the prompt within `budget` tokens by folding the oldest turns into
+    an incrementally updated summary. The summary and how many messages it covers are kept
+    in the checkpointed state; the messages themselves stay, so the full history can still
+    be shown in the UI. `model` may also be a function returning the model, so it is only
+    created once a summary is actually needed.
+    """
+    get_model = (lambda: model) if hasattr(model, 'invoke') else model
+
+    def compact(state):
+        span = plan_compaction(state, budget)
+        if span is None:
+            return {}
+        try:
+            response = get_model().invoke(summary_request(state, span))
+        except Exception as e:
+            # The prompt is still trimmed to the budget, just without the summary update
+            print(f"Error summarizing history: {e}")
+            return {}
+        return {'summary': message_text(response).strip(), 'summarized': span[1]}
+
+    async def acompact(state):
+        span = plan_compaction(state, budget)
+        if span is None:
+            return {}
+        try:
+            response = await get_model().ainvoke(summary_request(state, span))
+        except Exception as e:
+            print(f"Error summarizing history: {e}")
+            return {}
+        return {'summary': message_text(response).strip(), 'summarized': span[1]}
+
+    return RunnableLambda(compact, afunc=acompact)
@@ -0,0 +1,12 @@
+import sqlite3
+
+
+def connect(db_path: str, timeout: float = 5) -> sqlite3.Connection:
+    """
+    Connection, usable from any thread, to a database that several backend processes share
+    (ingestion jobs, document attachments).
+    """
+    # timeout is SQLite's busy timeout: wait out other processes' writes instead of failing
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    return conn
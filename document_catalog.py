@@ -0,0 +1,49 @@
+from db_utils import connect
+from typing import Optional
+import threading
+import time
+
+# Which uploaded documents (index cache keys) are attached to which thread. The vectors are
+# in the on-disk index cache; this table is what lets every backend process rebuild the same
+# per-thread view of them.
+DOCUMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_documents (
+    thread_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    filename TEXT,
+    attached_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, key)
+);
+"""
+
+
+class DocumentCatalog:
+    """Thread -> attached documents, shared through SQLite by all processes using the same file"""
+
+    def __init__(self, db_path: str):
+        self.conn = connect(db_path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(DOCUMENTS_SCHEMA)
+
+    def attach(self, thread_id: str, key: str, filename: Optional[str] = None) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO thread_documents (thread_id, key, filename, attached_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (thread_id, key) DO UPDATE SET filename = COALESCE(thread_documents.filename, excluded.filename)
+                """,
+                (str(thread_id), key, filename, time.time())
+            )
+
+    def detach(self, thread_id: str, key: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM thread_documents WHERE thread_id = ? AND key = ?", (str(thread_id), key))
+
+    def documents(self, thread_id: str) -> dict:
+        """key -> filename of the thread's documents, in the order they were attached"""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT key, filename FROM thread_documents WHERE thread_id = ? ORDER BY attached_at",
+                (str(thread_id),)
+            ))
@@ -0,0 +1,226 @@
+from collections import defaultdict
+from urllib.parse import urlsplit
+from metrics import Histogram
+from typing import Optional
+import threading
+import weakref
+import asyncio
+import random
+import time
+import requests
+import httpx
+import os
+
+# Connect/read timeouts (seconds) for every outbound tool request
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+
+# Concurrent requests allowed per upstream host
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', 8))
+
+# Retries on 429/5xx and connection errors, with full-jitter exponential backoff
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 8))
+
+# Consecutive failures that open a host's circuit, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 5))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 30))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Keep-alive pool shared by the sync tools
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_MAX_PER_HOST))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_MAX_PER_HOST))
+
+# httpx clients and asyncio semaphores are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+_async_limits = weakref.WeakKeyDictionary()
+
+_lock = threading.Lock()
+_host_limits = {}
+_breakers = {}
+
+# Per tool: latency histogram and error counts by kind
+LATENCY = defaultdict(Histogram)
+ERRORS = defaultdict(lambda: defaultdict(int))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"upstream returned {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast while a host keeps failing; lets one trial request through after BREAKER_RESET"""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before(self, host: str) -> None:
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset:
+                raise CircuitOpenError(f"{host} is unavailable, not retrying for now")
+            # Half-open: this caller is the trial, the rest keep failing fast
+            self.opened_at = time.monotonic()
+
+    def success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _breaker(host: str) -> CircuitBreaker:
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+
+def _host_limit(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+        return _host_limits[host]
+
+
+def _async_host_limit(host: str) -> asyncio.Semaphore:
+    limits = _async_limits.setdefault(asyncio.get_running_loop(), {})
+    if host not in limits:
+        limits[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return limits[host]
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=8)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, HTTP_BACKOFF_MAX))
+    return delay
+
+
+def _record(tool: str, started: float, error: Optional[Exception]) -> None:
+    LATENCY[tool].observe(time.perf_counter() - started)
+    if error is not None:
+        ERRORS[tool][type(error).__name__] += 1
+
+
+def get_json(url: str, tool: str = 'http') -> dict:
+    """GET a JSON payload through the shared pool, limits, retries and circuit breaker"""
+    host = _host(url)
+    breaker = _breaker(host)
+    started = time.perf_counter()
+    error = None
+    try:
+        for attempt in range(HTTP_RETRIES + 1):
+            breaker.before(host)
+            try:
+                with _host_limit(host):
+                    r = session.get(url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+                if r.status_code in RETRY_STATUS:
+                    raise RetryableStatus(r.status_code, _retry_after(r.headers))
+                r.raise_for_status()
+                payload = r.json()
+                breaker.success()
+                return payload
+            except (RetryableStatus, requests.ConnectionError, requests.Timeout) as e:
+                breaker.failure()
+                if attempt == HTTP_RETRIES:
+                    raise
+                time.sleep(_backoff(attempt, getattr(e, 'retry_after', None)))
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _record(tool, started, error)
+
+
+async def aget_json(url: str, tool: str = 'http') -> dict:
+    """Async variant of get_json"""
+    host = _host(url)
+    breaker = _breaker(host)
+    started = time.perf_counter()
+    error = None
+    try:
+        for attempt in range(HTTP_RETRIES + 1):
+            breaker.before(host)
+            try:
+                async with _async_host_limit(host):
+                    r = await get_async_client().get(url)
+                if r.status_code in RETRY_STATUS:
+                    raise RetryableStatus(r.status_code, _retry_after(r.headers))
+                r.raise_for_status()
+                payload = r.json()
+                breaker.success()
+                return payload
+            except (RetryableStatus, httpx.TransportError) as e:
+                breaker.failure()
+                if attempt == HTTP_RETRIES:
+                    raise
+                await asyncio.sleep(_backoff(attempt, getattr(e, 'retry_after', None)))
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _record(tool, started, error)
+
+
+def http_metrics() -> dict:
+    """
+    Latency (count, total seconds and bucket-bound quantiles), error counts and circuit state,
+    per tool / host; the full histograms are in instrumentation.render_prometheus()
+    """
+    with _lock:
+        breakers = {
+            host: 'open' if breaker.opened_at is not None else 'closed'
+            for host, breaker in _breakers.items()
+        }
+    return {
+        'latency': {
+            tool: {'count': histogram.count, 'sum': histogram.sum, 'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95)}
+            for tool, histogram in list(LATENCY.items())
+        },
+        'errors': {tool: dict(counts) for tool, counts in list(ERRORS.items())},
+        'circuits': breakers
+    }
@@ -0,0 +1,129 @@
+from collections import defaultdict, Counter
+from typing import Optional
+import threading
+import math
+import time
+import re
+import os
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant: higher flattens the difference between ranks
+RRF_K = 60
+
+# Cross-encoder used to rerank fused candidates; empty disables reranking
+RERANK_MODEL = os.getenv('RERANK_MODEL', '')
+# CPU time reranking may take per query; candidates beyond what fits keep their fused order
+RERANK_BUDGET_MS = float(os.getenv('RERANK_BUDGET_MS', 150))
+
+# Words joined by - _ . / stay together as one token (part numbers, versions, file names)
+TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        tokens.append(token)
+        # "x-4821" also matches queries that write "X 4821" or just "4821"
+        if not token.isalnum():
+            tokens.extend(re.split(r"[-_./]", token))
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring, updated one chunk at a time"""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {chunk id: term frequency}
+        self.lengths = {}  # chunk id -> number of tokens
+        self.total_length = 0
+
+    def add(self, chunk_id: int, text: str) -> None:
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings[term][chunk_id] = tf
+        self.lengths[chunk_id] = sum(counts.values())
+        self.total_length += self.lengths[chunk_id]
+
+    def remove(self, chunk_id: int, text: str) -> None:
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(chunk_id, 0)
+
+    def search(self, query: str, k: int, allowed: Optional[set] = None) -> list:
+        """[(chunk id, score)] best first, restricted to `allowed` chunk ids"""
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average = self.total_length / count
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(*rankings, k: int = RRF_K) -> list:
+    """Merge ranked id lists; ids ranked well by several retrievers rise to the top"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class Reranker:
+    """
+    Local cross-encoder that rescores (query, chunk) pairs, limited to a per-query CPU budget.
+    The cost per pair is learned from previous calls, so only as many candidates as fit the
+    budget are scored; the model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.budget = budget_ms / 1000
+        self.model = None
+        self.lock = threading.Lock()
+        self.seconds_per_pair = None
+
+    def _load(self):
+        with self.lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name, device='cpu')
+        return self.model
+
+    def rerank(self, query: str, candidates: list, text) -> list:
+        """`candidates` in fused order, `text(candidate)` gives the chunk text"""
+        if self.seconds_per_pair is None:
+            # First call: score a few to measure the cost
+            fit = min(len(candidates), 8)
+        else:
+            fit = min(len(candidates), int(self.budget / self.seconds_per_pair))
+        if fit < 2:
+            return candidates
+
+        model = self._load()
+        started = time.perf_counter()
+        scores = model.predict([(query, text(candidate)) for candidate in candidates[:fit]])
+        elapsed = time.perf_counter() - started
+        per_pair = elapsed / fit
+        self.seconds_per_pair = per_pair if self.seconds_per_pair is None else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+
+        reranked = [candidate for _, candidate in sorted(zip(scores, candidates[:fit]), key=lambda pair: pair[0], reverse=True)]
+        return reranked + candidates[fit:]
@@ -0,0 +1,147 @@
+from langchain_core.embeddings import Embeddings
+from typing import Optional
+import numpy as np
+import threading
+import hashlib
+import tempfile
+import sqlite3
+import shutil
+import faiss
+import json
+import os
+
+# Directory where FAISS indexes are persisted, one sub-directory per cache key
+INDEX_CACHE_DIR = os.getenv('INDEX_CACHE_DIR', 'faiss_cache')
+
+# Indexes are opened memory-mapped so the vectors are paged in by the OS on demand
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+def cache_key(file_bytes: bytes, config: dict) -> str:
+    """
+    Content address of an index: the document bytes plus everything that changes
+    the resulting vectors (splitter settings, embedding model).
+    """
+    digest = hashlib.sha256(file_bytes)
+    digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def index_path(key: str) -> str:
+    return os.path.join(INDEX_CACHE_DIR, key)
+
+
+def load_summary(key: str) -> Optional[dict]:
+    """What was recorded about a cached index (pages, chunks), without opening the index"""
+    try:
+        with open(os.path.join(index_path(key), 'summary.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def load_index(key: str, embeddings, mmap: bool = True) -> Optional[tuple]:
+    """Open a cached index; returns (vectorstore, summary) or None on a miss"""
+    from langchain_community.vectorstores import FAISS
+    path = index_path(key)
+    try:
+        with open(os.path.join(path, 'summary.json')) as f:
+            summary = json.load(f)
+        vectorstore = FAISS.load_local(
+            path,
+            embeddings,
+            allow_dangerous_deserialization=True,  # only ever reads files we wrote ourselves
+            io_flags=MMAP_FLAGS if mmap else 0
+        )
+        return vectorstore, summary
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading cached index {key}: {e}")
+        return None
+
+
+def save_index(key: str, vectorstore, summary: dict) -> None:
+    """Persist an index atomically so concurrent readers never see a partial write"""
+    os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=INDEX_CACHE_DIR, prefix='.tmp-')
+    try:
+        vectorstore.save_local(tmp_path)
+        with open(os.path.join(tmp_path, 'summary.json'), 'w') as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, index_path(key))
+    except OSError:
+        # Another process already stored the same content
+        if not os.path.isdir(index_path(key)):
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# Vectors of every chunk embedded so far, keyed by model and content hash, shared by all processes
+EMBEDDING_CACHE_DB = os.getenv('EMBEDDING_CACHE_DB', os.path.join(INDEX_CACHE_DIR, 'embeddings.db'))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends text it has never seen to the model.
+    A chunk that appears in several documents (or is uploaded again with different
+    surrounding bytes) is embedded once; later calls read the vector from SQLite.
+    """
+
+    def __init__(self, embeddings, model: str, db_path: str = EMBEDDING_CACHE_DB):
+        self.embeddings = embeddings
+        self.model = model
+        self.db_path = db_path
+        # build_index embeds on a thread pool, so each thread gets its own connection
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+            )
+            self.local.conn = conn
+        return conn
+
+    def embed_documents(self, texts: list) -> list:
+        hashes = [content_hash(text) for text in texts]
+        conn = self._conn()
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            marks = ','.join('?' * len(batch))
+            for digest, blob in conn.execute(
+                f"SELECT hash, vector FROM vectors WHERE model = ? AND hash IN ({marks})", (self.model, *batch)
+            ):
+                found[digest] = np.frombuffer(blob, dtype='float32').tolist()
+
+        missing = {digest: text for digest, text in zip(hashes, texts) if digest not in found}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO vectors (model, hash, vector) VALUES (?, ?, ?)",
+                    [(self.model, digest, np.asarray(vector, dtype='float32').tobytes())
+                     for digest, vector in zip(missing, vectors)]
+                )
+            found.update(zip(missing, vectors))
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [list(found[digest]) for digest in hashes]
+
+    def embed_query(self, text: str) -> list:
+        return self.embeddings.embed_query(text)
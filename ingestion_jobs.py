@@ -0,0 +1,192 @@
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from ingestion_pipeline import EMBEDDING_MODEL, ingest_pdf
+from index_cache import save_index, CachedEmbeddings
+from db_utils import connect
+from typing import Callable, Optional
+import multiprocessing
+import threading
+import tempfile
+import sqlite3
+import time
+import uuid
+import os
+
+# Number of processes embedding documents in the background
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 2))
+
+# Job status lives in SQLite, so any backend process can report on (or cancel) a job that
+# another one started; it defaults to the same file as the checkpoints
+INGESTION_JOBS_DB = os.getenv('INGESTION_JOBS_DB', 'chat_history.db')
+
+# Finished jobs are kept this long (seconds) for late status polls
+JOB_RETENTION = 3600
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    job_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    filename TEXT,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    documents INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+JOB_FIELDS = ('job_id', 'thread_id', 'filename', 'key', 'status', 'documents', 'chunks', 'error')
+
+# Each worker process loads its own copy of the embedding model on first use
+_worker_embeddings = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _get_worker_embeddings():
+    global _worker_embeddings
+    if _worker_embeddings is None:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        # Chunks already embedded by any process come from the shared embedding cache
+        _worker_embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL), EMBEDDING_MODEL)
+    return _worker_embeddings
+
+
+def _run_job(job_id: str, file_bytes: bytes, key: str, db_path: str) -> dict:
+    """Worker process body: index the PDF into the on-disk index cache under `key`"""
+    conn = connect(db_path)
+
+    def report(pages, chunks):
+        # Cancelling only flags the row, whichever process asked
+        row = conn.execute("SELECT cancel_requested FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[0]:
+            raise JobCancelled()
+        with conn:
+            conn.execute(
+                "UPDATE ingestion_jobs SET status = 'running', documents = ?, chunks = ?, updated_at = ? WHERE job_id = ?",
+                (pages, chunks, time.time(), job_id)
+            )
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp.write(file_bytes)
+        temp_path = tmp.name
+    try:
+        report(0, 0)
+        vectorstore, pages, chunks = ingest_pdf(temp_path, _get_worker_embeddings(), progress=report)
+        if vectorstore is None:
+            raise ValueError("No text could be extracted from the PDF")
+        summary = {'documents': pages, 'chunks': chunks}
+        # The cache doubles as the hand-off to the parent process
+        save_index(key, vectorstore, summary)
+        return summary
+    finally:
+        conn.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+class IngestionJobs:
+    """
+    Background PDF indexing on a process pool, so embedding neither blocks the Streamlit
+    script run nor holds the server's GIL. `register(thread_id, key, filename)` is called in the
+    submitting process once a job's index is in the cache. Status and cancellation go through
+    the jobs table, so they work from any process sharing `db_path`.
+    """
+
+    def __init__(self, register: Callable[[str, str, Optional[str]], None], workers: int = INGESTION_WORKERS,
+                 db_path: str = INGESTION_JOBS_DB):
+        self.register = register
+        self.workers = workers
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.running = {}  # job id -> {'future', 'thread_id', 'key', 'filename'} of jobs submitted here
+        self.pool = None
+        self.conn = None
+
+    def _start(self):
+        # Spawned lazily: most sessions never upload a document
+        if self.pool is None:
+            context = multiprocessing.get_context('spawn')
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def _db(self) -> sqlite3.Connection:
+        """The jobs table, opened on first use; must hold self.lock"""
+        if self.conn is None:
+            self.conn = connect(self.db_path)
+            self.conn.executescript(JOBS_SCHEMA)
+        return self.conn
+
+    def _update(self, job_id: str, **fields) -> None:
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self.lock:
+            with self._db() as conn:
+                conn.execute(
+                    f"UPDATE ingestion_jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+                    (*fields.values(), time.time(), job_id)
+                )
+
+    def submit(self, file_bytes: bytes, thread_id: str, key: str, filename: Optional[str] = None) -> str:
+        """Queue a document for indexing and return its job ID"""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self.lock:
+            with self._db() as conn:
+                conn.execute(
+                    "DELETE FROM ingestion_jobs WHERE status IN ('done', 'error', 'cancelled') AND updated_at < ?",
+                    (now - JOB_RETENTION,)
+                )
+                conn.execute(
+                    "INSERT INTO ingestion_jobs (job_id, thread_id, filename, key, status, updated_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (job_id, str(thread_id), filename, key, now)
+                )
+            self._start()
+            future = self.pool.submit(_run_job, job_id, file_bytes, key, self.db_path)
+            self.running[job_id] = {'future': future, 'thread_id': thread_id, 'key': key, 'filename': filename}
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id: str, future) -> None:
+        job = self.running[job_id]
+        try:
+            summary = future.result()
+            self.register(job['thread_id'], job['key'], job['filename'])
+            self._update(job_id, status='done', **summary)
+        except (CancelledError, JobCancelled):
+            self._update(job_id, status='cancelled')
+        except Exception as e:
+            self._update(job_id, status='error', error=f"Error processing PDF: {str(e)}")
+        finally:
+            with self.lock:
+                self.running.pop(job_id, None)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Snapshot of a job: status, pages/chunks so far, error"""
+        with self.lock:
+            row = self._db().execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ingestion_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job outright, or ask a running one to stop after its current batch"""
+        with self.lock:
+            job = self.running.get(job_id)
+        # Outside the lock: a cancelled future runs _finish right away
+        if job is not None and job['future'].cancel():
+            return True
+        with self.lock:
+            with self._db() as conn:
+                cursor = conn.execute(
+                    "UPDATE ingestion_jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                    (time.time(), job_id)
+                )
+        return cursor.rowcount > 0
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, Optional
+import os
+
+# Embedding model used for rag, also part of the index cache key
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Splitter settings, also part of the index cache key
+SPLITTER_CONFIG = {
+    "chunk_size": 1000,
+    "chunk_overlap": 200,
+    "separators": ["\n\n", "\n", " ", ""]
+}
+
+# Chunks per embedding call and number of embedding calls in flight.
+# The sentence-transformers forward pass releases the GIL, so threads spread it over cores.
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 64))
+EMBED_WORKERS = int(os.getenv('EMBED_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+def iter_chunks(pages: Iterable, splitter) -> Iterator:
+    """Split pages one at a time so chunks are available before the whole PDF is parsed"""
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_index(chunks: Iterable, embeddings, batch_size: int = EMBED_BATCH_SIZE,
+                workers: int = EMBED_WORKERS, progress: Optional[Callable[[int], None]] = None):
+    """
+    Embed chunks in batches on a worker pool and add the vectors to a FAISS index as
+    each batch completes. At most two batches per worker are in flight, so memory stays
+    bounded however large the document is. Returns (vectorstore, chunk count) and
+    (None, 0) when there was nothing to embed.
+    """
+    from langchain_community.vectorstores import FAISS
+    vectorstore = None
+    done = 0
+
+    def embed(batch):
+        return batch, embeddings.embed_documents([doc.page_content for doc in batch])
+
+    def add(future):
+        nonlocal vectorstore, done
+        batch, vectors = future.result()
+        text_embeddings = list(zip([doc.page_content for doc in batch], vectors))
+        metadatas = [doc.metadata for doc in batch]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas)
+        else:
+            vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+        done += len(batch)
+        if progress:
+            progress(done)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in batched(chunks, batch_size):
+            pending.add(pool.submit(embed, batch))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    add(future)
+        for future in pending:
+            add(future)
+
+    return vectorstore, done
+
+
+def ingest_pdf(path: str, embeddings, batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS,
+               progress: Optional[Callable[[int, int], None]] = None):
+    """
+    Stream pages out of the PDF, split them incrementally and embed the chunks.
+    `progress(pages, chunks)` is called whenever a batch lands in the index.
+    Returns (vectorstore, pages, chunks).
+    """
+    # Deferred so that importing the pipeline (e.g. for its settings) stays cheap
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(**SPLITTER_CONFIG)
+    pages = 0
+
+    def count_pages(docs):
+        nonlocal pages
+        for doc in docs:
+            pages += 1
+            yield doc
+
+    vectorstore, chunks = build_index(
+        iter_chunks(count_pages(PyPDFLoader(path).lazy_load()), splitter),
+        embeddings,
+        batch_size=batch_size,
+        workers=workers,
+        progress=(lambda done: progress(pages, done)) if progress else None
+    )
+    return vectorstore, pages, chunks
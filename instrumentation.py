@@ -0,0 +1,494 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.config import get_config
+from collections import defaultdict, OrderedDict
+from metrics import Histogram
+import http_client
+from typing import Optional
+import threading
+import logging
+import json
+import time
+import os
+
+# GRAPH_METRICS=1 turns instrumentation on; when off, instrument() hands back the graph
+# untouched and the observe_* helpers return right away.
+ENABLED = os.getenv('GRAPH_METRICS', '0') == '1'
+
+# Serve the Prometheus text format on this port (http://host:port/metrics); unset means no server
+GRAPH_METRICS_PORT = os.getenv('GRAPH_METRICS_PORT')
+
+# Last turn kept per thread for the debug panel
+TRACE_THREADS = 200
+
+# One JSON object per line: every span (node, llm, gateway, tool, checkpoint, retriever) and a turn summary
+logger = logging.getLogger('graph_metrics')
+
+_lock = threading.Lock()
+# (metric name, labels) -> Histogram / running total
+HISTOGRAMS = defaultdict(Histogram)
+COUNTERS = defaultdict(float)
+
+HELP = {
+    'graph_turn_seconds': 'Wall time of a whole graph run',
+    'graph_node_seconds': 'Wall time per graph node',
+    'llm_seconds': 'Chat model call latency',
+    'llm_input_tokens_total': 'Prompt tokens sent to the chat model',
+    'llm_output_tokens_total': 'Completion tokens returned by the chat model',
+    'tool_seconds': 'Tool run time',
+    'tool_errors_total': 'Tool runs that raised',
+    'checkpoint_seconds': 'Checkpointer call latency',
+    'retriever_seconds': 'Document retrieval latency',
+    'streamlit_render_seconds': 'Streamlit script run time',
+    'http_request_seconds': 'Outbound tool HTTP request latency, retries included (always on)',
+    'http_errors_total': 'Outbound tool HTTP requests that failed, by error type (always on)',
+    'llm_queue_wait_seconds': 'Time a chat model call waited for an LLM gateway slot',
+    'llm_provider_seconds': 'Chat model provider latency per attempt, by outcome',
+    'llm_hedged_total': 'Chat model calls that started a hedged second attempt',
+    'llm_fallback_total': 'Chat model calls answered by a fallback provider',
+}
+
+# Turns in flight by root run id, the in-flight root runs of each thread (oldest first), the
+# root run of every run in flight, and the last finished turn per thread; all guarded by _lock
+_active = {}
+_thread_runs = defaultdict(list)
+_roots = {}
+_traces = OrderedDict()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _observe(metric: str, seconds: float, **labels) -> None:
+    HISTOGRAMS[(metric, _labels(labels))].observe(seconds)
+
+
+def _count(metric: str, value: float = 1, **labels) -> None:
+    with _lock:
+        COUNTERS[(metric, _labels(labels))] += value
+
+
+def _log(event: str, **fields) -> None:
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, default=str))
+
+
+def _calling_run():
+    """Id of the graph run whose code is calling, when there is one"""
+    try:
+        return getattr(get_config().get('callbacks'), 'parent_run_id', None)
+    except RuntimeError:
+        return None
+
+
+def _span(thread_id: Optional[str], kind: str, record: dict, run_id=None) -> None:
+    """
+    Attach a span to the running turn it belongs to: the turn of `run_id` (or of the calling
+    run), else the newest turn of the thread, as for checkpointer calls that run outside it
+    """
+    run_id = run_id or _calling_run()
+    with _lock:
+        turn = _active.get(_roots.get(run_id))
+        if turn is None and _thread_runs.get(thread_id):
+            turn = _active.get(_thread_runs[thread_id][-1])
+        if turn is not None:
+            turn[kind].append(record)
+
+
+def _start_run(run_id, parent_run_id) -> None:
+    with _lock:
+        _roots[run_id] = _roots.get(parent_run_id, parent_run_id)
+
+
+def _end_run(run_id) -> None:
+    with _lock:
+        _roots.pop(run_id, None)
+
+
+def _thread_id(metadata: Optional[dict]) -> Optional[str]:
+    thread_id = (metadata or {}).get('thread_id')
+    return None if thread_id is None else str(thread_id)
+
+
+class GraphMetrics(BaseCallbackHandler):
+    """
+    Callback handler attached to a compiled graph: times every graph run and each node
+    in it, chat model calls (with token usage) and tool runs.
+    """
+
+    # Cheap enough to call on the event loop; don't hop to an executor for async runs
+    run_inline = True
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.runs = {}  # run id -> (kind, name, thread id, started)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        thread_id = _thread_id(metadata)
+        if parent_run_id is None:
+            self.runs[run_id] = ('turn', None, thread_id, time.perf_counter())
+            # Keyed by run, so two overlapping turns of a thread (a double submit) don't mix
+            with _lock:
+                _roots[run_id] = run_id
+                _thread_runs[thread_id].append(run_id)
+                _active[run_id] = {
+                    'backend': self.backend, 'thread_id': thread_id, 'started': time.time(),
+                    'nodes': [], 'llm': [], 'gateway': [], 'tools': [], 'checkpoint': [], 'retriever': []
+                }
+            return
+        _start_run(run_id, parent_run_id)
+        parent = self.runs.get(parent_run_id)
+        # Nodes are the direct children of the graph run
+        if parent is not None and parent[0] == 'turn':
+            name = kwargs.get('name') or (metadata or {}).get('langgraph_node')
+            self.runs[run_id] = ('node', name, thread_id, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, error=False)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_chain(run_id, error=True)
+
+    def _end_chain(self, run_id, error: bool) -> None:
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            _end_run(run_id)
+            return
+        kind, name, thread_id, started = run
+        seconds = time.perf_counter() - started
+        if kind == 'node':
+            _observe('graph_node_seconds', seconds, backend=self.backend, node=name)
+            _span(thread_id, 'nodes', {'node': name, 'seconds': round(seconds, 4), 'error': error}, run_id)
+            _log('node', backend=self.backend, thread_id=thread_id, node=name, seconds=round(seconds, 4), error=error)
+            _end_run(run_id)
+            return
+        _observe('graph_turn_seconds', seconds, backend=self.backend)
+        with _lock:
+            _roots.pop(run_id, None)
+            turn = _active.pop(run_id, None)
+            runs = _thread_runs.get(thread_id)
+            if runs is not None and run_id in runs:
+                runs.remove(run_id)
+                if not runs:
+                    del _thread_runs[thread_id]
+        if turn is None:
+            return
+        turn['seconds'] = round(seconds, 4)
+        turn['error'] = error
+        with _lock:
+            _traces[thread_id] = turn
+            _traces.move_to_end(thread_id)
+            while len(_traces) > TRACE_THREADS:
+                _traces.popitem(last=False)
+        _log(
+            'turn', backend=self.backend, thread_id=thread_id, seconds=turn['seconds'], error=error,
+            input_tokens=sum(call['input_tokens'] for call in turn['llm']),
+            output_tokens=sum(call['output_tokens'] for call in turn['llm']),
+            tools=[run['tool'] for run in turn['tools']]
+        )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_llm(serialized, run_id, parent_run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start_llm(serialized, run_id, parent_run_id, metadata)
+
+    def _start_llm(self, serialized, run_id, parent_run_id, metadata) -> None:
+        _start_run(run_id, parent_run_id)
+        metadata = metadata or {}
+        model = metadata.get('ls_model_name') or (serialized or {}).get('name') or 'unknown'
+        self.runs[run_id] = ('llm', (model, metadata.get('langgraph_node')), _thread_id(metadata), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            _end_run(run_id)
+            return
+        _, (model, node), thread_id, started = run
+        seconds = time.perf_counter() - started
+        input_tokens, output_tokens = token_usage(response)
+        _observe('llm_seconds', seconds, backend=self.backend, model=model, node=node)
+        _count('llm_input_tokens_total', input_tokens, backend=self.backend, model=model)
+        _count('llm_output_tokens_total', output_tokens, backend=self.backend, model=model)
+        record = {'model': model, 'node': node, 'seconds': round(seconds, 4),
+                  'input_tokens': input_tokens, 'output_tokens': output_tokens}
+        _span(thread_id, 'llm', record, run_id)
+        _log('llm', backend=self.backend, thread_id=thread_id, **record)
+        _end_run(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.runs.pop(run_id, None)
+        _end_run(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        _start_run(run_id, parent_run_id)
+        name = kwargs.get('name') or (serialized or {}).get('name') or 'unknown'
+        self.runs[run_id] = ('tool', name, _thread_id(metadata), time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, error=False)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, error=True)
+
+    def _end_tool(self, run_id, error: bool) -> None:
+        run = self.runs.pop(run_id, None)
+        if run is None:
+            _end_run(run_id)
+            return
+        _, name, thread_id, started = run
+        seconds = time.perf_counter() - started
+        _observe('tool_seconds', seconds, backend=self.backend, tool=name)
+        if error:
+            _count('tool_errors_total', backend=self.backend, tool=name)
+        record = {'tool': name, 'seconds': round(seconds, 4), 'error': error}
+        _span(thread_id, 'tools', record, run_id)
+        _log('tool', backend=self.backend, thread_id=thread_id, **record)
+        _end_run(run_id)
+
+
+def token_usage(response) -> tuple:
+    """(input, output) tokens of an LLMResult, from usage_metadata or the provider's llm_output"""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                input_tokens += usage.get('input_tokens', 0)
+                output_tokens += usage.get('output_tokens', 0)
+    if not input_tokens and not output_tokens:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        input_tokens = usage.get('prompt_tokens', 0)
+        output_tokens = usage.get('completion_tokens', 0)
+    return input_tokens, output_tokens
+
+
+class InstrumentedSaver(BaseCheckpointSaver):
+    """Times reads and writes of another checkpointer; everything else is passed through"""
+
+    def __init__(self, saver: BaseCheckpointSaver, backend: str):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self.backend = backend
+
+    def __getattr__(self, name):
+        # Saver specific helpers (list_threads, ...) keep working
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def _record(self, op: str, config, started: float) -> None:
+        seconds = time.perf_counter() - started
+        thread_id = _thread_id(config.get('configurable'))
+        _observe('checkpoint_seconds', seconds, backend=self.backend, op=op)
+        _span(thread_id, 'checkpoint', {'op': op, 'seconds': round(seconds, 4)})
+        _log('checkpoint', backend=self.backend, thread_id=thread_id, op=op, seconds=round(seconds, 4))
+
+    def get_tuple(self, config):
+        started = time.perf_counter()
+        try:
+            return self.saver.get_tuple(config)
+        finally:
+            self._record('read', config, started)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        started = time.perf_counter()
+        try:
+            return self.saver.put(config, checkpoint, metadata, new_versions)
+        finally:
+            self._record('write', config, started)
+
+    def put_writes(self, config, writes, task_id, task_path=''):
+        started = time.perf_counter()
+        try:
+            return self.saver.put_writes(config, writes, task_id, task_path)
+        finally:
+            self._record('write_pending', config, started)
+
+    async def aget_tuple(self, config):
+        started = time.perf_counter()
+        try:
+            return await self.saver.aget_tuple(config)
+        finally:
+            self._record('read', config, started)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        started = time.perf_counter()
+        try:
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+        finally:
+            self._record('write', config, started)
+
+    async def aput_writes(self, config, writes, task_id, task_path=''):
+        started = time.perf_counter()
+        try:
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+        finally:
+            self._record('write_pending', config, started)
+
+    def list(self, config, **kwargs):
+        return self.saver.list(config, **kwargs)
+
+    def alist(self, config, **kwargs):
+        return self.saver.alist(config, **kwargs)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def delete_thread(self, thread_id):
+        return self.saver.delete_thread(thread_id)
+
+    async def adelete_thread(self, thread_id):
+        return await self.saver.adelete_thread(thread_id)
+
+
+def instrument(workflow, backend: str):
+    """
+    The compiled graph with metrics attached (node/LLM/tool callbacks and a timed
+    checkpointer), or `workflow` itself when instrumentation is off.
+    """
+    if not ENABLED:
+        return workflow
+    if isinstance(workflow.checkpointer, BaseCheckpointSaver):
+        workflow = workflow.copy({'checkpointer': InstrumentedSaver(workflow.checkpointer, backend)})
+    start_metrics_server()
+    return workflow.with_config(callbacks=[GraphMetrics(backend)])
+
+
+def observe_retrieval(thread_id: str, seconds: float, results: int) -> None:
+    if not ENABLED:
+        return
+    _observe('retriever_seconds', seconds)
+    _span(str(thread_id), 'retriever', {'seconds': round(seconds, 4), 'results': results})
+    _log('retriever', thread_id=thread_id, seconds=round(seconds, 4), results=results)
+
+
+def observe_llm_call(thread_id: str, record: dict) -> None:
+    """One chat model call through the LLM gateway: queue wait, then each provider attempt"""
+    if not ENABLED:
+        return
+    _observe('llm_queue_wait_seconds', record['queue_seconds'])
+    for attempt in record['attempts']:
+        if attempt['seconds'] is not None:
+            _observe('llm_provider_seconds', attempt['seconds'], provider=attempt['provider'], outcome=attempt['outcome'])
+    if record['hedged']:
+        _count('llm_hedged_total')
+    if record['fallback']:
+        _count('llm_fallback_total', provider=record['provider'])
+    _span(str(thread_id), 'gateway', record)
+    _log('gateway', thread_id=thread_id, **record)
+
+
+def observe_render(frontend: str, seconds: float) -> None:
+    if not ENABLED:
+        return
+    _observe('streamlit_render_seconds', seconds, frontend=frontend)
+
+
+def last_turn(thread_id: str) -> Optional[dict]:
+    """Breakdown of the thread's most recent graph run, for the debug panel"""
+    with _lock:
+        return _traces.get(str(thread_id))
+
+
+def metrics_summary() -> dict:
+    """{metric: {labels: {'count', 'p50', 'p95', 'sum'}}} for histograms, totals for counters"""
+    summary = defaultdict(dict)
+    for (metric, labels), histogram in list(HISTOGRAMS.items()):
+        summary[metric][labels] = {
+            'count': histogram.count, 'sum': histogram.sum,
+            'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95)
+        }
+    with _lock:
+        for (metric, labels), value in COUNTERS.items():
+            summary[metric][labels] = value
+    return dict(summary)
+
+
+def _format_labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    histograms = defaultdict(list)
+    for (metric, labels), histogram in list(HISTOGRAMS.items()):
+        histograms[metric].append((labels, histogram.snapshot()))
+    # The tool HTTP client keeps its own counters whether or not GRAPH_METRICS is on
+    for tool, histogram in list(http_client.LATENCY.items()):
+        histograms['http_request_seconds'].append((_labels({'tool': tool}), histogram.snapshot()))
+    for metric, series in sorted(histograms.items()):
+        lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, snapshot in series:
+            for bound, count in snapshot['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{metric}_bucket{_format_labels(labels, le=le)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {snapshot['sum']}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {snapshot['count']}")
+    counters = defaultdict(list)
+    with _lock:
+        for (metric, labels), value in COUNTERS.items():
+            counters[metric].append((labels, value))
+    for tool, errors in list(http_client.ERRORS.items()):
+        for kind, value in list(errors.items()):
+            counters['http_errors_total'].append((_labels({'tool': tool, 'error': kind}), value))
+    for metric, series in sorted(counters.items()):
+        lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} counter")
+        for labels, value in series:
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+
+_server = []
+
+
+def start_metrics_server(port: Optional[str] = GRAPH_METRICS_PORT) -> None:
+    """Serve /metrics on a daemon thread (once per process)"""
+    if not port:
+        return
+    with _lock:
+        if _server:
+            return
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer(('0.0.0.0', int(port)), MetricsHandler)
+        except OSError as e:
+            # Another Streamlit process already serves the port
+            print(f"Error starting metrics server: {e}")
+            return
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        _server.append(server)
+
+
+if ENABLED and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
@@ -0,0 +1,55 @@
+from langchain_core.embeddings import Embeddings
+import functools
+import threading
+
+
+def once(factory):
+    """
+    Run `factory` on the first call only, even when several threads ask at the same time;
+    every later call returns the same object. `get.ready()` tells whether it has run.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def get():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+
+    get.ready = lambda: bool(result)
+    return get
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings whose model is only loaded on the first embed call (or by preload())"""
+
+    def __init__(self, factory):
+        self.get = once(factory)
+        self.preloading = None
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.get.ready()
+
+    def preload(self) -> None:
+        """Start loading the model on a background thread, without waiting for it"""
+        with self.lock:
+            if self.preloading is None and not self.ready:
+                self.preloading = threading.Thread(target=self._preload, name='embeddings-preload', daemon=True)
+                self.preloading.start()
+
+    def _preload(self) -> None:
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Error loading embedding model: {e}")
+
+    def embed_documents(self, texts: list) -> list:
+        return self.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.get().embed_query(text)
@@ -0,0 +1,591 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.config import get_config
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from collections import defaultdict, deque, OrderedDict
+from metrics import Histogram
+from pydantic import PrivateAttr
+from typing import Optional
+import contextvars
+import instrumentation
+import threading
+import asyncio
+import time
+import os
+
+# Chat model calls in flight per process, and per user (chat thread); the rest wait in a fair queue
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_MAX_PER_USER = int(os.getenv('LLM_MAX_PER_USER', 2))
+
+# Longest wait (seconds) for a slot before the call fails with GatewayBusy
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 60))
+
+# Requests per minute sent to each provider (0 = no limit), in bursts of up to LLM_RATE_BURST
+LLM_RPM = {
+    'gemini': float(os.getenv('LLM_RPM_GEMINI', 1000)),
+    'huggingface': float(os.getenv('LLM_RPM_HUGGINGFACE', 300))
+}
+LLM_RATE_BURST = int(os.getenv('LLM_RATE_BURST', 10))
+
+# A provider whose rate limit would hold a call longer than this (seconds) is passed over for the next one
+LLM_RATE_MAX_WAIT = float(os.getenv('LLM_RATE_MAX_WAIT', 2))
+
+# Seconds without a first token (or, unstreamed, without an answer) before a second, hedged
+# attempt starts on the next provider; whichever answers first is used. 0 turns hedging off.
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 10))
+
+# A provider whose chat model couldn't be created is tried again after this many seconds,
+# doubling after each failure up to LLM_PROVIDER_RETRY_MAX
+LLM_PROVIDER_RETRY = float(os.getenv('LLM_PROVIDER_RETRY', 5))
+LLM_PROVIDER_RETRY_MAX = float(os.getenv('LLM_PROVIDER_RETRY_MAX', 300))
+
+# LLM_FALLBACK=0 keeps each backend on its first provider (no fallback or hedging to the other)
+LLM_FALLBACK = os.getenv('LLM_FALLBACK', '1') != '0'
+
+
+def gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model='gemini-2.5-flash'
+    )
+
+
+def huggingface():
+    from langchain_huggingface import HuggingFaceEndpoint, ChatHuggingFace
+    llm = HuggingFaceEndpoint(
+        repo_id="meta-llama/Meta-Llama-3-8B-Instruct",
+        task="text-generation",
+        max_new_tokens=1000,
+        temperature=0.5
+    )
+    return ChatHuggingFace(llm=llm)
+
+
+# Provider name -> factory of its chat model
+PROVIDERS = {
+    'gemini': gemini,
+    'huggingface': huggingface
+}
+
+# Sync calls run their attempts here, so a slow one can be hedged without waiting for it.
+# Every attempt holds a LIMITER slot until it finishes, so at most LLM_MAX_CONCURRENCY run at once.
+_pool = ThreadPoolExecutor(max_workers=2 * LLM_MAX_CONCURRENCY, thread_name_prefix='llm-gateway')
+
+_lock = threading.Lock()
+_models = {}
+_failures = {}  # provider name -> (time of the next attempt, backoff)
+_buckets = {}
+
+# Always on (GRAPH_METRICS only adds the Prometheus series and per-turn spans)
+QUEUE_WAIT = Histogram()
+PROVIDER_LATENCY = defaultdict(Histogram)
+COUNTS = defaultdict(int)
+
+
+class GatewayBusy(Exception):
+    pass
+
+
+class FairLimiter:
+    """
+    At most `limit` calls at once and `per_user` per user. Waiting calls get free slots round
+    robin across users (first come first served within a user), so one busy chat can't starve
+    the others. Threads and asyncio tasks share the same queue.
+    """
+
+    class Waiter:
+        __slots__ = ('wake', 'granted')
+
+        def __init__(self, wake):
+            self.wake = wake
+            self.granted = False
+
+    def __init__(self, limit: int = LLM_MAX_CONCURRENCY, per_user: int = LLM_MAX_PER_USER):
+        self.limit = limit
+        self.per_user = per_user
+        self.active = 0
+        self.active_by_user = defaultdict(int)
+        self.waiting = OrderedDict()  # user -> deque of waiters, users in round-robin order
+        self.lock = threading.Lock()
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock
+        while self.active < self.limit:
+            for user, queue in self.waiting.items():
+                if self.active_by_user[user] < self.per_user:
+                    break
+            else:
+                return
+            waiter = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(user)
+            else:
+                del self.waiting[user]
+            self.active += 1
+            self.active_by_user[user] += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _enqueue(self, user: str, wake) -> 'FairLimiter.Waiter':
+        waiter = self.Waiter(wake)
+        with self.lock:
+            self.waiting.setdefault(user, deque()).append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _withdraw(self, user: str, waiter) -> bool:
+        """Take a waiter out of the queue; False if it got its slot in the meantime"""
+        with self.lock:
+            if waiter.granted:
+                return False
+            queue = self.waiting.get(user)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self.waiting[user]
+            return True
+
+    def acquire(self, user: str, timeout: float = LLM_QUEUE_TIMEOUT) -> float:
+        """Block until `user` may make a call; returns the seconds spent waiting"""
+        started = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(user, event.set)
+        if not event.wait(timeout) and self._withdraw(user, waiter):
+            raise GatewayBusy(f"no chat model slot free after {timeout:.0f}s")
+        return time.perf_counter() - started
+
+    async def aacquire(self, user: str, timeout: float = LLM_QUEUE_TIMEOUT) -> float:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(user, wake)
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(user, waiter):
+                raise GatewayBusy(f"no chat model slot free after {timeout:.0f}s") from None
+        except BaseException:
+            # Cancelled while queued: give the slot back if it was just handed over
+            if not self._withdraw(user, waiter):
+                self.release(user)
+            raise
+        return time.perf_counter() - started
+
+    def try_acquire(self, user: str) -> bool:
+        """Take a slot for `user` only if one is free right now and nobody is queued for it"""
+        with self.lock:
+            if self.waiting or self.active >= self.limit or self.active_by_user.get(user, 0) >= self.per_user:
+                return False
+            self.active += 1
+            self.active_by_user[user] += 1
+            return True
+
+    def release(self, user: str) -> None:
+        with self.lock:
+            self.active -= 1
+            self.active_by_user[user] -= 1
+            if not self.active_by_user[user]:
+                del self.active_by_user[user]
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'active': self.active,
+                'waiting': sum(len(queue) for queue in self.waiting.values()),
+                'users_waiting': len(self.waiting)
+            }
+
+
+class TokenBucket:
+    """Requests per minute for one provider, allowing bursts of up to `burst`"""
+
+    def __init__(self, per_minute: float, burst: int = LLM_RATE_BURST):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Take a token and return how long to wait before using it, or None (and take nothing)
+        when that wait would be longer than `max_wait`
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            if max_wait is not None and delay > max_wait:
+                return None
+            self.tokens -= 1
+            return delay
+
+
+LIMITER = FairLimiter()
+
+
+def _bucket(provider: str) -> TokenBucket:
+    with _lock:
+        if provider not in _buckets:
+            _buckets[provider] = TokenBucket(LLM_RPM.get(provider, 0))
+        return _buckets[provider]
+
+
+def get_provider(name: str):
+    """
+    The provider's chat model (created once per process), or None if it can't be created
+    right now. Failures aren't cached: creation is retried with a backoff.
+    """
+    with _lock:
+        if name in _models:
+            return _models[name]
+        retry_at, backoff = _failures.get(name, (0.0, 0.0))
+        if time.monotonic() < retry_at:
+            return None
+        try:
+            _models[name] = PROVIDERS[name]()
+        except Exception as e:
+            backoff = min(backoff * 2, LLM_PROVIDER_RETRY_MAX) if backoff else LLM_PROVIDER_RETRY
+            _failures[name] = (time.monotonic() + backoff, backoff)
+            print(f"Error creating chat model {name} (retrying in {backoff:g}s): {e}")
+            return None
+        _failures.pop(name, None)
+        return _models[name]
+
+
+def current_user() -> str:
+    """Who a call is for: the chat thread of the graph run making it"""
+    try:
+        return str(get_config()['configurable'].get('thread_id', 'anonymous'))
+    except (RuntimeError, KeyError):
+        return 'anonymous'
+
+
+def _model_name(model) -> str:
+    model = getattr(model, 'bound', model)
+    return str(getattr(model, 'model', None) or getattr(model, 'model_id', None) or type(model).__name__)
+
+
+class LLMGateway(BaseChatModel):
+    """
+    Chat model that sends each call to one of several providers: at most LLM_MAX_CONCURRENCY
+    calls in flight (LLM_MAX_PER_USER per chat), a token bucket per provider, a hedged second
+    attempt when the first is slow and a slot is free, and fallback to the next provider when one fails.
+    """
+
+    # Provider names in order of preference; their chat models come from get_provider on each
+    # call, so one that couldn't be created yet is picked up once it can
+    providers: list
+    model: str = ''
+    hedge_after: float = LLM_HEDGE_AFTER
+    # (tools, kwargs) given to bind_tools, bound to each provider's model when it is first used
+    bound_tools: Optional[tuple] = None
+    _bound: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'llm_gateway'
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params['ls_model_name'] = self.model
+        return params
+
+    def bind_tools(self, tools, **kwargs):
+        gateway = self.model_copy(update={'bound_tools': (list(tools), kwargs)})
+        gateway._bound = {}
+        return gateway
+
+    def _available(self) -> list:
+        """(name, chat model or tool-bound runnable) of the providers that can be used right now"""
+        available = []
+        for name in self.providers:
+            model = get_provider(name)
+            if model is None:
+                continue
+            if self.bound_tools is not None:
+                key = (name, id(model))
+                if key not in self._bound:
+                    try:
+                        tools, kwargs = self.bound_tools
+                        self._bound[key] = model.bind_tools(tools, **kwargs)
+                    except Exception as e:
+                        print(f"Error binding tools to chat model {name}: {e}")
+                        continue
+                model = self._bound[key]
+            available.append((name, model))
+        return available
+
+    def _plan(self) -> list:
+        available = self._available()
+        if not available:
+            raise RuntimeError("No chat model provider available")
+        # With one provider the hedge / fallback attempt goes to the same one
+        return available if len(available) > 1 else available * 2
+
+    def _next_attempt(self, plan: list) -> tuple:
+        """(name, model, rate-limit delay) of the next provider to try, taken off `plan`"""
+        for i, (name, model) in enumerate(plan):
+            delay = _bucket(name).reserve(LLM_RATE_MAX_WAIT)
+            if delay is not None:
+                del plan[i]
+                return name, model, delay
+        # All of them are rate limited, wait for the preferred one
+        name, model = plan.pop(0)
+        return name, model, _bucket(name).reserve()
+
+    @staticmethod
+    def _call_kwargs(stop, kwargs) -> dict:
+        return dict(kwargs, stop=stop) if stop is not None else dict(kwargs)
+
+    def _finish(self, user: str, queue_seconds: float, attempts: list, hedged: bool) -> None:
+        served = next((attempt['provider'] for attempt in attempts if attempt['outcome'] == 'ok'), None)
+        QUEUE_WAIT.observe(queue_seconds)
+        for attempt in attempts:
+            if attempt['seconds'] is not None:
+                PROVIDER_LATENCY[attempt['provider']].observe(attempt['seconds'])
+            COUNTS[(attempt['provider'], attempt['outcome'])] += 1
+        COUNTS['hedged'] += hedged
+        fallback = served is not None and served != self.providers[0]
+        COUNTS['fallback'] += fallback
+        instrumentation.observe_llm_call(user, {
+            'provider': served, 'queue_seconds': round(queue_seconds, 4),
+            'attempts': attempts, 'hedged': hedged, 'fallback': fallback
+        })
+
+    # Sync calls
+
+    def _run(self, name, model, delay, messages, kwargs, stream: bool, attempts: list):
+        record = {'provider': name, 'seconds': None, 'outcome': 'cancelled'}
+        attempts.append(record)
+        if delay:
+            time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            # No callbacks: the gateway's own run reports the tokens and usage
+            if stream:
+                yield from model.stream(messages, {'callbacks': []}, **kwargs)
+            else:
+                yield model.invoke(messages, {'callbacks': []}, **kwargs)
+            record['outcome'] = 'ok'
+        except Exception:
+            record['outcome'] = 'error'
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 4)
+
+    def _call(self, messages, stop, kwargs, stream: bool):
+        plan = self._plan()
+        user = current_user()
+        queue_seconds = LIMITER.acquire(user)
+        attempts = []
+        hedged = False
+        pending = {}  # future of the attempt's first item -> (attempt generator, its context)
+        kwargs = self._call_kwargs(stop, kwargs)
+        done_marker = object()
+        winner = None
+
+        # Slots this call holds: one per attempt started, reused by a fallback after a failure
+        held = 1
+
+        def start():
+            name, model, delay = self._next_attempt(plan)
+            attempt = self._run(name, model, delay, messages, kwargs, stream, attempts)
+            # The attempt keeps one context wherever it runs, as LangChain's context variables expect
+            context = contextvars.copy_context()
+            pending[_pool.submit(context.run, next, attempt, done_marker)] = (attempt, context)
+
+        try:
+            start()
+            error = None
+            may_hedge = self.hedge_after > 0
+            while winner is None:
+                hedge = may_hedge and plan and not hedged
+                done, _ = wait_futures(pending, timeout=self.hedge_after if hedge else None, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The hedge needs a slot of its own; with none free, keep waiting on the first attempt
+                    may_hedge = False
+                    if LIMITER.try_acquire(user):
+                        held += 1
+                        hedged = True
+                        start()
+                    else:
+                        COUNTS['hedge_skipped'] += 1
+                    continue
+                for future in done:
+                    attempt, context = pending.pop(future)
+                    try:
+                        winner = (attempt, context, future.result())
+                        break
+                    except Exception as e:
+                        error = e
+                if winner is None and not pending:
+                    if not plan:
+                        raise error
+                    start()
+            attempt, context, item = winner
+            while item is not done_marker:
+                yield item
+                item = context.run(next, attempt, done_marker)
+        finally:
+            if winner is not None:
+                winner[1].run(winner[0].close)
+            # A slower attempt can't be interrupted: its result is dropped once it arrives, and
+            # only then is its slot given back
+            for future, (attempt, context) in pending.items():
+                future.add_done_callback(
+                    lambda _, attempt=attempt, context=context: (context.run(attempt.close), LIMITER.release(user))
+                )
+            for _ in range(held - len(pending)):
+                LIMITER.release(user)
+            self._finish(user, queue_seconds, attempts, hedged)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = None
+        for message in self._call(messages, stop, kwargs, stream=False):
+            pass
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in self._call(messages, stop, kwargs, stream=True):
+            yield ChatGenerationChunk(message=chunk)
+
+    # Async calls
+
+    async def _arun(self, name, model, delay, messages, kwargs, stream: bool, attempts: list):
+        record = {'provider': name, 'seconds': None, 'outcome': 'cancelled'}
+        attempts.append(record)
+        if delay:
+            await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            if stream:
+                async for chunk in model.astream(messages, {'callbacks': []}, **kwargs):
+                    yield chunk
+            else:
+                yield await model.ainvoke(messages, {'callbacks': []}, **kwargs)
+            record['outcome'] = 'ok'
+        except Exception:
+            record['outcome'] = 'error'
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 4)
+
+    async def _acall(self, messages, stop, kwargs, stream: bool):
+        plan = self._plan()
+        user = current_user()
+        queue_seconds = await LIMITER.aacquire(user)
+        attempts = []
+        hedged = False
+        pending = {}  # task for the attempt's first item -> attempt generator
+        kwargs = self._call_kwargs(stop, kwargs)
+        done_marker = object()
+
+        async def first_item(attempt):
+            async for item in attempt:
+                return item
+            return done_marker
+
+        def start():
+            name, model, delay = self._next_attempt(plan)
+            attempt = self._arun(name, model, delay, messages, kwargs, stream, attempts)
+            pending[asyncio.ensure_future(first_item(attempt))] = attempt
+
+        winner = None
+        # Slots this call holds: one per attempt started, reused by a fallback after a failure
+        held = 1
+        try:
+            start()
+            error = None
+            may_hedge = self.hedge_after > 0
+            while winner is None:
+                hedge = may_hedge and plan and not hedged
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_after if hedge else None, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The hedge needs a slot of its own; with none free, keep waiting on the first attempt
+                    may_hedge = False
+                    if LIMITER.try_acquire(user):
+                        held += 1
+                        hedged = True
+                        start()
+                    else:
+                        COUNTS['hedge_skipped'] += 1
+                    continue
+                for task in done:
+                    attempt = pending.pop(task)
+                    try:
+                        winner = (attempt, task.result())
+                        break
+                    except Exception as e:
+                        error = e
+                if winner is None and not pending:
+                    if not plan:
+                        raise error
+                    start()
+            attempt, first = winner
+            if first is not done_marker:
+                yield first
+                async for chunk in attempt:
+                    yield chunk
+        finally:
+            # Stop the losing (or, if this call was cancelled, every) attempt; each gives its
+            # slot back once it has actually stopped
+            for task, attempt in pending.items():
+                task.add_done_callback(lambda _: LIMITER.release(user))
+                if task.cancel():
+                    continue
+                await attempt.aclose()
+            if winner is not None:
+                await winner[0].aclose()
+            for _ in range(held - len(pending)):
+                LIMITER.release(user)
+            self._finish(user, queue_seconds, attempts, hedged)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = None
+        async for message in self._acall(messages, stop, kwargs, stream=False):
+            pass
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self._acall(messages, stop, kwargs, stream=True):
+            yield ChatGenerationChunk(message=chunk)
+
+
+def make_gateway(providers: list) -> LLMGateway:
+    """Gateway over the named providers, first one preferred (only that one with LLM_FALLBACK=0)"""
+    if not LLM_FALLBACK:
+        providers = providers[:1]
+    # Create them now where possible; the ones that fail are retried on later calls
+    models = [model for model in map(get_provider, providers) if model is not None]
+    return LLMGateway(providers=list(providers), model=_model_name(models[0]) if models else '')
+
+
+def gateway_stats() -> dict:
+    """Slots in use, queue, and per provider: calls by outcome and latency (bucket bounds, None past the last one)"""
+    providers = {}
+    for name, histogram in list(PROVIDER_LATENCY.items()):
+        providers[name] = {
+            'calls': histogram.count,
+            'errors': COUNTS[(name, 'error')],
+            'hedges_lost': COUNTS[(name, 'cancelled')],
+            'p50': histogram.quantile(0.5),
+            'p95': histogram.quantile(0.95)
+        }
+    return {
+        **LIMITER.stats(),
+        'queue_wait_p50': QUEUE_WAIT.quantile(0.5),
+        'queue_wait_p95': QUEUE_WAIT.quantile(0.95),
+        'hedged': COUNTS['hedged'],
+        'hedges_skipped': COUNTS['hedge_skipped'],
+        'fallbacks': COUNTS['fallback'],
+        'providers': providers
+    }
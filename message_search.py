@@ -0,0 +1,164 @@
+from message_utils import message_text
+from typing import Optional
+import re
+
+# Text of every human / AI message, one row per message, and an FTS5 index over it.
+# The index is external-content (the text is stored once, in message_text) and kept in
+# sync by triggers, so deleting a thread's rows is enough to drop them from the index.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_text (
+    id INTEGER PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    message_id TEXT,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS message_text_thread ON message_text (thread_id, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+    text, content='message_text', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS message_text_insert AFTER INSERT ON message_text BEGIN
+    INSERT INTO message_search (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS message_text_delete AFTER DELETE ON message_text BEGIN
+    INSERT INTO message_search (message_search, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Best matching messages looked at per query; results are grouped into threads from these
+SEARCH_CANDIDATES = 200
+# Only the most recent matches are ranked, so a word found in most messages stays cheap
+SEARCH_WINDOW = 2000
+
+# Private markers around matched words in snippets, turned into markdown bold afterwards
+HIGHLIGHT = ('\x02', '\x03')
+
+WORD = re.compile(r"\w+", re.UNICODE)
+MARKDOWN = re.compile(r"([\\`*_{}\[\]()#+\-.!|>~<$])")
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    User input -> FTS5 query: every word must match, the last one as a prefix (search as you
+    type). Words are quoted, so operators and punctuation in the input are never syntax.
+    """
+    words = WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet: str) -> str:
+    """Snippet as one line of markdown: the message's own formatting escaped, matches in bold"""
+    text = MARKDOWN.sub(r"\\\1", ' '.join(snippet.split()))
+    return text.replace(HIGHLIGHT[0], '**').replace(HIGHLIGHT[1], '**')
+
+
+def searchable(msg) -> Optional[tuple]:
+    """(role, text) of a message that belongs in the index, like get_thread_messages() shows them"""
+    role = {'human': 'user', 'ai': 'assistant'}.get(getattr(msg, 'type', None))
+    if role is None:
+        return None
+    text = message_text(msg).strip()
+    return (role, text) if text else None
+
+
+def index_messages(cur, thread_id: str, messages: list) -> int:
+    """
+    Bring a thread's rows up to date with its latest message list; returns rows added.
+    Only messages after the last indexed one are looked at, unless the history was rewritten
+    (that message is gone or moved), in which case the thread is indexed again from scratch.
+    """
+    thread_id = str(thread_id)
+    last = cur.execute(
+        "SELECT position, message_id FROM message_text WHERE thread_id = ? ORDER BY position DESC LIMIT 1",
+        (thread_id,)
+    ).fetchone()
+    start = 0
+    if last is not None:
+        position, message_id = last
+        if position < len(messages) and getattr(messages[position], 'id', None) == message_id:
+            start = position + 1
+        else:
+            cur.execute("DELETE FROM message_text WHERE thread_id = ?", (thread_id,))
+
+    rows = []
+    for position in range(start, len(messages)):
+        found = searchable(messages[position])
+        if found is not None:
+            rows.append((thread_id, position, getattr(messages[position], 'id', None), *found))
+    if rows:
+        cur.executemany(
+            "INSERT INTO message_text (thread_id, position, message_id, role, text) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+    return len(rows)
+
+
+def remove_thread_messages(cur, thread_id: str) -> None:
+    cur.execute("DELETE FROM message_text WHERE thread_id = ?", (str(thread_id),))
+
+
+def search_messages(cur, query: str, limit: int = 20, per_thread: int = 1) -> list:
+    """
+    Threads whose messages match `query`, best first: [{thread_id, title, updated_at,
+    matches: [{role, position, snippet}]}]. Reads only the index and the catalog.
+    """
+    match = fts_query(query)
+    if match is None:
+        return []
+    # Walking the matches newest first is cheap; ranking all of them is not
+    floor = cur.execute(
+        f"SELECT rowid FROM message_search WHERE message_search MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET {SEARCH_WINDOW - 1}",
+        (match,)
+    ).fetchone()
+    # Rank first, then fetch text positions and snippets only for the rows that are shown
+    rows = cur.execute(
+        f"""
+        SELECT t.id, t.thread_id, t.position, t.role
+        FROM (
+            SELECT rowid AS id, rank FROM message_search WHERE message_search MATCH ? AND rowid >= ?
+            ORDER BY rank LIMIT {SEARCH_CANDIDATES}
+        ) best
+        JOIN message_text t ON t.id = best.id
+        ORDER BY best.rank
+        """,
+        (match, floor[0] if floor else 0)
+    ).fetchall()
+
+    results = {}
+    shown = {}
+    for row_id, thread_id, position, role in rows:
+        result = results.get(thread_id)
+        if result is None:
+            if len(results) == limit:
+                continue
+            result = results[thread_id] = {'thread_id': thread_id, 'matches': []}
+        if len(result['matches']) < per_thread:
+            match_row = {'role': role, 'position': position, 'snippet': ''}
+            result['matches'].append(match_row)
+            shown[row_id] = match_row
+    if shown:
+        marks = ','.join('?' * len(shown))
+        for row_id, snippet in cur.execute(
+            f"SELECT rowid, snippet(message_search, 0, ?, ?, '…', 12) FROM message_search "
+            f"WHERE message_search MATCH ? AND rowid IN ({marks})",
+            (*HIGHLIGHT, match, *shown)
+        ):
+            shown[row_id]['snippet'] = highlight(snippet)
+    if not results:
+        return []
+
+    marks = ','.join('?' * len(results))
+    catalog = {
+        thread_id: (title, updated_at)
+        for thread_id, title, updated_at in cur.execute(
+            f"SELECT thread_id, title, updated_at FROM threads WHERE thread_id IN ({marks})", list(results)
+        )
+    }
+    for thread_id, result in results.items():
+        result['title'], result['updated_at'] = catalog.get(thread_id, ('New Chat', None))
+    return list(results.values())
@@ -0,0 +1,29 @@
+# How many characters of the first user message are kept as the thread title
+TITLE_LENGTH = 40
+
+
+def message_text(msg) -> str:
+    """Extract the plain text of a message (handles both string and list content)"""
+    content = getattr(msg, 'content', '')
+    if isinstance(content, list):
+        text_parts = []
+        for item in content:
+            if isinstance(item, dict) and item.get('type') == 'text':
+                text_parts.append(item.get('text', ''))
+            elif isinstance(item, str):
+                text_parts.append(item)
+        content = ''.join(text_parts)
+    return str(content) if content else ''
+
+
+def thread_title(messages) -> str:
+    """Display title for a thread: the first user message, truncated"""
+    for msg in messages:
+        if getattr(msg, 'type', None) == 'human':
+            first_msg = message_text(msg).strip()
+            if not first_msg:
+                continue
+            if len(first_msg) > TITLE_LENGTH:
+                return first_msg[:TITLE_LENGTH] + "..."
+            return first_msg
+    return "New Chat"
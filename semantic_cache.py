@@ -0,0 +1,114 @@
+from typing import Optional
+import numpy as np
+import threading
+import faiss
+import time
+import re
+import os
+
+# Cosine similarity a past question needs to count as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', 24 * 3600))
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 5000))
+
+# Questions about things that change (weather, prices, news...) always go to the model
+LIVE_DATA = re.compile(
+    r"\b(weather|temperature|forecast|rain|stock|share price|price|quote|market|news|today|tonight|"
+    r"tomorrow|yesterday|now|current|currently|latest|recent|this (week|month|year)|search|look up)\b",
+    re.IGNORECASE
+)
+
+
+def needs_live_data(query: str) -> bool:
+    return bool(LIVE_DATA.search(query))
+
+
+class SemanticCache:
+    """
+    Answers to standalone questions, looked up by embedding similarity.
+    Vectors live in a FAISS inner-product index over normalized embeddings (i.e. cosine
+    similarity); entries expire after `ttl` and the oldest go first once `max_entries` is hit.
+    """
+
+    def __init__(self, embeddings, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL, max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.index = None
+        self.entries = {}  # id -> (answer, created_at), in insertion order
+        self.next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.miss_seconds = 0.0
+        self.misses_timed = 0
+        self.lookup_seconds = 0.0
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray([self.embeddings.embed_query(text)], dtype='float32')
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _remove(self, ids) -> None:
+        if ids:
+            self.index.remove_ids(np.asarray(ids, dtype='int64'))
+            for entry_id in ids:
+                del self.entries[entry_id]
+
+    def lookup(self, query: str) -> Optional[str]:
+        started = time.perf_counter()
+        vector = self._embed(query)
+        with self.lock:
+            self.lookups += 1
+            try:
+                if self.index is None or not self.entries:
+                    return None
+                scores, ids = self.index.search(vector, 1)
+                entry_id = int(ids[0][0])
+                if entry_id < 0 or scores[0][0] < self.threshold:
+                    return None
+                answer, created_at = self.entries[entry_id]
+                if time.time() - created_at > self.ttl:
+                    self._remove([entry_id])
+                    return None
+                self.hits += 1
+                return answer
+            finally:
+                self.lookup_seconds += time.perf_counter() - started
+
+    def store(self, query: str, answer: str) -> None:
+        vector = self._embed(query)
+        with self.lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            now = time.time()
+            expired = [entry_id for entry_id, (_, created_at) in self.entries.items() if now - created_at > self.ttl]
+            self._remove(expired)
+            overflow = len(self.entries) - self.max_entries + 1
+            if overflow > 0:
+                self._remove(list(self.entries)[:overflow])
+
+            self.index.add_with_ids(vector, np.asarray([self.next_id], dtype='int64'))
+            self.entries[self.next_id] = (answer, now)
+            self.next_id += 1
+
+    def record_miss(self, seconds: float) -> None:
+        """Model latency of an uncached answer, used to estimate the time hits saved"""
+        with self.lock:
+            self.miss_seconds += seconds
+            self.misses_timed += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            average_miss = self.miss_seconds / self.misses_timed if self.misses_timed else 0.0
+            average_lookup = self.lookup_seconds / self.lookups if self.lookups else 0.0
+            return {
+                'entries': len(self.entries),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'average_lookup_seconds': average_lookup,
+                'latency_saved_seconds': self.hits * max(average_miss - average_lookup, 0.0)
+            }
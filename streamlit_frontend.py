@@ -1,6 +1,6 @@
 import streamlit as st
-from backend_chat_bot import workflow
-from langchain_core.messages import HumanMessage
+# Thin client: the graph runs in chat_service.py
+from chat_client import stream_chat
 import uuid
 
 st.set_page_config(page_title="Akshith's Langgraph Chatbot", page_icon="🤖")
@@ -78,9 +78,6 @@ for message in current_messages:
 user_input = st.chat_input('Type here')
 
 if user_input:
-    # Define CONFIG inside the if block where it's needed
-    CONFIG = {'configurable': {'thread_id': st.session_state['thread_id']}}
-    
     # Add user message
     st.session_state['thread_histories'][st.session_state['thread_id']].append(
         {'role': 'user', 'content': user_input}
@@ -91,12 +88,9 @@ if user_input:
     
     with st.chat_message('assistant'):
         ai_message = st.write_stream(
-            message_chunk.content 
-            for message_chunk, metadata in workflow.stream(
-                {'messages': [HumanMessage(content=user_input)]},
-                config=CONFIG,
-                stream_mode='messages'
-            )
+            event['text']
+            for event in stream_chat(st.session_state['thread_id'], user_input, graph='threads')
+            if event['type'] == 'message'
         )
         # Add assistant message
         st.session_state['thread_histories'][st.session_state['thread_id']].append(
@@ -1,7 +1,18 @@
 import streamlit as st
-from backend_using_database import workflow, get_default_threads, get_thread_messages, ingestion
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+# Thin client: the graph, models and storage live in chat_service.py
+from chat_client import (
+    stream_chat, get_thread_summaries, get_thread_messages_page,
+    submit_ingestion, get_ingestion_job, cancel_ingestion, remove_document, get_thread_documents,
+    get_semantic_cache_stats, search_chats, report_render
+)
+from langchain_core.messages import HumanMessage
+from message_utils import thread_title
+from collections import OrderedDict
+from itertools import islice
 import uuid
+import time
+
+render_started = time.perf_counter()
 
 st.set_page_config(page_title="Akshith's Langgraph Chatbot", page_icon="🤖")
 st.title("🤖 Akshith's Langgraph Chatbot")
@@ -11,54 +22,106 @@ def create_thread():
     thread_id = str(uuid.uuid4())
     return thread_id
 
+# Number of threads fetched from the catalog at a time, and shown per sidebar page
+THREAD_PAGE_SIZE = 50
+SIDEBAR_PAGE_SIZE = 20
+
 def get_thread_name(thread_id):
-    """Generate a display name for a thread based on its first message"""
-    messages = st.session_state['thread_histories'].get(thread_id, [])
-    
-    if not isinstance(messages, list) or len(messages) == 0:
-        return "New Chat"
-    
-    for msg in messages:
-        if isinstance(msg, dict) and msg.get('role') == 'user':
-            content = msg.get('content', '')
-            first_msg = str(content).strip()
-            if len(first_msg) > 40:
-                return first_msg[:40] + "..."
-            return first_msg if first_msg else "New Chat"
-    
-    return "New Chat"
+    """Display name of a thread: the catalog title, or the one set when its first message was sent"""
+    return st.session_state['thread_titles'].get(thread_id, "New Chat")
 
-# Initialize thread histories
-if 'thread_histories' not in st.session_state:
-    st.session_state['thread_histories'] = {}
-    
+def move_thread_to_top(thread_id):
+    st.session_state['thread_order'][thread_id] = None
+    st.session_state['thread_order'].move_to_end(thread_id, last=False)
+
+def load_thread_page():
+    """Append the next page of stored threads (titles only) to the sidebar list"""
     try:
-        existing_threads = get_default_threads()
-        for thread_id in existing_threads:
-            messages = get_thread_messages(thread_id)
-            st.session_state['thread_histories'][thread_id] = messages
+        summaries = get_thread_summaries(
+            limit=THREAD_PAGE_SIZE,
+            offset=st.session_state['threads_loaded']
+        )
     except Exception as e:
         st.error(f"Error loading threads: {e}")
+        return
+    for summary in summaries:
+        thread_id = summary['thread_id']
+        st.session_state['thread_titles'].setdefault(thread_id, summary['title'])
+        # Older pages go to the end; threads already listed keep their place
+        st.session_state['thread_order'].setdefault(thread_id, None)
+    st.session_state['threads_loaded'] += len(summaries)
+    st.session_state['more_threads'] = len(summaries) == THREAD_PAGE_SIZE
+
+def load_thread_history(thread_id):
+    """Fetch the newest window of a thread's messages, or the window before what is already loaded"""
+    loaded = st.session_state['thread_histories'].get(thread_id)
+    # The server's cursor, not len(loaded): messages shown here and stored there don't line up one to one
+    page = get_thread_messages_page(thread_id, before=st.session_state['history_cursor'].get(thread_id) if loaded else None)
+    st.session_state['thread_histories'][thread_id] = page['messages'] + (loaded or [])
+    st.session_state['history_has_more'][thread_id] = page['has_more']
+    st.session_state['history_cursor'][thread_id] = page['next_cursor']
+
+# Thread list: titles only, message histories are fetched when a thread is opened.
+# thread_order is an OrderedDict used as an ordered set, so moving a thread to the top is O(1).
+if 'thread_titles' not in st.session_state:
+    st.session_state['thread_titles'] = {}
+    st.session_state['thread_order'] = OrderedDict()
+    st.session_state['threads_loaded'] = 0
+    st.session_state['more_threads'] = False
+    st.session_state['sidebar_page'] = 0
+    st.session_state['thread_search_results'] = None
+    load_thread_page()
+
+if 'thread_histories' not in st.session_state:
+    st.session_state['thread_histories'] = {}
+
+if 'history_has_more' not in st.session_state:
+    st.session_state['history_has_more'] = {}
+    st.session_state['history_cursor'] = {}
+
+# Graph timings of each thread's last turn, as reported by the service
+if 'graph_timings' not in st.session_state:
+    st.session_state['graph_timings'] = {}
 
 # Initialize current thread
 if 'thread_id' not in st.session_state:
-    if st.session_state['thread_histories']:
-        st.session_state['thread_id'] = list(st.session_state['thread_histories'].keys())[-1]
+    if st.session_state['thread_order']:
+        # Threads come back most recently active first
+        st.session_state['thread_id'] = next(iter(st.session_state['thread_order']))
     else:
         st.session_state['thread_id'] = create_thread()
         st.session_state['thread_histories'][st.session_state['thread_id']] = []
+        move_thread_to_top(st.session_state['thread_id'])
+
+# Indexed documents of the open thread, as (thread id, [{'key', 'filename', 'chunks'}]) from the
+# server's catalog; None makes the next run fetch them again
+if 'thread_documents' not in st.session_state:
+    st.session_state['thread_documents'] = None
+
+def thread_documents(thread_id):
+    """Documents attached to the thread, fetched when it's opened or after they changed"""
+    cached = st.session_state['thread_documents']
+    if cached is None or cached[0] != thread_id:
+        cached = st.session_state['thread_documents'] = (thread_id, get_thread_documents(thread_id))
+    return cached[1]
+
+# Background indexing jobs (file key -> job id) and uploads that failed to index
+if 'ingestion_jobs' not in st.session_state:
+    st.session_state['ingestion_jobs'] = {}
 
-# Initialize processed files tracker per thread
-if 'processed_files' not in st.session_state:
-    st.session_state['processed_files'] = {}
+if 'failed_files' not in st.session_state:
+    st.session_state['failed_files'] = {}
 
-# Initialize thread order for proper sorting
-if 'thread_order' not in st.session_state:
-    st.session_state['thread_order'] = list(st.session_state['thread_histories'].keys())
+# Bumped to clear the uploader, so a removed document isn't indexed again on the next run
+if 'uploader_version' not in st.session_state:
+    st.session_state['uploader_version'] = 0
 
-# Ensure current thread exists in histories
+# Load the opened thread's history lazily
 if st.session_state['thread_id'] not in st.session_state['thread_histories']:
-    st.session_state['thread_histories'][st.session_state['thread_id']] = []
+    if st.session_state['thread_id'] in st.session_state['thread_titles']:
+        load_thread_history(st.session_state['thread_id'])
+    else:
+        st.session_state['thread_histories'][st.session_state['thread_id']] = []
 
 # Sidebar
 st.sidebar.title('Langgraph Chatbot')
@@ -68,9 +131,8 @@ if st.sidebar.button('➕ New Chat', use_container_width=True):
     new_thread_id = create_thread()
     st.session_state['thread_id'] = new_thread_id
     st.session_state['thread_histories'][new_thread_id] = []
-    # Add to front of thread order
-    if new_thread_id not in st.session_state['thread_order']:
-        st.session_state['thread_order'].insert(0, new_thread_id)
+    move_thread_to_top(new_thread_id)
+    st.session_state['sidebar_page'] = 0
     st.rerun()
 
 # PDF Upload Section
@@ -79,82 +141,163 @@ st.sidebar.header("📄 Upload PDF")
 upload_pdf = st.sidebar.file_uploader(
     "Upload a PDF for this chat", 
     type=["pdf"], 
-    key="pdf_uploader",
+    key=f"pdf_uploader_{st.session_state['uploader_version']}",
     help="Upload a PDF to ask questions about its content"
 )
 
 if upload_pdf:
     # Create unique file identifier for current thread
     file_key = f"{st.session_state['thread_id']}_{upload_pdf.name}_{upload_pdf.size}"
+    file_info = next(
+        (document for document in thread_documents(st.session_state['thread_id']) if document['filename'] == upload_pdf.name),
+        None
+    )
     
-    # Only process if not already processed for this thread
-    if file_key not in st.session_state['processed_files']:
+    # Only submit if not already processed, indexing or failed for this thread
+    if file_info is not None:
+        # Show info about already indexed file
+        st.sidebar.info(
+            f"📄 **{file_info['filename']}** already indexed\n\n"
+            f"✓ {file_info['chunks']} chunks available"
+        )
+    elif file_key in st.session_state['failed_files']:
+        st.sidebar.error(f"❌ {st.session_state['failed_files'][file_key]}")
+    elif file_key not in st.session_state['ingestion_jobs']:
         try:
-            with st.spinner("📚 Indexing document... This may take a moment."):
-                result = ingestion(
-                    file_bytes=upload_pdf.read(),
-                    thread_id=st.session_state['thread_id'],
-                    filename=upload_pdf.name
-                )
+            result = submit_ingestion(
+                file_bytes=upload_pdf.read(),
+                thread_id=st.session_state['thread_id'],
+                filename=upload_pdf.name
+            )
 
             if "error" in result:
+                st.session_state['failed_files'][file_key] = result['error']
                 st.sidebar.error(f"❌ {result['error']}")
+            elif "job_id" in result:
+                st.session_state['ingestion_jobs'][file_key] = result['job_id']
             else:
+                # Already in the index cache, nothing to wait for
                 st.sidebar.success(
-                    f"✅ Successfully indexed **{result['filename']}**\n\n"
+                    f"✅ Successfully indexed **{result['filename']}** (from cache)\n\n"
                     f"📄 {result['documents']} pages → {result['chunks']} chunks"
                 )
-                # Mark as processed
-                st.session_state['processed_files'][file_key] = {
-                    'filename': upload_pdf.name,
-                    'chunks': result['chunks']
-                }
+                st.session_state['thread_documents'] = None
         except Exception as e:
             st.sidebar.error(f"❌ Error processing PDF: {str(e)}")
-    else:
-        # Show info about already indexed file
-        file_info = st.session_state['processed_files'][file_key]
-        st.sidebar.info(
-            f"📄 **{file_info['filename']}** already indexed\n\n"
-            f"✓ {file_info['chunks']} chunks available"
+
+@st.fragment(run_every=1)
+def show_ingestion_jobs():
+    """Poll background indexing jobs without blocking the chat"""
+    for file_key, job_id in list(st.session_state['ingestion_jobs'].items()):
+        job = get_ingestion_job(job_id)
+
+        if job is None or job['status'] in ('done', 'error', 'cancelled'):
+            del st.session_state['ingestion_jobs'][file_key]
+            if job is None:
+                st.session_state['failed_files'][file_key] = "Indexing job was lost"
+            elif job['status'] == 'done':
+                st.session_state['thread_documents'] = None
+                st.toast(
+                    f"✅ Successfully indexed {job['filename']}: "
+                    f"{job['documents']} pages → {job['chunks']} chunks"
+                )
+            elif job['status'] == 'error':
+                st.session_state['failed_files'][file_key] = job['error']
+            else:
+                st.session_state['failed_files'][file_key] = f"Indexing of {job['filename']} was cancelled"
+            st.rerun()
+
+        st.caption(
+            f"📚 Indexing **{job['filename']}**: "
+            f"{job['documents']} pages → {job['chunks']} chunks embedded"
         )
+        if st.button('Cancel', key=f"cancel_{job_id}"):
+            cancel_ingestion(job_id)
+
+if st.session_state['ingestion_jobs']:
+    with st.sidebar:
+        show_ingestion_jobs()
 
 # Show indexed PDFs for current thread
-thread_files = [
-    info for key, info in st.session_state['processed_files'].items() 
-    if key.startswith(st.session_state['thread_id'])
-]
-if thread_files:
+documents = thread_documents(st.session_state['thread_id'])
+if documents:
     st.sidebar.markdown("---")
     st.sidebar.markdown("**📚 Indexed Documents:**")
-    for file_info in thread_files:
-        st.sidebar.markdown(f"• {file_info['filename']}")
+    for document in documents:
+        name_col, remove_col = st.sidebar.columns([5, 1])
+        name_col.markdown(f"• {document['filename']}")
+        if remove_col.button('✕', key=f"remove_{document['key']}", help="Remove from this chat"):
+            remove_document(st.session_state['thread_id'], document['key'])
+            st.session_state['thread_documents'] = None
+            st.session_state['uploader_version'] += 1
+            st.rerun()
 
 # Chat History Sidebar
 st.sidebar.markdown("---")
 st.sidebar.title('💬 Your Chats')
 
-# Update thread order to ensure current thread is at top
-if st.session_state['thread_id'] in st.session_state['thread_order']:
-    st.session_state['thread_order'].remove(st.session_state['thread_id'])
-st.session_state['thread_order'].insert(0, st.session_state['thread_id'])
+def search_threads(query):
+    """Full-text matches across all chats (best first), remembered until the next message is sent"""
+    cached = st.session_state['thread_search_results']
+    if cached is None or cached[0] != query:
+        results = search_chats(query, limit=SIDEBAR_PAGE_SIZE)
+        for result in results:
+            st.session_state['thread_titles'].setdefault(result['thread_id'], result['title'])
+        cached = (query, results)
+        st.session_state['thread_search_results'] = cached
+    return cached[1]
 
-# Display threads in order
-for thread_id in st.session_state['thread_order']:
-    # Skip if thread was deleted
-    if thread_id not in st.session_state['thread_histories']:
-        continue
-        
-    thread_name = get_thread_name(thread_id)
-    
-    if thread_id == st.session_state['thread_id']:
-        button_label = f"✅ {thread_name}"
+@st.fragment
+def show_thread_list():
+    """
+    One page of the thread list. Paging and searching only rerun this fragment, and each run
+    renders at most SIDEBAR_PAGE_SIZE rows however many threads there are.
+    """
+    query = st.text_input('Search chats', key='thread_search', placeholder='🔍 Search chats',
+                          label_visibility='collapsed').strip()
+    page = st.session_state['sidebar_page']
+    snippets = {}
+    if query:
+        results = search_threads(query)
+        thread_ids = [result['thread_id'] for result in results]
+        snippets = {result['thread_id']: result['matches'][0]['snippet'] for result in results if result['matches']}
+        if not thread_ids:
+            st.caption("No chats match.")
     else:
-        button_label = f"💬 {thread_name}"
-    
-    if st.sidebar.button(button_label, key=f"thread_{thread_id}", use_container_width=True):
-        st.session_state['thread_id'] = thread_id
-        st.rerun()
+        start = page * SIDEBAR_PAGE_SIZE
+        # Fetch catalog pages only as far as the page being shown
+        while len(st.session_state['thread_order']) < start + SIDEBAR_PAGE_SIZE + 1 and st.session_state['more_threads']:
+            load_thread_page()
+        thread_ids = list(islice(st.session_state['thread_order'], start, start + SIDEBAR_PAGE_SIZE))
+
+    for thread_id in thread_ids:
+        thread_name = get_thread_name(thread_id)
+        
+        if thread_id == st.session_state['thread_id']:
+            button_label = f"✅ {thread_name}"
+        else:
+            button_label = f"💬 {thread_name}"
+        
+        if st.button(button_label, key=f"thread_{thread_id}", use_container_width=True):
+            st.session_state['thread_id'] = thread_id
+            st.rerun(scope='app')
+        if thread_id in snippets:
+            # Matched words come back wrapped in ** and render bold
+            st.caption(snippets[thread_id])
+
+    if not query:
+        has_next = (page + 1) * SIDEBAR_PAGE_SIZE < len(st.session_state['thread_order'])
+        if page > 0 or has_next:
+            prev_col, next_col = st.columns(2)
+            if prev_col.button('◀ Newer', disabled=page == 0, use_container_width=True):
+                st.session_state['sidebar_page'] -= 1
+                st.rerun(scope='fragment')
+            if next_col.button('Older ▶', disabled=not has_next, use_container_width=True):
+                st.session_state['sidebar_page'] += 1
+                st.rerun(scope='fragment')
+
+with st.sidebar:
+    show_thread_list()
 
 # Main Chat Area
 current_messages = st.session_state['thread_histories'][st.session_state['thread_id']]
@@ -175,22 +318,86 @@ if len(current_messages) == 0:
         unsafe_allow_html=True
     )
 
+# Older messages are paged in on demand
+if st.session_state['history_has_more'].get(st.session_state['thread_id']):
+    if st.button('⬆️ Load older messages'):
+        load_thread_history(st.session_state['thread_id'])
+        st.rerun()
+
 # Display chat messages
 for message in current_messages:
     if isinstance(message, dict) and 'role' in message and 'content' in message:
         with st.chat_message(message['role']):
             st.markdown(message['content'])
 
+def stream_response(user_input, thread_id, tool_status, response_placeholder):
+    """
+    Stream assistant tokens through the chat -> tools -> chat loop.
+    Text is shown as it arrives; if the message it belongs to turns out to be a tool call,
+    that text is dropped so only the final answer stays. Tool calls show as inline status.
+    """
+    started = time.perf_counter()
+    metrics = {'first_token': None, 'total': None, 'tools': []}
+    tool_started = {}
+    message_id = None
+    tool_call_ids = set()
+    full_response = ""
+
+    with st.spinner('🤔 Thinking...'):
+        for event in stream_chat(thread_id, user_input):
+            if event['type'] == 'tool':
+                elapsed = time.perf_counter() - tool_started.pop(event['tool_call_id'], started)
+                metrics['tools'].append({'tool': event['name'], 'seconds': round(elapsed, 3)})
+                tool_status.caption(f"✅ {event['name']} finished in {elapsed:.1f}s")
+                continue
+
+            if event['type'] == 'end':
+                if event.get('timings'):
+                    st.session_state['graph_timings'][thread_id] = event['timings']
+                continue
+
+            # A new model call started, e.g. after the tools ran
+            if event['id'] != message_id:
+                message_id = event['id']
+                full_response = ""
+
+            for tool_call in event['tool_calls']:
+                if tool_call.get('name'):
+                    tool_started[tool_call.get('id')] = time.perf_counter()
+                    tool_status.caption(f"🔧 Calling {tool_call['name']}...")
+            if event['tool_calls']:
+                tool_call_ids.add(event['id'])
+            if event['id'] in tool_call_ids:
+                # Whatever this message says is a preamble to a tool call, not the answer
+                full_response = ""
+                response_placeholder.empty()
+                continue
+
+            text = event['text']
+            if text:
+                if metrics['first_token'] is None:
+                    metrics['first_token'] = round(time.perf_counter() - started, 3)
+                full_response += text
+                response_placeholder.markdown(full_response + "▌")
+
+    metrics['total'] = round(time.perf_counter() - started, 3)
+    st.session_state['debug_metrics'] = metrics
+    return full_response
+
 # Chat input
 user_input = st.chat_input('Type your message here...')
 
 if user_input:
-    CONFIG = {'configurable': {'thread_id': st.session_state['thread_id']}}
-    
     # Add user message to history
     st.session_state['thread_histories'][st.session_state['thread_id']].append(
         {'role': 'user', 'content': user_input}
     )
+
+    # Title is fixed by the first message; the thread becomes the most recently active one
+    if st.session_state['thread_id'] not in st.session_state['thread_titles']:
+        st.session_state['thread_titles'][st.session_state['thread_id']] = thread_title([HumanMessage(content=user_input)])
+    move_thread_to_top(st.session_state['thread_id'])
+    st.session_state['thread_search_results'] = None
     
     # Display user message
     with st.chat_message('user'):
@@ -198,45 +405,12 @@ if user_input:
     
     # Generate and display assistant response
     with st.chat_message('assistant'):
+        tool_status = st.empty()
         response_placeholder = st.empty()
         full_response = ""
         
         try:
-            # Show thinking indicator
-            with st.spinner('🤔 Thinking...'):
-                # Stream workflow events
-                final_state = None
-                for event in workflow.stream(
-                    {'messages': [HumanMessage(content=user_input)]},
-                    config=CONFIG,
-                    stream_mode='values'
-                ):
-                    final_state = event
-            
-            # Extract response from final state
-            if final_state and 'messages' in final_state:
-                messages = final_state['messages']
-                
-                # Look for the last AI message with content
-                for message in reversed(messages):
-                    if isinstance(message, AIMessage):
-                        # Handle string content
-                        if isinstance(message.content, str) and message.content.strip():
-                            full_response = message.content
-                            break
-                        # Handle list content (structured output)
-                        elif isinstance(message.content, list):
-                            text_parts = []
-                            for block in message.content:
-                                if isinstance(block, dict) and block.get('type') == 'text':
-                                    text_parts.append(block.get('text', ''))
-                                elif hasattr(block, 'text'):
-                                    text_parts.append(block.text)
-                                elif isinstance(block, str):
-                                    text_parts.append(block)
-                            full_response = ''.join(text_parts)
-                            if full_response.strip():
-                                break
+            full_response = stream_response(user_input, st.session_state['thread_id'], tool_status, response_placeholder)
             
             # Display response or error
             if full_response and full_response.strip():
@@ -254,4 +428,47 @@ if user_input:
             response_placeholder.error(error_msg)
             # Log detailed error for debugging
             st.error(f"Detailed error: {type(e).__name__}: {str(e)}")
-            # Don't save error messages to history
\ No newline at end of file
+            # Don't save error messages to history
+
+# Debug panel with timings of the last turn
+st.sidebar.markdown("---")
+if st.sidebar.toggle('🐞 Debug panel', key='show_debug'):
+    metrics = st.session_state.get('debug_metrics')
+    with st.sidebar.expander('Last turn', expanded=True):
+        if not metrics:
+            st.caption("Send a message to see timings.")
+        else:
+            first_token = metrics['first_token']
+            st.metric('Time to first token', f"{first_token:.2f}s" if first_token is not None else "–")
+            st.metric('Total turn time', f"{metrics['total']:.2f}s")
+            for tool_run in metrics['tools']:
+                st.caption(f"🔧 {tool_run['tool']}: {tool_run['seconds']:.2f}s")
+    cache_stats = get_semantic_cache_stats()
+    if cache_stats:
+        with st.sidebar.expander('Semantic cache'):
+            st.metric('Hit rate', f"{cache_stats['hit_rate']:.0%}")
+            st.caption(f"{cache_stats['hits']} hits / {cache_stats['lookups']} lookups, {cache_stats['entries']} entries")
+            st.caption(f"≈ {cache_stats['latency_saved_seconds']:.1f}s of model time saved")
+    # Only sent when the service runs with GRAPH_METRICS=1
+    if st.session_state['graph_timings']:
+        with st.sidebar.expander('Graph timings'):
+            turn = st.session_state['graph_timings'].get(st.session_state['thread_id'])
+            if not turn:
+                st.caption("No graph run recorded for this chat yet.")
+            else:
+                st.metric('Graph run', f"{turn['seconds']:.2f}s")
+                for node in turn['nodes']:
+                    st.caption(f"⏱️ {node['node']}: {node['seconds']:.3f}s")
+                for call in turn['llm']:
+                    st.caption(f"🧠 {call['model']}: {call['seconds']:.2f}s, {call['input_tokens']} in / {call['output_tokens']} out tokens")
+                for call in turn.get('gateway', []):
+                    notes = ''.join([', hedged' if call['hedged'] else '', ', fallback' if call['fallback'] else ''])
+                    st.caption(f"🚦 {call['provider']}: queued {call['queue_seconds']:.2f}s{notes}")
+                for tool_run in turn['tools']:
+                    st.caption(f"🔧 {tool_run['tool']}: {tool_run['seconds']:.3f}s")
+                for search in turn['retriever']:
+                    st.caption(f"📚 retrieval: {search['seconds']:.3f}s, {search['results']} chunks")
+                checkpoint_seconds = sum(op['seconds'] for op in turn['checkpoint'])
+                st.caption(f"💾 {len(turn['checkpoint'])} checkpoint calls: {checkpoint_seconds:.3f}s")
+
+report_render('database', time.perf_counter() - render_started)
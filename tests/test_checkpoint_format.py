@@ -0,0 +1,169 @@
+"""
+checkpoint_format.migrate() on databases written in the stock SqliteSaver format: every
+checkpoint and pending write reads back the same through get_tuple / list after the rewrite,
+delta chains restart at keyframes, and running it again changes nothing.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import sqlite3
+from typing import TypedDict, Annotated
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.graph import StateGraph
+from langgraph.constants import START, END
+from langgraph.graph.message import add_messages
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from checkpoint_format import decode_checkpoint, is_packed, migrate
+from checkpoint_store import ThreadCatalogSaver
+
+# Small, so a thread of a few turns crosses several keyframes
+KEYFRAME_INTERVAL = 4
+
+
+class State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+
+
+def build_graph(saver):
+    """chat -> tool -> chat per turn, like the chatbot's tool loop, with deterministic content"""
+    calls = iter(range(1_000_000))
+
+    def chat(state):
+        last = state['messages'][-1]
+        if isinstance(last, HumanMessage):
+            call_id = f"call-{next(calls)}"
+            return {'messages': [AIMessage(content='', tool_calls=[{'name': 'lookup', 'args': {'q': last.content}, 'id': call_id}])]}
+        return {'messages': [AIMessage(content=f"answer to {state['messages'][-3].content}")]}
+
+    def tool(state):
+        call = state['messages'][-1].tool_calls[0]
+        return {'messages': [ToolMessage(content=f"result for {call['args']['q']}", tool_call_id=call['id'])]}
+
+    graph = StateGraph(State)
+    graph.add_node('chat', chat)
+    graph.add_node('tool', tool)
+    graph.add_edge(START, 'chat')
+    graph.add_conditional_edges('chat', lambda state: 'tool' if state['messages'][-1].tool_calls else END)
+    graph.add_edge('tool', 'chat')
+    return graph.compile(checkpointer=saver)
+
+
+def config(thread_id: str) -> dict:
+    return {'configurable': {'thread_id': thread_id}}
+
+
+def run_turns(saver, turns: dict, first: int = 0) -> None:
+    workflow = build_graph(saver)
+    for thread_id, count in turns.items():
+        for turn in range(first, first + count):
+            workflow.invoke({'messages': [HumanMessage(content=f"{thread_id} question {turn}")]}, config(thread_id))
+
+
+def connect(db_path) -> sqlite3.Connection:
+    return sqlite3.connect(db_path, check_same_thread=False)
+
+
+def snapshot(saver, thread_ids) -> dict:
+    """What get_tuple (latest and each checkpoint by id) and list return for the threads"""
+    def state(checkpoint_tuple):
+        return (checkpoint_tuple.config, checkpoint_tuple.checkpoint, checkpoint_tuple.metadata,
+                checkpoint_tuple.parent_config, checkpoint_tuple.pending_writes)
+
+    states = {}
+    for thread_id in thread_ids:
+        history = list(saver.list(config(thread_id)))
+        states[thread_id] = {
+            'latest': state(saver.get_tuple(config(thread_id))),
+            'list': [state(checkpoint_tuple) for checkpoint_tuple in history],
+            'by_id': [state(saver.get_tuple(checkpoint_tuple.config)) for checkpoint_tuple in history]
+        }
+    return states
+
+
+def rows(db_path) -> dict:
+    conn = connect(db_path)
+    try:
+        return {
+            'checkpoints': conn.execute("SELECT * FROM checkpoints ORDER BY thread_id, checkpoint_ns, checkpoint_id").fetchall(),
+            'writes': conn.execute("SELECT * FROM writes ORDER BY thread_id, checkpoint_ns, checkpoint_id, task_id, idx").fetchall(),
+            'messages': conn.execute("SELECT * FROM messages ORDER BY hash").fetchall()
+        }
+    finally:
+        conn.close()
+
+
+def headers(db_path, thread_id: str) -> list:
+    """Delta headers of the thread's root checkpoints; rows without message lists have none"""
+    conn = connect(db_path)
+    try:
+        found = [
+            decode_checkpoint(type_, blob)[0]
+            for type_, blob in conn.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' ORDER BY checkpoint_id",
+                (thread_id,)
+            )
+        ]
+        return [header for header in found if header is not None]
+    finally:
+        conn.close()
+
+
+def test_migrate_keeps_every_checkpoint(tmp_path):
+    db_path = tmp_path / 'chat.db'
+    conn = connect(db_path)
+    run_turns(SqliteSaver(conn), {'short': 1, 'long': 6})
+    before = snapshot(SqliteSaver(conn), ['short', 'long'])
+    total = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+    conn.close()
+
+    report = migrate(str(db_path), keyframe_interval=KEYFRAME_INTERVAL)
+
+    assert report['checkpoints_converted'] == total
+    assert report['writes_converted'] > 0
+    assert all(is_packed(row[4]) for row in rows(db_path)['checkpoints'])
+    # The long thread's chain restarts at a keyframe every KEYFRAME_INTERVAL checkpoints
+    depths = [header['depth'] for header in headers(db_path, 'long')]
+    assert depths.count(0) >= 3
+    assert max(depths) == KEYFRAME_INTERVAL - 1
+    assert all(header['base'] is not None for header in headers(db_path, 'long') if header['depth'] > 0)
+
+    assert snapshot(ThreadCatalogSaver(connect(db_path)), ['short', 'long']) == before
+
+
+def test_migrate_twice_is_a_no_op(tmp_path):
+    db_path = tmp_path / 'chat.db'
+    conn = connect(db_path)
+    run_turns(SqliteSaver(conn), {'a': 3, 'b': 2})
+    conn.close()
+
+    migrate(str(db_path), keyframe_interval=KEYFRAME_INTERVAL)
+    migrated = rows(db_path)
+    report = migrate(str(db_path), keyframe_interval=KEYFRAME_INTERVAL)
+
+    assert report['checkpoints_converted'] == 0
+    assert report['writes_converted'] == 0
+    assert rows(db_path) == migrated
+
+
+def test_migrate_continues_chains_from_packed_checkpoints(tmp_path):
+    # CHECKPOINT_FORMAT=plain after a migration: plain rows whose parents are already packed
+    db_path = tmp_path / 'chat.db'
+    conn = connect(db_path)
+    run_turns(SqliteSaver(conn), {'thread': 3})
+    conn.close()
+    migrate(str(db_path), keyframe_interval=KEYFRAME_INTERVAL)
+
+    saver = ThreadCatalogSaver(connect(db_path), packed=False)
+    run_turns(saver, {'thread': 3}, first=3)
+    before = snapshot(saver, ['thread'])
+    plain = sum(not is_packed(row[4]) for row in rows(db_path)['checkpoints'])
+
+    report = migrate(str(db_path), keyframe_interval=KEYFRAME_INTERVAL)
+
+    assert plain > 0
+    assert report['checkpoints_converted'] == plain
+    assert snapshot(ThreadCatalogSaver(connect(db_path)), ['thread']) == before
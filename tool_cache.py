@@ -0,0 +1,166 @@
+from concurrent.futures import Future
+from typing import Callable, Optional
+import threading
+import sqlite3
+import asyncio
+import time
+import json
+import os
+
+# Optional SQLite file that keeps cached tool responses across restarts (disabled when empty)
+TOOL_CACHE_DB = os.getenv('TOOL_CACHE_DB', '')
+
+
+def normalize_symbol(symbol: str) -> str:
+    return symbol.strip().upper()
+
+
+def normalize_city(city: str) -> str:
+    return ' '.join(city.replace(',', ' ').split()).casefold()
+
+
+class ToolCache:
+    """
+    TTL cache for one tool's upstream responses.
+    Concurrent lookups of the same key share a single upstream call (both across threads
+    and across tasks of an event loop). Errors are never cached.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024, db_path: str = TOOL_CACHE_DB,
+                 cacheable: Optional[Callable[[dict], bool]] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable or (lambda value: 'error' not in value)
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (expires_at, value)
+        self.in_flight = {}  # key -> concurrent Future of the running sync fetch
+        self.async_in_flight = {}  # (event loop, key) -> asyncio Future of the running async fetch
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tool_cache (
+                    tool TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (tool, key)
+                )
+                """
+            )
+            self.conn.commit()
+
+    def _lookup(self, key: str):
+        """Fresh cached value or None; must hold self.lock"""
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is None and self.conn is not None:
+            row = self.conn.execute(
+                "SELECT expires_at, value FROM tool_cache WHERE tool = ? AND key = ?",
+                (self.name, key)
+            ).fetchone()
+            if row:
+                entry = (row[0], json.loads(row[1]))
+                self.entries[key] = entry
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self.entries[key]
+            return None
+        return entry[1]
+
+    def _store(self, key: str, value: dict) -> None:
+        if not self.cacheable(value):
+            return
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                # Oldest insertion goes first
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (expires_at, value)
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (tool, key, expires_at, value) VALUES (?, ?, ?, ?)",
+                    (self.name, key, expires_at, json.dumps(value))
+                )
+                self.conn.commit()
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], dict]) -> dict:
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self.in_flight[key] = Future()
+        if future is not None:
+            return future.result()
+
+        future = self.in_flight[key]
+        try:
+            value = fetch()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    async def aget_or_fetch(self, key: str, fetch) -> dict:
+        """Async variant: `fetch` is a coroutine function"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            future = self.async_in_flight.get((loop, key))
+            if future is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self.async_in_flight[(loop, key)] = loop.create_future()
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self.async_in_flight[(loop, key)]
+        try:
+            value = await fetch()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            with self.lock:
+                self.async_in_flight.pop((loop, key), None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'tool': self.name,
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
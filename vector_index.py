@@ -0,0 +1,103 @@
+from typing import Optional
+import numpy as np
+import faiss
+import math
+import os
+
+# auto: flat until IVF_MIN_CHUNKS chunks, IVF after that; flat / ivf force one layout
+VECTOR_INDEX_MODE = os.getenv('VECTOR_INDEX_MODE', 'auto')
+
+# none: float32 vectors; sq8: 1 byte per dimension; pq: 1 byte per 4 dimensions (IVF only,
+# smaller indexes fall back to sq8 because PQ codebooks need thousands of training vectors)
+VECTOR_INDEX_QUANTIZATION = os.getenv('VECTOR_INDEX_QUANTIZATION', 'none')
+
+IVF_MIN_CHUNKS = int(os.getenv('IVF_MIN_CHUNKS', 20000))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 16))
+
+# Filtered IVF searches over at most this many allowed vectors compare the query with each of
+# them instead: a thread's chunks sit in a few lists, and the nprobe lists nearest the query
+# often hold none of them (empty results for questions off the document's topics)
+IVF_EXACT_FILTER_MAX = int(os.getenv('IVF_EXACT_FILTER_MAX', 5000))
+
+# Dimensions per PQ sub-quantizer (384 dims -> 96 one-byte codes); 8 halves the size again
+# but loses a lot of recall on MiniLM vectors, see benchmarks/bench_index.py
+PQ_SUBVECTOR_DIMS = int(os.getenv('PQ_SUBVECTOR_DIMS', 4))
+
+# Trained indexes are retrained once they hold this many times their training set
+RETRAIN_GROWTH = 4
+
+
+def index_spec(count: int, dimension: int, mode: str = VECTOR_INDEX_MODE,
+               quantization: str = VECTOR_INDEX_QUANTIZATION) -> str:
+    """FAISS factory string for an index that is about to hold `count` vectors"""
+    use_ivf = mode == 'ivf' or (mode == 'auto' and count >= IVF_MIN_CHUNKS)
+    # k-means wants ~39 training points per list
+    nlist = min(int(4 * math.sqrt(count)), count // 39)
+    if not use_ivf or nlist < 2:
+        codec = {'sq8': 'SQ8', 'pq': 'SQ8'}.get(quantization, 'Flat')
+        return f"IDMap2,{codec}"
+
+    if quantization == 'pq' and dimension % PQ_SUBVECTOR_DIMS == 0 and count >= 256 * 39:
+        codec = f"PQ{dimension // PQ_SUBVECTOR_DIMS}"
+    elif quantization in ('sq8', 'pq'):
+        codec = 'SQ8'
+    else:
+        codec = 'Flat'
+    return f"IVF{nlist},{codec}"
+
+
+def create_index(vectors: np.ndarray, ids: np.ndarray, spec: str):
+    """Build, train and fill an index; reconstruct() and remove_ids() work on every layout"""
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        index.train(vectors)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        ivf.nprobe = IVF_NPROBE
+    if len(ids):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def needs_rebuild(spec: Optional[str], trained_on: int, count: int, dimension: int) -> bool:
+    """The layout for `count` vectors differs from `spec`, or its training set has gone stale"""
+    if spec is None:
+        return True
+    layout, codec = spec.split(',')
+    wanted_layout, wanted_codec = index_spec(count, dimension).split(',')
+    # e.g. crossed IVF_MIN_CHUNKS, or grew enough for PQ codebooks
+    if layout.startswith('IVF') != wanted_layout.startswith('IVF') or codec != wanted_codec:
+        return True
+    # IVF centroids and quantizer ranges were fit to the vectors present at build time
+    trained = layout.startswith('IVF') or codec != 'Flat'
+    return trained and count >= RETRAIN_GROWTH * max(trained_on, 1)
+
+
+def search_params(index, selector, nprobe: int = IVF_NPROBE):
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_allowed(index, vector: np.ndarray, allowed: np.ndarray, k: int, nprobe: int = IVF_NPROBE) -> list:
+    """Ids of the (up to) k nearest vectors to `vector` (shape 1 x d) among the `allowed` ids"""
+    k = min(k, len(allowed))
+    if k == 0:
+        return []
+    if faiss.try_extract_index_ivf(index) is None or len(allowed) > IVF_EXACT_FILTER_MAX:
+        _, ids = index.search(vector, k, params=search_params(index, faiss.IDSelectorBatch(allowed), nprobe))
+        return [int(chunk_id) for chunk_id in ids[0] if chunk_id >= 0]
+    # Stored codes decoded back: exact for IVF,Flat, close for SQ8, approximate for PQ
+    stored = index.reconstruct_batch(allowed)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = -(stored @ vector[0])
+    else:
+        scores = ((stored - vector[0]) ** 2).sum(axis=1)
+    nearest = np.argpartition(scores, k - 1)[:k]
+    return [int(allowed[i]) for i in nearest[np.argsort(scores[nearest])]]
+
+
+def bytes_per_vector(index) -> int:
+    """Size of one stored code (vectors only, excluding id maps and inverted-list overhead)"""
+    return index.sa_code_size()
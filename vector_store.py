@@ -0,0 +1,353 @@
+from langchain_core.documents import Document
+from collections import defaultdict, OrderedDict
+from index_cache import content_hash, index_path, load_index
+from vector_index import index_spec, create_index, needs_rebuild, search_allowed, bytes_per_vector
+from hybrid_search import BM25Index, reciprocal_rank_fusion
+from typing import Optional
+import numpy as np
+import threading
+import time
+import os
+
+# Chunks returned per rag query
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', 3))
+
+# Candidates each retriever contributes before fusion / reranking
+RAG_CANDIDATES = int(os.getenv('RAG_CANDIDATES', 20))
+
+# hybrid: BM25 and vector results fused; vector or bm25 use one retriever only
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+
+# Memory budget for loaded documents (vector codes plus chunk text, bytes) and idle time
+# before a document is unloaded; unloaded documents come back from the index cache
+RETRIEVER_STORE_MAX_BYTES = int(os.getenv('RETRIEVER_STORE_MAX_BYTES', 512 * 1024 * 1024))
+RETRIEVER_STORE_TTL = float(os.getenv('RETRIEVER_STORE_TTL', 3600))
+
+
+class SharedVectorStore:
+    """
+    One FAISS index for every uploaded document of every thread.
+    Chunks are stored once per distinct text (content hash) and reference-counted by the
+    documents that contain them; documents are attached to threads, and searches are
+    restricted to the chunks of the asking thread's documents. Memory grows with unique
+    content, not with the number of uploads. A BM25 index over the same chunks catches exact
+    terms (part numbers, names) that embeddings blur; results of both are fused and can be
+    reranked by an optional cross-encoder.
+
+    Loaded documents are kept within `max_bytes`: least recently searched documents (and any
+    idle for longer than `ttl`) are unloaded, keeping only their thread attachments, and are
+    reloaded from the on-disk index cache the next time one of their threads searches.
+    """
+
+    def __init__(self, embeddings, k: int = RAG_TOP_K, reranker=None, mode: str = RETRIEVAL_MODE,
+                 max_bytes: int = RETRIEVER_STORE_MAX_BYTES, ttl: Optional[float] = RETRIEVER_STORE_TTL):
+        self.embeddings = embeddings
+        self.k = k
+        self.reranker = reranker
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bm25 = BM25Index()
+        self.lock = threading.RLock()
+        # ids are chunk ids; the layout (flat / IVF, quantization) follows the chunk count
+        self.index = None
+        self.spec = None
+        self.trained_on = 0
+        # Changes made while a rebuild is training, replayed onto the new index
+        self.rebuild_log = None
+        self.next_id = 0
+        # chunk id -> Document; content hash -> chunk id; chunk id -> document keys using it
+        self.chunks = {}
+        self.chunk_ids = {}
+        self.refs = defaultdict(set)
+        # document key -> {'filename', 'chunk_ids', 'threads'}; thread id -> document keys
+        self.documents = {}
+        self.threads = defaultdict(set)
+        # Loaded document keys, least recently used first -> last use; chunk text size in bytes
+        self.last_used = OrderedDict()
+        self.text_bytes = 0
+        # Unloaded document key -> {'filename', 'chunks', 'threads'}
+        self.spilled = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def has_document(self, key: str) -> bool:
+        with self.lock:
+            return key in self.documents or key in self.spilled
+
+    def add_document(self, thread_id: str, key: str, vectorstore=None, filename: Optional[str] = None) -> int:
+        """
+        Attach the document `key` to a thread. The first time a document is seen its chunks
+        are copied out of `vectorstore` (its own FAISS index, usually from the index cache),
+        skipping chunks already stored for another document. Returns the number of new chunks.
+        """
+        with self.lock:
+            added = 0
+            if key in self.spilled and vectorstore is None:
+                # Stays unloaded until one of its threads searches
+                document = self.spilled[key]
+            else:
+                if key in self.spilled:
+                    added = self._reload(key, vectorstore)
+                elif key not in self.documents:
+                    if vectorstore is None:
+                        raise ValueError(f"Document {key} is not indexed yet")
+                    added = self._add_chunks(key, vectorstore)
+                    self.documents[key]['filename'] = filename
+                document = self.documents[key]
+                self._touch([key])
+            if filename and not document['filename']:
+                document['filename'] = filename
+            document['threads'].add(thread_id)
+            self.threads[thread_id].add(key)
+            if added:
+                self._evict(keep={key})
+            return added
+
+    def _add_chunks(self, key: str, vectorstore) -> int:
+        source = vectorstore.index
+        chunk_ids = []
+        new_ids = []
+        new_vectors = []
+        for position in range(source.ntotal):
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+            digest = content_hash(doc.page_content)
+            chunk_id = self.chunk_ids.get(digest)
+            if chunk_id is None:
+                chunk_id = self.next_id
+                self.next_id += 1
+                self.chunk_ids[digest] = chunk_id
+                self.chunks[chunk_id] = Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+                self.text_bytes += len(doc.page_content.encode('utf-8'))
+                self.bm25.add(chunk_id, doc.page_content)
+                new_ids.append(chunk_id)
+                new_vectors.append(source.reconstruct(position))
+            self.refs[chunk_id].add(key)
+            chunk_ids.append(chunk_id)
+        if new_ids:
+            self._add_vectors(np.asarray(new_vectors, dtype='float32'), np.asarray(new_ids, dtype='int64'))
+        self.documents[key] = {'filename': None, 'chunk_ids': chunk_ids, 'threads': set()}
+        return len(new_ids)
+
+    def _add_vectors(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Add to the current index; start a rebuild when the chunk count calls for another layout"""
+        count = len(self.chunks)
+        if self.index is None:
+            self.spec = index_spec(count, vectors.shape[1])
+            self.index = create_index(vectors, ids, self.spec)
+            self.trained_on = count
+            return
+        self.index.add_with_ids(vectors, ids)
+        if self.rebuild_log is not None:
+            self.rebuild_log.append(('add', vectors, ids))
+        elif needs_rebuild(self.spec, self.trained_on, count, vectors.shape[1]):
+            self._start_rebuild()
+
+    def _start_rebuild(self) -> None:
+        """
+        Train the new layout on a snapshot in the background (IVF / PQ training can take minutes)
+        while searches keep using the current index; changes made meanwhile are replayed on swap.
+        """
+        ids = np.fromiter(self.chunks, dtype='int64', count=len(self.chunks))
+        # Stored vectors are decoded back out: exact for flat, close for SQ8, approximate for PQ
+        vectors = np.vstack([self.index.reconstruct(int(chunk_id)) for chunk_id in ids])
+        spec = index_spec(len(ids), vectors.shape[1])
+        self.rebuild_log = []
+        threading.Thread(target=self._rebuild, args=(vectors, ids, spec), name='vector-index-rebuild', daemon=True).start()
+
+    def _rebuild(self, vectors: np.ndarray, ids: np.ndarray, spec: str) -> None:
+        try:
+            index = create_index(vectors, ids, spec)
+        except Exception as e:
+            print(f"Error rebuilding vector index as {spec}: {e}")
+            with self.lock:
+                self.rebuild_log = None
+            return
+        with self.lock:
+            for change in self.rebuild_log:
+                if change[0] == 'add':
+                    index.add_with_ids(change[1], change[2])
+                else:
+                    index.remove_ids(change[1])
+            self.index = index
+            self.spec = spec
+            self.trained_on = len(ids)
+            self.rebuild_log = None
+
+    def remove_document(self, thread_id: str, key: str) -> None:
+        """Detach a document from a thread; its chunks go once no thread uses the document"""
+        with self.lock:
+            self.threads[thread_id].discard(key)
+            if not self.threads[thread_id]:
+                del self.threads[thread_id]
+            document = self.documents.get(key) or self.spilled.get(key)
+            if document is None:
+                return
+            document['threads'].discard(thread_id)
+            if document['threads']:
+                return
+            if key in self.spilled:
+                del self.spilled[key]
+            else:
+                self._unload(key)
+
+    def _unload(self, key: str) -> None:
+        """Drop a loaded document; chunks no other loaded document uses leave the index"""
+        document = self.documents.pop(key)
+        self.last_used.pop(key, None)
+        orphans = []
+        for chunk_id in set(document['chunk_ids']):
+            self.refs[chunk_id].discard(key)
+            if not self.refs[chunk_id]:
+                del self.refs[chunk_id]
+                doc = self.chunks.pop(chunk_id)
+                del self.chunk_ids[content_hash(doc.page_content)]
+                self.text_bytes -= len(doc.page_content.encode('utf-8'))
+                self.bm25.remove(chunk_id, doc.page_content)
+                orphans.append(chunk_id)
+        if orphans:
+            orphans = np.asarray(orphans, dtype='int64')
+            self.index.remove_ids(orphans)
+            if self.rebuild_log is not None:
+                self.rebuild_log.append(('remove', orphans))
+
+    def _reload(self, key: str, vectorstore=None) -> int:
+        """Load an unloaded document back, from `vectorstore` or the index cache"""
+        spilled = self.spilled.pop(key)
+        if vectorstore is None:
+            cached = load_index(key, self.embeddings)
+            if not cached:
+                print(f"Error reloading document {key}: not in the index cache")
+                for thread_id in spilled['threads']:
+                    self.threads[thread_id].discard(key)
+                    if not self.threads[thread_id]:
+                        del self.threads[thread_id]
+                return 0
+            vectorstore = cached[0]
+        added = self._add_chunks(key, vectorstore)
+        self.documents[key]['filename'] = spilled['filename']
+        self.documents[key]['threads'] = spilled['threads']
+        self.reloads += 1
+        return added
+
+    def _touch(self, keys) -> None:
+        now = time.monotonic()
+        for key in keys:
+            self.last_used[key] = now
+            self.last_used.move_to_end(key)
+
+    def _bytes(self) -> int:
+        code_size = bytes_per_vector(self.index) if self.index is not None else 0
+        return len(self.chunks) * code_size + self.text_bytes
+
+    def _evict(self, keep: set) -> None:
+        """Unload idle documents, then least recently used ones while over budget (never `keep`)"""
+        deadline = time.monotonic() - self.ttl if self.ttl is not None else None
+        for key, used in list(self.last_used.items()):
+            expired = deadline is not None and used < deadline
+            if not expired and self._bytes() <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            # Only documents the index cache can give back
+            if not os.path.isdir(index_path(key)):
+                continue
+            document = self.documents[key]
+            self.spilled[key] = {
+                'filename': document['filename'],
+                'chunks': len(document['chunk_ids']),
+                'threads': document['threads']
+            }
+            self._unload(key)
+            self.evictions += 1
+
+    def remove_thread(self, thread_id: str) -> None:
+        with self.lock:
+            for key in list(self.threads.get(thread_id, ())):
+                self.remove_document(thread_id, key)
+
+    def thread_documents(self, thread_id: str) -> list:
+        with self.lock:
+            documents = []
+            for key in self.threads.get(thread_id, ()):
+                if key in self.documents:
+                    chunks = len(self.documents[key]['chunk_ids'])
+                    documents.append({'key': key, 'filename': self.documents[key]['filename'], 'chunks': chunks})
+                else:
+                    documents.append({'key': key, 'filename': self.spilled[key]['filename'], 'chunks': self.spilled[key]['chunks']})
+            return documents
+
+    def __contains__(self, thread_id: str) -> bool:
+        with self.lock:
+            return bool(self.threads.get(thread_id))
+
+    def search(self, thread_id: str, query: str, k: Optional[int] = None, mode: Optional[str] = None,
+               rerank: Optional[bool] = None) -> list:
+        """Best chunks among the thread's documents, each tagged with the file(s) it came from"""
+        k = k or self.k
+        mode = mode or self.mode
+        vector = np.asarray([self.embeddings.embed_query(query)], dtype='float32') if mode != 'bm25' else None
+        with self.lock:
+            keys = self.threads.get(thread_id)
+            if not keys:
+                return []
+            unloaded = [key for key in keys if key in self.spilled]
+            if unloaded:
+                self.misses += 1
+                for key in unloaded:
+                    self._reload(key)
+                keys = self.threads.get(thread_id)
+            else:
+                self.hits += 1
+            if not keys or self.index is None:
+                return []
+            self._touch(keys)
+            self._evict(keep=keys)
+            allowed = {chunk_id for key in keys for chunk_id in self.documents[key]['chunk_ids']}
+            candidates = max(k, RAG_CANDIDATES)
+
+            rankings = []
+            if mode != 'bm25':
+                allowed_ids = np.fromiter(allowed, dtype='int64', count=len(allowed))
+                rankings.append(search_allowed(self.index, vector, allowed_ids, candidates))
+            if mode != 'vector':
+                rankings.append([chunk_id for chunk_id, _ in self.bm25.search(query, candidates, allowed)])
+            fused = reciprocal_rank_fusion(*rankings)[:candidates]
+
+            results = []
+            for chunk_id in fused:
+                doc = self.chunks[chunk_id]
+                filenames = sorted({
+                    self.documents[key]['filename'] or key[:12]
+                    for key in self.refs[chunk_id] if key in keys
+                })
+                results.append(Document(page_content=doc.page_content, metadata={**doc.metadata, 'files': filenames}))
+
+        # Reranking is CPU bound, keep it outside the lock
+        if self.reranker is not None and rerank is not False and len(results) > k:
+            try:
+                results = self.reranker.rerank(query, results, lambda doc: doc.page_content)
+            except Exception as e:
+                print(f"Error reranking rag results: {e}")
+        return results[:k]
+
+    def stats(self) -> dict:
+        with self.lock:
+            references = sum(len(document['chunk_ids']) for document in self.documents.values())
+            return {
+                'index': self.spec,
+                'threads': len(self.threads),
+                'documents': len(self.documents),
+                'spilled': len(self.spilled),
+                'chunks': len(self.chunks),
+                'chunk_references': references,
+                'dedupe_ratio': references / len(self.chunks) if self.chunks else 1.0,
+                'bytes': self._bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'evictions': self.evictions
+            }